@@ -0,0 +1,207 @@
+"""Fleet-wide aggregates: one value per group of hosts (provider, datacenter)
+
+Hosts are split into chunks of HOSTS_PER_TASK. Each chunk's series are
+read from MongoDB and reduced in a process pool to one Sketch per group,
+and the chunks run concurrently. The per-chunk sketches are merged at the
+end, so no step ever holds every host's values at once.
+
+A Sketch keeps an exact count, sum, min and max, plus log-spaced bins
+(DDSketch) that answer any quantile within ALPHA relative error. Bins
+merge by adding their counts, which a plain list of percentiles cannot do.
+"""
+import asyncio
+import math
+import multiprocessing
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tsstore import bucket_column
+
+ALPHA = 0.01  # relative error of quantiles
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+LOG_GAMMA = math.log(GAMMA)
+TINY = 1e-9  # values at or below count as zero; metrics are never negative
+
+HOSTS_PER_TASK = 64
+
+AGGREGATE_FUNCS = ("avg", "min", "max")  # and pNN, e.g. p95 or p99.9
+PERCENTILE_RE = re.compile(r"^p(\d{1,2}(?:\.\d+)?)$")
+
+
+def _collapse(keys: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted unique bin keys and their summed counts"""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts, minlength=len(keys))
+
+
+class Sketch:
+    """Mergeable summary of a set of (weighted) values"""
+
+    __slots__ = ("n", "total", "low", "high", "zeros", "keys", "counts")
+
+    def __init__(self, n: float = 0.0, total: float = 0.0, low: float = math.inf, high: float = -math.inf,
+                 zeros: float = 0.0, keys: Optional[np.ndarray] = None, counts: Optional[np.ndarray] = None):
+        self.n = n
+        self.total = total
+        self.low = low
+        self.high = high
+        self.zeros = zeros
+        self.keys = np.empty(0, dtype=np.int64) if keys is None else keys
+        self.counts = np.empty(0) if counts is None else counts
+
+    @classmethod
+    def of(cls, values: np.ndarray, weights: Optional[np.ndarray] = None,
+           low: Optional[float] = None, high: Optional[float] = None) -> "Sketch":
+        """Sketch of ``values``; NaN are skipped. ``low``/``high`` override the
+        extremes when the values are averages of samples (rollups)."""
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64)
+        keep = np.isfinite(values) & (weights > 0)
+        values, weights = values[keep], weights[keep]
+        if not len(values):
+            return cls()
+        positive = values > TINY
+        keys, counts = _collapse(np.ceil(np.log(values[positive]) / LOG_GAMMA).astype(np.int64), weights[positive])
+        return cls(
+            float(weights.sum()), float(values @ weights),
+            float(values.min()) if low is None else low, float(values.max()) if high is None else high,
+            float(weights[~positive].sum()), keys, counts,
+        )
+
+    @classmethod
+    def merge(cls, sketches: List["Sketch"]) -> "Sketch":
+        sketches = [sketch for sketch in sketches if sketch.n]
+        if len(sketches) < 2:
+            return sketches[0] if sketches else cls()
+        keys, counts = _collapse(np.concatenate([s.keys for s in sketches]),
+                                 np.concatenate([s.counts for s in sketches]))
+        return cls(
+            sum(s.n for s in sketches), sum(s.total for s in sketches),
+            min(s.low for s in sketches), max(s.high for s in sketches),
+            sum(s.zeros for s in sketches), keys, counts,
+        )
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.n if self.n else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.n:
+            return None
+        rank = q * self.n - self.zeros
+        if rank <= 0 or not len(self.keys):
+            value = 0.0
+        else:
+            i = min(int(np.searchsorted(np.cumsum(self.counts), rank)), len(self.keys) - 1)
+            value = 2 * GAMMA ** float(self.keys[i]) / (GAMMA + 1)
+        return min(max(value, self.low), self.high)
+
+
+def parse_func(name: str) -> Callable[[Sketch], Optional[float]]:
+    """avg, min, max or pNN as a function of a Sketch"""
+    if name == "avg":
+        return lambda sketch: sketch.mean
+    if name in ("min", "max"):
+        return lambda sketch: (sketch.low if name == "min" else sketch.high) if sketch.n else None
+    match = PERCENTILE_RE.match(name)
+    if not match:
+        raise ValueError(f"Unknown aggregate: {name} (use {', '.join(AGGREGATE_FUNCS)} or pNN)")
+    q = float(match.group(1)) / 100
+    return lambda sketch: sketch.quantile(q)
+
+
+# Process pool tasks: module-level functions so they can be pickled. Each
+# returns {group: (hosts with values, merged Sketch)} for its chunk.
+
+def _by_group(groups: Dict[str, str], per_host: Dict[str, Sketch]) -> Dict[str, Tuple[int, Sketch]]:
+    members: Dict[str, List[Sketch]] = defaultdict(list)
+    for host, sketch in per_host.items():
+        if sketch.n:
+            members[groups[host]].append(sketch)
+    return {group: (len(sketches), Sketch.merge(sketches)) for group, sketches in members.items()}
+
+
+def reduce_rollups(groups: Dict[str, str], docs: List[Dict[str, Any]]) -> Dict[str, Tuple[int, Sketch]]:
+    """Rollup averages weighted by their sample counts (see TimeSeriesStore.rollup_stats)"""
+    per_host = {}
+    for doc in docs:
+        counts, sums = np.asarray(doc["n"], dtype=np.float64), np.asarray(doc["sum"], dtype=np.float64)
+        per_host[doc["_id"]] = Sketch.of(sums / counts, counts, doc["min"], doc["max"])
+    return _by_group(groups, per_host)
+
+
+def reduce_buckets(groups: Dict[str, str], field: str, lo: int, hi: int,
+                   docs: List[Dict[str, Any]]) -> Dict[str, Tuple[int, Sketch]]:
+    """Raw samples with timestamps in [lo, hi] ms (see TimeSeriesStore.raw_buckets)"""
+    values: Dict[str, List[np.ndarray]] = defaultdict(list)
+    for doc in docs:
+        ts, column = bucket_column(doc, field)
+        values[doc["host"]].append(column[(ts >= lo) & (ts <= hi)])
+    return _by_group(groups, {host: Sketch.of(np.concatenate(parts)) for host, parts in values.items()})
+
+
+class FleetAggregator:
+    """Aggregates one field of a TimeSeriesStore over groups of hosts.
+
+    ``processes`` is the size of the process pool, started on first use;
+    0 reduces in the default thread pool instead (small fleets, tests).
+    """
+
+    def __init__(self, store, processes: int = 0, hosts_per_task: int = HOSTS_PER_TASK):
+        self.store = store
+        self.processes = processes
+        self.hosts_per_task = hosts_per_task
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.stats = {"queries": 0, "tasks": 0, "hosts": 0}
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.processes and self._pool is None:
+            # spawn: forking a process that runs the event loop and Motor's threads is unsafe
+            self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def start(self) -> None:
+        """Spawns the pool now, so the first query does not wait for its imports"""
+        pool = self._executor()
+        if pool is not None:
+            for _ in range(self.processes):
+                pool.submit(reduce_rollups, {}, [])
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def aggregate(self, groups: Dict[str, str], field: str, since: datetime, until: datetime,
+                        res: int) -> Dict[str, Tuple[int, Sketch]]:
+        """``groups`` maps host ids to their group; returns (hosts, Sketch) per group
+        for raw samples (``res`` 0) or the averages of ``res``-second rollups"""
+        hosts = sorted(groups)
+        chunks = [hosts[i:i + self.hosts_per_task] for i in range(0, len(hosts), self.hosts_per_task)]
+        partials = await asyncio.gather(*(
+            self._reduce({host: groups[host] for host in chunk}, field, since, until, res) for chunk in chunks
+        ))
+        self.stats["queries"] += 1
+        self.stats["tasks"] += len(chunks)
+        self.stats["hosts"] += len(hosts)
+        members: Dict[str, List[Tuple[int, Sketch]]] = defaultdict(list)
+        for partial in partials:
+            for group, result in partial.items():
+                members[group].append(result)
+        return {group: (sum(hosts for hosts, _ in results), Sketch.merge([sketch for _, sketch in results]))
+                for group, results in members.items()}
+
+    async def _reduce(self, groups: Dict[str, str], field: str, since: datetime, until: datetime,
+                      res: int) -> Dict[str, Tuple[int, Sketch]]:
+        loop = asyncio.get_running_loop()
+        if res:
+            docs = await self.store.rollup_stats(list(groups), field, res, since, until)
+            return await loop.run_in_executor(self._executor(), reduce_rollups, groups, docs)
+        docs = await self.store.raw_buckets(list(groups), field, since, until)
+        lo, hi = int(since.timestamp() * 1000), int(until.timestamp() * 1000)
+        return await loop.run_in_executor(self._executor(), reduce_buckets, groups, field, lo, hi, docs)
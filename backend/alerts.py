@@ -0,0 +1,214 @@
+"""Streaming threshold alerting evaluated on ingest
+
+Every rule keeps O(1) state per host: pending/firing flags, the previous
+reading for rate rules, and a fixed ring of slot sums for windowed
+averages. Samples are evaluated as they are pushed, so no rule ever
+re-reads history. Only state transitions produce events (firing, then
+resolved once the value crosses back over the clear threshold).
+"""
+import math
+import operator
+import re
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*(s|m|h)?$")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, None: 1}
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+MODES = ("value", "rate", "avg")
+LOAD_FIELDS = {"load_1": 0, "load_5": 1, "load_15": 2}
+WINDOW_SLOTS = 10
+
+DEFAULT_RULES = [
+    {"id": "cpu_high", "name": "CPU > 90%", "field": "cpu_percent", "op": ">",
+     "threshold": 90, "clear": 80, "for": "2m", "severity": "critical"},
+    {"id": "ram_high", "name": "RAM > 90%", "field": "ram_percent", "op": ">",
+     "threshold": 90, "clear": 85, "for": "2m", "severity": "critical"},
+    {"id": "disk_high", "name": "Disk > 90%", "field": "disk_percent", "op": ">",
+     "threshold": 90, "clear": 85, "for": "5m", "severity": "warning"},
+    {"id": "network_in_spike", "name": "Inbound > 100 Mbps", "field": "network_in_bytes", "mode": "rate",
+     "op": ">", "threshold": 12_500_000, "for": "1m", "severity": "warning"},
+]
+
+
+class RuleError(ValueError):
+    """Invalid alert rule definition"""
+
+
+def parse_duration(value: Any) -> float:
+    """Seconds from 30, "30s", "2m" or "1h" """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = DURATION_RE.match(str(value).strip())
+    if not match:
+        raise RuleError(f"Invalid duration: {value}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+class Rule:
+    __slots__ = ("id", "name", "field", "load_index", "op", "compare", "threshold", "clear",
+                 "for_seconds", "mode", "window", "severity")
+
+    def __init__(self, spec: Dict[str, Any]):
+        try:
+            self.id = str(spec["id"])
+            self.field = str(spec["field"])
+            self.threshold = float(spec["threshold"])
+        except (KeyError, TypeError, ValueError):
+            raise RuleError(f"Rule needs id, field and a numeric threshold: {spec}")
+        self.name = spec.get("name", self.id)
+        self.load_index = LOAD_FIELDS.get(self.field)
+        self.op = spec.get("op", ">")
+        if not isinstance(self.op, str) or self.op not in OPERATORS:
+            raise RuleError(f"Unknown operator {self.op!r} in rule {self.id}")
+        self.compare = OPERATORS[self.op]
+        # Hysteresis: once firing, the alert resolves only past the clear threshold
+        try:
+            self.clear = float(spec.get("clear", self.threshold))
+        except (TypeError, ValueError):
+            raise RuleError(f"Rule {self.id} needs a numeric clear threshold")
+        if not math.isfinite(self.threshold) or not math.isfinite(self.clear):
+            raise RuleError(f"Rule {self.id} needs finite thresholds")
+        if OPERATORS[self.op[0]](self.clear, self.threshold):
+            # Past the threshold, the alert would resolve on values that fire it again: it would flap
+            raise RuleError(f"clear must not be {self.op[0]} threshold in rule {self.id}")
+        self.for_seconds = parse_duration(spec.get("for", 0))
+        if not self.for_seconds >= 0:
+            raise RuleError(f"for must not be negative in rule {self.id}")
+        self.mode = spec.get("mode", "value")
+        if not isinstance(self.mode, str) or self.mode not in MODES:
+            raise RuleError(f"Unknown mode {self.mode!r} in rule {self.id}")
+        self.window = parse_duration(spec.get("window", "5m"))
+        if not 0 < self.window < math.inf:
+            raise RuleError(f"window must be a positive duration in rule {self.id}")
+        self.severity = spec.get("severity", "warning")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "name": self.name, "field": self.field, "op": self.op,
+            "threshold": self.threshold, "clear": self.clear, "for": self.for_seconds,
+            "mode": self.mode, "window": self.window, "severity": self.severity,
+        }
+
+
+class RuleState:
+    """Per rule, per host evaluation state; constant size whatever the history"""
+
+    __slots__ = ("pending_since", "firing", "prev_value", "prev_ts", "slot_sums", "slot_counts", "slot_ids")
+
+    def __init__(self, mode: str):
+        self.pending_since: Optional[float] = None
+        self.firing = False
+        self.prev_value: Optional[float] = None
+        self.prev_ts: Optional[float] = None
+        if mode == "avg":
+            self.slot_sums = [0.0] * WINDOW_SLOTS
+            self.slot_counts = [0] * WINDOW_SLOTS
+            self.slot_ids = [-1] * WINDOW_SLOTS
+
+
+class AlertEngine:
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None, history: int = 1000):
+        self.rules: List[Rule] = []
+        self._states: Dict[str, List[RuleState]] = {}
+        self.active: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.events: deque = deque(maxlen=history)
+        self.set_rules(DEFAULT_RULES if rules is None else rules)
+
+    def set_rules(self, specs: List[Dict[str, Any]]) -> None:
+        """Replaces the rule set; all evaluation state starts over"""
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+            raise RuleError("Rules must be a list of objects")
+        rules = [Rule(spec) for spec in specs]
+        if len({rule.id for rule in rules}) != len(rules):
+            raise RuleError("Rule ids must be unique")
+        self.rules = rules
+        self._states = {}
+        self.active = {}
+
+    def evaluate(self, sample: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Feeds one sample to every rule; returns the state transitions it caused"""
+        host = sample["hostname"]
+        ts = sample["timestamp"].timestamp()
+        states = self._states.get(host)
+        if states is None:
+            states = self._states[host] = [RuleState(rule.mode) for rule in self.rules]
+        events = []
+        for rule, state in zip(self.rules, states):
+            if rule.load_index is None:
+                raw = sample.get(rule.field)
+            else:
+                load = sample.get("load_average")
+                raw = load[rule.load_index] if load else None
+            if not isinstance(raw, (int, float)):
+                continue
+            value = self._reading(rule, state, float(raw), ts)
+            if value is None:
+                continue
+
+            if state.firing:
+                # Still breaching until the value is past the clear threshold
+                if rule.compare(value, rule.clear) or value == rule.clear:
+                    continue
+                state.firing = False
+                state.pending_since = None
+                events.append(self._transition(rule, host, "resolved", value, ts))
+            elif rule.compare(value, rule.threshold):
+                if state.pending_since is None:
+                    state.pending_since = ts
+                if ts - state.pending_since >= rule.for_seconds:
+                    state.firing = True
+                    events.append(self._transition(rule, host, "firing", value, ts))
+            else:
+                state.pending_since = None
+        return events
+
+    @staticmethod
+    def _reading(rule: Rule, state: RuleState, raw: float, ts: float) -> Optional[float]:
+        if rule.mode == "value":
+            return raw
+        if rule.mode == "rate":
+            prev_value, prev_ts = state.prev_value, state.prev_ts
+            if prev_ts is not None and ts <= prev_ts:  # replayed or out of order: the rate goes on from the newest
+                return None
+            state.prev_value, state.prev_ts = raw, ts
+            if prev_ts is None or raw < prev_value:  # first reading or counter reset
+                return None
+            return (raw - prev_value) / (ts - prev_ts)
+        # avg: window split in WINDOW_SLOTS slots, stale slots are recycled in place
+        slot_width = rule.window / WINDOW_SLOTS
+        slot_id = int(ts // slot_width)
+        i = slot_id % WINDOW_SLOTS
+        if state.slot_ids[i] != slot_id:
+            state.slot_ids[i] = slot_id
+            state.slot_sums[i] = 0.0
+            state.slot_counts[i] = 0
+        state.slot_sums[i] += raw
+        state.slot_counts[i] += 1
+        total = count = 0
+        oldest = slot_id - WINDOW_SLOTS
+        for j in range(WINDOW_SLOTS):
+            if state.slot_ids[j] > oldest:
+                total += state.slot_sums[j]
+                count += state.slot_counts[j]
+        return total / count
+
+    def _transition(self, rule: Rule, host: str, status: str, value: float, ts: float) -> Dict[str, Any]:
+        event = {
+            "rule": rule.id,
+            "name": rule.name,
+            "host": host,
+            "status": status,
+            "severity": rule.severity,
+            "value": round(value, 2),
+            "threshold": rule.threshold,
+            "timestamp": datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+        }
+        if status == "firing":
+            self.active[(rule.id, host)] = event
+        else:
+            self.active.pop((rule.id, host), None)
+        self.events.append(event)
+        return event
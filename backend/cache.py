@@ -0,0 +1,130 @@
+"""Response cache for slow-changing GET routes
+
+Encoded response bodies are kept in a bounded LRU with a TTL per route and
+a strong ETag (content hash), so polling clients get 304s while nothing
+changed. Entries carry tags ("apps:<host>") that the ingest path
+invalidates when an agent push brings new data.
+"""
+import functools
+import hashlib
+import inspect
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import APIRouter, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (token.strip().removeprefix("W/") for token in if_none_match.split(","))
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "expires", "tags")
+
+    def __init__(self, body: bytes, etag: str, expires: float, tags: Tuple[str, ...]):
+        self.body = body
+        self.etag = etag
+        self.expires = expires
+        self.tags = tags
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, CacheEntry]" = OrderedDict()
+        self._tags: Dict[str, Set[Any]] = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "not_modified": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None or entry.expires <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
+
+    def put(self, key: Any, body: bytes, ttl: float, tags: Iterable[str] = ()) -> CacheEntry:
+        if key in self._entries:
+            self._remove(key)
+        entry = self._entries[key] = CacheEntry(body, etag_for(body), time.monotonic() + ttl, tuple(tags))
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+        return entry
+
+    def invalidate(self, tag: str) -> int:
+        """Drops every entry carrying ``tag``; returns how many were dropped"""
+        keys = self._tags.pop(tag, ())
+        for key in list(keys):
+            self._remove(key)
+        self.stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+
+    def _remove(self, key: Any) -> None:
+        entry = self._entries.pop(key)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get_route(self, router: APIRouter, path: str, ttl: float, tags: Iterable[str] = (), **route_options):
+        """Registers the decorated function as a cached GET route on ``router``.
+
+        Tags may reference path parameters ("apps:{host_id}"). The function
+        itself is returned unchanged, so other code can still call it for
+        plain data.
+        """
+        tags = tuple(tags)
+
+        def decorator(func: Callable) -> Callable:
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            async def endpoint(request: Request, **kwargs):
+                key = (request.url.path, request.url.query)
+                entry = self.get(key)
+                if entry is None:
+                    payload = jsonable_encoder(await func(**kwargs))
+                    body = ORJSONResponse(payload).body
+                    entry = self.put(key, body, ttl, [tag.format_map(kwargs) for tag in tags])
+                headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+                if etag_matches(entry.etag, request.headers.get("if-none-match")):
+                    self.stats["not_modified"] += 1
+                    return Response(status_code=304, headers=headers)
+                return Response(entry.body, media_type="application/json", headers=headers)
+
+            request_param = inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+            endpoint.__signature__ = signature.replace(
+                parameters=[request_param] + [p.replace(kind=inspect.Parameter.KEYWORD_ONLY)
+                                              for p in signature.parameters.values()],
+            )
+            router.add_api_route(path, endpoint, methods=["GET"], **route_options)
+            return func
+
+        return decorator
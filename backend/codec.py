@@ -0,0 +1,190 @@
+"""Lossless compression of metric buckets
+
+Gorilla's ideas (delta-of-delta timestamps, XOR of consecutive floats),
+rearranged so both directions are whole-array NumPy operations plus zlib
+instead of a bit-by-bit loop:
+
+- timestamps are delta-of-delta coded: regular pushes give runs of zeros
+- columns of decimals (agents round to one or two digits) are stored as
+  scaled integers, delta or delta-of-delta coded, whichever is smaller
+  (counters prefer the latter)
+- other floats are XORed with the previous value, which zeroes the high
+  bytes of slowly moving series
+- residuals are narrowed to the smallest integer width that fits and
+  byte-shuffled (all first bytes, then all second bytes...) before zlib
+- constant and all-missing columns are stored once; missing values (NaN)
+  are a bitmap and their slots repeat the previous value
+
+Decoding is zlib, np.frombuffer, then np.cumsum or np.bitwise_xor.accumulate.
+"""
+import struct
+import zlib
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"VPSC"
+VERSION = 1
+BLOCK_HEADER = struct.Struct("<4sBxHI")  # magic, version, columns, rows
+SECTION_HEADER = struct.Struct("<BBbBI")  # mode, flags, decimal scale, delta order, payload length
+
+MODE_CONST = 0  # payload: one float64
+MODE_INT = 1  # payload: zlib(width, first values, shuffled residuals)
+MODE_XOR = 2  # payload: zlib(shuffled XORed bits)
+HAS_MISSING = 1  # flag: a NaN bitmap precedes the payload
+
+MAX_SCALE = 4  # up to 4 decimal digits are stored as integers
+ZLIB_LEVEL = 6
+INT_WIDTHS = ((1, np.int8), (2, np.int16), (4, np.int32))
+
+
+class CodecError(ValueError):
+    """Block that is not in this codec's format"""
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    return np.ascontiguousarray(values.view(np.uint8).reshape(-1, values.itemsize).T).tobytes()
+
+
+def _unshuffle(buffer: bytes, offset: int, width: int, count: int) -> np.ndarray:
+    planes = np.frombuffer(buffer, np.uint8, count * width, offset).reshape(width, count)
+    return np.ascontiguousarray(planes.T).view(f"<i{width}").ravel()
+
+
+def _width(residuals: np.ndarray) -> int:
+    if not len(residuals):
+        return 1
+    lo, hi = residuals.min(), residuals.max()
+    for width, dtype in INT_WIDTHS:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return width
+    return 8
+
+
+def _encode_ints(values: np.ndarray, order: int) -> bytes:
+    head = values[:order]
+    residuals = np.diff(values, n=order) if len(values) > order else values[:0]
+    width = _width(residuals)
+    body = _shuffle(residuals.astype(f"<i{width}"))
+    return zlib.compress(bytes((width,)) + head.astype("<i8").tobytes() + body, ZLIB_LEVEL)
+
+
+def _decode_ints(payload: bytes, rows: int, order: int) -> np.ndarray:
+    raw = zlib.decompress(payload)
+    width, known = raw[0], min(order, rows)
+    head = np.frombuffer(raw, "<i8", known, 1)
+    values = _unshuffle(raw, 1 + 8 * known, width, rows - known).astype(np.int64)
+    # Integrate `order` times, starting from the head's first differences
+    for level in reversed(range(known)):
+        first = np.diff(head, n=level)[0]
+        values = np.concatenate(([first], first + np.cumsum(values)))
+    return values
+
+
+def _decimal_scale(column: np.ndarray) -> Optional[int]:
+    """Smallest number of decimals the column is exactly written with, if any"""
+    if not np.isfinite(column).all() or np.signbit(column[column == 0]).any():
+        return None
+    for scale in range(MAX_SCALE + 1):
+        factor = 10.0 ** scale
+        scaled = np.round(column * factor)
+        if np.abs(scaled).max(initial=0) < 2 ** 53 and np.array_equal(scaled / factor, column):
+            return scale
+    return None
+
+
+def _encode_column(column: np.ndarray) -> bytes:
+    missing = np.isnan(column)
+    flags, bitmap = 0, b""
+    if missing.all():
+        return SECTION_HEADER.pack(MODE_CONST, 0, 0, 0, 8) + np.float64(np.nan).tobytes()
+    if missing.any():
+        flags, bitmap = HAS_MISSING, np.packbits(missing, bitorder="little").tobytes()
+        # Repeat the previous value (the first valid one for leading gaps)
+        index = np.where(missing, 0, np.arange(len(column)))
+        np.maximum.accumulate(index, out=index)
+        column = column[index]
+        column[:np.argmax(~missing)] = column[np.argmax(~missing)]
+    bits = column.view(np.uint64)
+    if (bits == bits[0]).all():  # bitwise, so 0.0 and -0.0 stay apart
+        mode, scale, order, payload = MODE_CONST, 0, 0, np.float64(column[0]).tobytes()
+    else:
+        scale = _decimal_scale(column)
+        if scale is not None:
+            ints = np.round(column * 10.0 ** scale).astype(np.int64)
+            mode, order, payload = MODE_INT, *min(((o, _encode_ints(ints, o)) for o in (1, 2)),
+                                                   key=lambda pair: len(pair[1]))
+        else:
+            mode, scale, order = MODE_XOR, 0, 0
+            previous = np.concatenate((np.zeros(1, dtype=np.uint64), bits[:-1]))
+            payload = zlib.compress(_shuffle(bits ^ previous), ZLIB_LEVEL)
+    return SECTION_HEADER.pack(mode, flags, scale, order, len(payload)) + bitmap + payload
+
+
+def _skip_column(block: bytes, offset: int, rows: int) -> int:
+    _, flags, _, _, length = SECTION_HEADER.unpack_from(block, offset)
+    return offset + SECTION_HEADER.size + ((rows + 7) // 8 if flags & HAS_MISSING else 0) + length
+
+
+def _decode_column(block: bytes, offset: int, rows: int) -> Tuple[np.ndarray, int]:
+    mode, flags, scale, order, length = SECTION_HEADER.unpack_from(block, offset)
+    offset += SECTION_HEADER.size
+    missing = None
+    if flags & HAS_MISSING:
+        size = (rows + 7) // 8
+        missing = np.unpackbits(np.frombuffer(block, np.uint8, size, offset), count=rows, bitorder="little")
+        offset += size
+    payload = block[offset:offset + length]
+    if mode == MODE_CONST:
+        column = np.full(rows, np.frombuffer(payload, "<f8", 1)[0])
+    elif mode == MODE_INT:
+        column = _decode_ints(payload, rows, order) / 10.0 ** scale
+    elif mode == MODE_XOR:
+        xored = _unshuffle(zlib.decompress(payload), 0, 8, rows).view(np.uint64)
+        column = np.bitwise_xor.accumulate(xored).view(np.float64)
+    else:
+        raise CodecError(f"Unknown column mode {mode}")
+    if missing is not None:
+        column[missing.astype(bool)] = np.nan
+    return column, offset + length
+
+
+def encode_block(ts: np.ndarray, columns: np.ndarray) -> bytes:
+    """Timestamps (epoch ms) and a (rows, columns) float matrix, rows sorted by time"""
+    ts = np.asarray(ts, dtype=np.int64)
+    columns = np.asarray(columns, dtype=np.float64)
+    rows, width = columns.shape
+    ts_payload = min(((_encode_ints(ts, order), order) for order in (2, 1)), key=lambda pair: len(pair[0]))
+    parts = [BLOCK_HEADER.pack(MAGIC, VERSION, width, rows),
+             SECTION_HEADER.pack(MODE_INT, 0, 0, ts_payload[1], len(ts_payload[0])), ts_payload[0]]
+    if rows:
+        parts.extend(_encode_column(columns[:, j].copy()) for j in range(width))
+    return b"".join(parts)
+
+
+def decode_block(block: bytes, columns: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Inverse of encode_block: int64 timestamps and a (rows, columns) float64 matrix.
+
+    ``columns`` picks the columns to decode, in that order; the others are skipped.
+    """
+    magic, version, width, rows = BLOCK_HEADER.unpack_from(block)
+    if magic != MAGIC or version != VERSION:
+        raise CodecError(f"Not a version {VERSION} metrics block")
+    wanted = range(width) if columns is None else columns
+    if columns is not None and any(not 0 <= j < width for j in columns):
+        raise CodecError(f"Block has {width} columns, asked for {list(columns)}")
+    _, _, _, order, length = SECTION_HEADER.unpack_from(block, BLOCK_HEADER.size)
+    offset = BLOCK_HEADER.size + SECTION_HEADER.size
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(wanted)))
+    ts = _decode_ints(block[offset:offset + length], rows, order)
+    offset += length
+    result = np.empty((rows, len(wanted)))
+    position = {j: i for i, j in enumerate(wanted)}
+    for j in range(max(position, default=-1) + 1):
+        if j in position:
+            result[:, position[j]], offset = _decode_column(block, offset, rows)
+        else:
+            offset = _skip_column(block, offset, rows)
+    return ts, result
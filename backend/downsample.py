@@ -0,0 +1,76 @@
+"""Chart-sized downsampling of columnar series
+
+Both methods return the indices of the rows to keep (always including the
+first and last row), so every field of a selected sample stays intact and
+spikes in the selection field survive:
+
+- lttb: Largest-Triangle-Three-Buckets, the visually closest polyline
+- minmax: the lowest and highest point of every bucket (envelope)
+"""
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def _fill(y: np.ndarray) -> np.ndarray:
+    """Missing values only matter for the selection: replace them by the mean"""
+    missing = np.isnan(y)
+    if not missing.any():
+        return y
+    mean = np.nanmean(y) if not missing.all() else 0.0
+    return np.where(missing, mean, y)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the ``threshold`` points LTTB keeps out of (x, y)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = _fill(y.astype(np.float64))
+
+    # Bucket i (1..threshold-2) covers [edges[i-1], edges[i]) of the inner points
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, ends = edges[:-1], edges[1:]
+    # Third vertex of each triangle: the next bucket's centroid (last point for the last one)
+    sx, sy = np.add.reduceat(x[:-1], edges[:-1]), np.add.reduceat(y[:-1], edges[:-1])
+    counts = np.diff(edges)
+    cx = np.append((sx / counts)[1:], x[-1])
+    cy = np.append((sy / counts)[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - cx[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy[i] - ay))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of each bucket's minimum and maximum, about ``threshold`` in total"""
+    n = len(y)
+    if threshold >= n or threshold < 4:
+        return np.arange(n)
+    y = y.astype(np.float64)
+    size = -(-(n - 2) // ((threshold - 2) // 2))
+    inner = y[1:-1]
+    padded = np.full(-(-len(inner) // size) * size, np.nan)
+    padded[:len(inner)] = inner
+    buckets = padded.reshape(-1, size)
+    offsets = np.arange(buckets.shape[0]) * size + 1
+    missing = np.isnan(buckets)
+    low = np.where(missing, np.inf, buckets).argmin(axis=1) + offsets
+    high = np.where(missing, -np.inf, buckets).argmax(axis=1) + offsets
+    low, high = np.minimum(low, n - 2), np.minimum(high, n - 2)
+    return np.unique(np.concatenate(([0, n - 1], low, high)))
+
+
+def downsample(ts: np.ndarray, y: np.ndarray, max_points: int, method: str = "lttb") -> np.ndarray:
+    if method == "minmax":
+        return minmax(y, max_points)
+    return lttb(ts, y, max_points)
@@ -0,0 +1,118 @@
+"""Streaming CSV / Parquet encoders for metric history exports
+
+The store is scanned one document at a time and rows are gathered into
+DataFrames of at most EXPORT_CHUNK_ROWS rows, each encoded and sent before
+the next one is built: memory stays flat whatever the exported range.
+Each chunk becomes one Parquet row group.
+"""
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from tsstore import FIELDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional, CSV works without pyarrow
+    pa = pq = None
+
+EXPORT_CHUNK_ROWS = 50_000
+EXPORT_FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+CSV_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+Scan = AsyncIterator[Tuple[str, List[int], Dict[str, List[Optional[float]]]]]
+
+
+def _frame(hosts: List[str], ts: List[int], columns: Dict[str, List[Optional[float]]]) -> pd.DataFrame:
+    frame = {
+        "timestamp": pd.to_datetime(np.asarray(ts, dtype=np.int64), unit="ms", utc=True),
+        "host": hosts,
+    }
+    for field in FIELDS:
+        frame[field] = np.asarray(columns[field], dtype=np.float64)  # None -> NaN
+    return pd.DataFrame(frame)
+
+
+async def chunks(scan: Scan, chunk_rows: int = EXPORT_CHUNK_ROWS) -> AsyncIterator[pd.DataFrame]:
+    """Regroups scanned documents into DataFrames of about ``chunk_rows`` rows.
+
+    Always yields at least one (possibly empty) frame so the output keeps
+    its header / schema.
+    """
+    hosts: List[str] = []
+    ts: List[int] = []
+    columns: Dict[str, List[Optional[float]]] = {field: [] for field in FIELDS}
+    emitted = False
+    async for host, doc_ts, doc_columns in scan:
+        hosts.extend([host] * len(doc_ts))
+        ts.extend(doc_ts)
+        for field in FIELDS:
+            columns[field].extend(doc_columns[field])
+        if len(ts) >= chunk_rows:
+            yield _frame(hosts, ts, columns)
+            emitted = True
+            hosts, ts = [], []
+            columns = {field: [] for field in FIELDS}
+    if ts or not emitted:
+        yield _frame(hosts, ts, columns)
+
+
+async def csv_stream(frames: AsyncIterator[pd.DataFrame]) -> AsyncIterator[bytes]:
+    header = True
+    async for frame in frames:
+        # Encoding 50k rows takes a while: keep the event loop serving other requests
+        text = await asyncio.to_thread(
+            frame.to_csv, index=False, header=header, date_format=CSV_DATE_FORMAT,
+        )
+        header = False
+        yield text.encode()
+
+
+class _ChunkSink:
+    """Write-only file object handing back what ParquetWriter wrote so far"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+async def parquet_stream(frames: AsyncIterator[pd.DataFrame]) -> AsyncIterator[bytes]:
+    """One row group per chunk; the footer goes out once the scan is done"""
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow")
+    sink = _ChunkSink()
+    writer = None
+    async for frame in frames:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression="zstd")
+        await asyncio.to_thread(writer.write_table, table)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,111 @@
+"""Fleet registry: latest-value cache for every host that pushes samples"""
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from inventory import INVENTORY_KINDS, Inventory
+
+# Lists agents send only when refreshed; kept as the host's latest copy
+SNAPSHOT_KEYS = ("processes", "services", "apps", "info", "inventory", "unsupported")
+
+# Host description fields shown in fleet views (see get_vps_info)
+INFO_FIELDS = ("hostname", "ip", "os", "kernel", "architecture", "provider", "datacenter")
+
+OFFLINE_AFTER = 60  # seconds without a sample before a host is reported offline
+
+
+class HostState:
+    """Latest sample and inventory of one host"""
+
+    __slots__ = ("host_id", "info", "info_at", "sample", "sampled_at", "processes", "processes_at",
+                 "services", "apps", "unsupported", "first_seen", "last_seen")
+
+    def __init__(self, host_id: str):
+        self.host_id = host_id
+        self.info: Dict[str, Any] = {"hostname": host_id}
+        self.info_at: Optional[datetime] = None
+        self.sample: Optional[Dict[str, Any]] = None
+        self.sampled_at: Optional[datetime] = None
+        self.processes: Optional[List[Dict[str, Any]]] = None
+        self.processes_at: Optional[datetime] = None
+        # Set by the server from its InventoryStore, which folds in full lists and diffs
+        self.services: Optional[Inventory] = None
+        self.apps: Optional[Inventory] = None
+        self.unsupported: Set[str] = set()  # Inventories the agent has no command for
+        self.first_seen = self.last_seen = time.time()
+
+    @property
+    def online(self) -> bool:
+        return time.time() - self.last_seen < OFFLINE_AFTER
+
+    @property
+    def needs_inventory(self) -> bool:
+        """True until the agent has sent its description, services and apps (or said it cannot)"""
+        return len(self.info) == 1 or any(getattr(self, kind) is None and kind not in self.unsupported
+                                          for kind in INVENTORY_KINDS)
+
+    def summary(self) -> Dict[str, Any]:
+        """Compact row for the fleet overview"""
+        sample = self.sample or {}
+        return {
+            "id": self.host_id,
+            "hostname": self.info.get("hostname"),
+            "provider": self.info.get("provider"),
+            "datacenter": self.info.get("datacenter"),
+            "online": self.online,
+            "last_seen": self.last_seen,
+            "cpu_percent": sample.get("cpu_percent"),
+            "ram_percent": sample.get("ram_percent"),
+            "disk_percent": sample.get("disk_percent"),
+            "agent_cpu_percent": (sample.get("agent_stats") or {}).get("cpu_percent"),
+        }
+
+
+class HostRegistry:
+    """Hosts keyed by id (the agent's hostname), populated from ingested samples"""
+
+    def __init__(self):
+        self._hosts: Dict[str, HostState] = {}
+
+    def __contains__(self, host_id: str) -> bool:
+        return host_id in self._hosts
+
+    def __len__(self) -> int:
+        return len(self._hosts)
+
+    def __iter__(self) -> Iterator[HostState]:
+        return iter(list(self._hosts.values()))
+
+    def get(self, host_id: str) -> Optional[HostState]:
+        return self._hosts.get(host_id)
+
+    def observe(self, sample: Dict[str, Any]) -> bool:
+        """Folds one ingested sample into its host's state.
+
+        Returns True when it became the host's latest sample. The process
+        list and description are sent only when refreshed, so each keeps the
+        time of the sample it came from: a backfilled or out-of-order sample
+        never replaces a newer copy.
+        """
+        host_id = sample["hostname"]
+        state = self._hosts.get(host_id)
+        if state is None:
+            state = self._hosts[host_id] = HostState(host_id)
+        state.last_seen = time.time()
+        timestamp = sample["timestamp"]
+        latest = state.sampled_at is None or timestamp >= state.sampled_at
+        if latest:
+            state.sampled_at = timestamp
+            state.sample = {k: v for k, v in sample.items() if k not in SNAPSHOT_KEYS and k != "received_at"}
+            state.sample["timestamp"] = timestamp.isoformat()
+        if sample.get("processes") is not None and (state.processes_at is None or timestamp >= state.processes_at):
+            state.processes, state.processes_at = sample["processes"], timestamp
+        if sample.get("info") and (state.info_at is None or timestamp >= state.info_at):
+            state.info.update({k: v for k, v in sample["info"].items() if k in INFO_FIELDS})
+            state.info_at = timestamp
+        if isinstance(sample.get("unsupported"), list):
+            state.unsupported = {kind for kind in sample["unsupported"] if kind in INVENTORY_KINDS}
+        return latest
+
+    def overview(self) -> List[Dict[str, Any]]:
+        return [state.summary() for state in self._hosts.values()]
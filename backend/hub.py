@@ -0,0 +1,103 @@
+"""In-process pub/sub hub fanning live samples out to stream subscribers"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Set
+
+import orjson
+
+
+def sse_frame(payload: Any, event: str = "metrics") -> bytes:
+    """Server-Sent Events frame for one payload"""
+    data = orjson.dumps(payload, default=str)
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class Subscription:
+    """Bounded per-client queue; when full the oldest frame is dropped"""
+
+    __slots__ = ("topic", "frames", "dropped", "_wakeup")
+
+    def __init__(self, topic: str, max_frames: int):
+        self.topic = topic
+        self.frames: deque = deque(maxlen=max_frames)
+        self.dropped = 0
+        self._wakeup = asyncio.Event()
+
+    def offer(self, frame: bytes) -> None:
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        self._wakeup.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Next frame, or None if nothing arrived within ``timeout`` seconds"""
+        while not self.frames:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.frames.popleft()
+
+
+class MetricsHub:
+    """Topic (host) keyed hub: every payload is encoded once, whatever the audience"""
+
+    def __init__(self, max_frames: int = 32, encode: Callable[[Any], bytes] = sse_frame):
+        self.max_frames = max_frames
+        self._encode = encode
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._latest: Dict[str, Any] = {}
+        self._latest_frame: Dict[str, bytes] = {}
+        self._published_at: Dict[str, float] = {}
+        self.stats = {"published": 0, "encoded": 0, "delivered": 0}
+
+    def subscribe(self, topic: str) -> Subscription:
+        sub = Subscription(topic, self.max_frames)
+        self._subscribers.setdefault(topic, set()).add(sub)
+        if topic in self._latest:
+            sub.offer(self._frame(topic))
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._subscribers.get(sub.topic)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.topic]
+
+    def subscriber_count(self, topic: Optional[str] = None) -> int:
+        if topic is not None:
+            return len(self._subscribers.get(topic, ()))
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def latest(self, topic: str) -> Optional[Any]:
+        return self._latest.get(topic)
+
+    def published_at(self, topic: str) -> Optional[float]:
+        """time.monotonic() of the topic's last publish"""
+        return self._published_at.get(topic)
+
+    def publish(self, topic: str, payload: Any) -> int:
+        """Stores ``payload`` as the topic's latest value and fans it out"""
+        self._latest[topic] = payload
+        self._published_at[topic] = time.monotonic()
+        self.stats["published"] += 1
+        subs = self._subscribers.get(topic)
+        # Encode lazily: without subscribers nobody needs the frame yet
+        self._latest_frame.pop(topic, None)
+        if not subs:
+            return 0
+        frame = self._frame(topic)
+        for sub in subs:
+            sub.offer(frame)
+        self.stats["delivered"] += len(subs)
+        return len(subs)
+
+    def _frame(self, topic: str) -> bytes:
+        frame = self._latest_frame.get(topic)
+        if frame is None:
+            frame = self._latest_frame[topic] = self._encode(self._latest[topic])
+            self.stats["encoded"] += 1
+        return frame
@@ -0,0 +1,187 @@
+"""Write-behind ingestion buffer for agent metric pushes"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Sink = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+
+class IngestQueueFull(Exception):
+    """Raised when a push does not fit in the ingest buffer"""
+
+
+class IngestBuffer:
+    """Bounded in-process queue drained to storage by a background writer.
+
+    Pushes only enqueue and return immediately. The writer takes whatever has
+    accumulated (after a short linger) and hands it to ``sink`` in batches of
+    at most ``batch_size`` samples, so one slow database round-trip absorbs
+    many agent pushes.
+    """
+
+    def __init__(self, sink: Sink, max_samples: int = 100_000,
+                 batch_size: int = 1000, linger: float = 0.1,
+                 on_flush: Optional[Callable[[float], None]] = None):
+        self._sink = sink
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_samples)
+        self._task: Optional[asyncio.Task] = None
+        self.batch_size = batch_size
+        self.linger = linger
+        self.on_flush = on_flush  # called with each successful flush's duration (s)
+        self.stats = {"accepted": 0, "rejected": 0, "flushed": 0, "failed": 0, "batches": 0}
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def put_many(self, samples: List[Dict[str, Any]]) -> None:
+        """Enqueue a whole push, or nothing if it does not fit"""
+        if self._queue.maxsize - self._queue.qsize() < len(samples):
+            self.stats["rejected"] += len(samples)
+            raise IngestQueueFull(f"ingest buffer full ({self._queue.qsize()} samples queued)")
+        for sample in samples:
+            self._queue.put_nowait(sample)
+        self.stats["accepted"] += len(samples)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="ingest-writer")
+
+    async def stop(self) -> None:
+        """Stops the writer and flushes what is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while not self._queue.empty():
+            await self._flush(self._drain([]))
+
+    def _drain(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self.linger:
+                await asyncio.sleep(self.linger)
+            await self._flush(self._drain(batch))
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            await self._sink(batch)
+            if self.on_flush is not None:
+                self.on_flush(time.perf_counter() - start)
+            self.stats["flushed"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception:
+            self.stats["failed"] += len(batch)
+            logger.exception("Failed to flush %d samples", len(batch))
+
+
+class CounterRates:
+    """Derives network Mbps from the agent's cumulative byte counters"""
+
+    COUNTERS = (("network_in_bytes", "network_in_mbps"), ("network_out_bytes", "network_out_mbps"))
+
+    def __init__(self):
+        self._last: Dict[str, Dict[str, Any]] = {}
+
+    def apply(self, sample: Dict[str, Any]) -> None:
+        host = sample["hostname"]
+        previous = self._last.get(host)
+        if "network_in_bytes" not in sample:
+            return
+        self._last[host] = sample
+        if previous is None:
+            return
+        elapsed = (sample["timestamp"] - previous["timestamp"]).total_seconds()
+        if elapsed <= 0:
+            return
+        for counter, rate in self.COUNTERS:
+            delta = sample.get(counter, 0) - previous.get(counter, 0)
+            if rate not in sample and delta >= 0:
+                sample[rate] = round(delta * 8 / elapsed / 1e6, 2)
+
+    def remember(self, sample: Dict[str, Any]) -> None:
+        """Records a sample rated elsewhere (another worker) as the host's previous one"""
+        if "network_in_bytes" in sample:
+            self._last[sample["hostname"]] = sample
+
+    def checkpoint(self, hosts: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """State of ``hosts``, for rollback() if their push is not accepted"""
+        return {host: self._last.get(host) for host in hosts}
+
+    def rollback(self, checkpoint: Dict[str, Optional[Dict[str, Any]]]) -> None:
+        for host, last in checkpoint.items():
+            if last is None:
+                self._last.pop(host, None)
+            else:
+                self._last[host] = last
+
+
+class DeltaDecoder:
+    """Rebuilds full samples from the agent's keyframe/delta frames.
+
+    Keeps the last reconstructed sample and sequence number per host. A delta
+    that does not directly follow the known state cannot be applied; decode()
+    then returns None and the host must be asked for a new keyframe.
+    """
+
+    FRAME_KEYS = ("seq", "keyframe", "delta", "counters")
+    # Lists the agent only sends when refreshed; never carried over to later samples
+    SNAPSHOT_KEYS = ("processes", "services", "apps", "info", "inventory", "unsupported")
+
+    def __init__(self):
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._seq: Dict[str, int] = {}
+
+    def decode(self, frame: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        host = frame["hostname"]
+        if not frame.get("keyframe") and not frame.get("delta"):
+            return frame
+        fields = {k: v for k, v in frame.items() if k not in self.FRAME_KEYS}
+        if frame.get("keyframe"):
+            sample = fields
+        else:
+            base = self._state.get(host)
+            if base is None or frame.get("seq") != self._seq[host] + 1:
+                self._state.pop(host, None)
+                return None
+            sample = {**base, **fields}
+            for counter, delta in (frame.get("counters") or {}).items():
+                sample[counter] = base.get(counter, 0) + delta
+        self._state[host] = {k: v for k, v in sample.items() if k not in self.SNAPSHOT_KEYS}
+        self._seq[host] = frame.get("seq", 0)
+        return dict(sample)
+
+    def export(self, host: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """(seq, state) of a host, for the worker that receives its next delta"""
+        if host not in self._state:
+            return None
+        return self._seq[host], self._state[host]
+
+    def restore(self, host: str, seq: int, state: Dict[str, Any]) -> None:
+        self._state[host] = state
+        self._seq[host] = seq
+
+    def checkpoint(self, hosts: Iterable[str]) -> Dict[str, Optional[Tuple[int, Dict[str, Any]]]]:
+        """State of ``hosts``, for rollback() if their push is not accepted: the
+        agent sends the same frames again, and they must still follow"""
+        return {host: self.export(host) for host in hosts}
+
+    def rollback(self, checkpoint: Dict[str, Optional[Tuple[int, Dict[str, Any]]]]) -> None:
+        for host, exported in checkpoint.items():
+            if exported is None:
+                self._state.pop(host, None)
+                self._seq.pop(host, None)
+            else:
+                self.restore(host, *exported)
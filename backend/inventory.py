@@ -0,0 +1,171 @@
+"""Versioned host inventories: systemd services and installed packages
+
+Agents send a full list once, then diffs (added, changed, removed) naming
+the content hash they apply to ("base") and the hash of the result. A diff
+whose base is not the known state, or whose result hashes differently,
+means both sides drifted: it is dropped and the agent is asked for its
+full lists again (the push ack's resend_inventory).
+
+Each (host, kind) is an Inventory in memory, names sorted for prefix
+search and cursor pagination, and one MongoDB document. Its version is the
+time (ms) of the sample that made the change, so workers that never saw the
+previous versions still number a change the same way, and a save never
+replaces a newer document. Inventories are never modified in place: a change
+builds a new one, so a page being served never sees half of a diff.
+"""
+import hashlib
+import json
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+INVENTORY_KINDS = ("services", "apps")
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+DUPLICATE_KEY = 11000
+LAST_CHAR = chr(0x10FFFF)  # sorts after every character a name can continue with
+
+
+def inventory_hash(items: List[Dict[str, Any]]) -> str:
+    """Order-independent content hash of {"name": ...} items; the agent computes the same"""
+    encoded = json.dumps(sorted(items, key=lambda item: item["name"]), sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(encoded.encode(), digest_size=8).hexdigest()
+
+
+class Inventory:
+    """Items of one host and kind, keyed by name"""
+
+    __slots__ = ("host", "kind", "version", "hash", "items", "keys", "names")
+
+    def __init__(self, host: str, kind: str, items: Dict[str, Dict[str, Any]], version: int = 1,
+                 hash: Optional[str] = None):
+        self.host = host
+        self.kind = kind
+        self.version = version
+        self.items = items
+        self.hash = hash or inventory_hash(list(items.values()))
+        # Case-insensitive order; keys[i] is names[i] lowercased, for bisect
+        self.names = sorted(items, key=str.lower)
+        self.keys = [name.lower() for name in self.names]
+
+    @classmethod
+    def from_list(cls, host: str, kind: str, items: List[Dict[str, Any]], version: int = 1) -> "Inventory":
+        return cls(host, kind, {item["name"]: item for item in items}, version)
+
+    def apply(self, diff: Dict[str, Any], version: int) -> Optional["Inventory"]:
+        """The inventory after ``diff``, or None if it was made against another state"""
+        if diff.get("base") != self.hash:
+            return None
+        items = dict(self.items)
+        for name in diff.get("removed", ()):
+            items.pop(name, None)
+        for item in (*diff.get("added", ()), *diff.get("changed", ())):
+            items[item["name"]] = item
+        updated = Inventory(self.host, self.kind, items, version)
+        return updated if updated.hash == diff.get("hash") else None
+
+    def page(self, prefix: str = "", after: Optional[str] = None, limit: int = PAGE_SIZE) -> Dict[str, Any]:
+        """Items whose name starts with ``prefix`` (any case), ``limit`` at a time
+        in name order; pass the returned ``next`` as ``after`` for the next page"""
+        prefix = prefix.lower()
+        first = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + LAST_CHAR, first)
+        start = max(first, bisect_right(self.keys, after.lower())) if after else first
+        names = self.names[start:min(start + limit, end)]
+        return {
+            "items": [self.items[name] for name in names],
+            "total": end - first,
+            "next": self.keys[start + len(names) - 1] if names and start + len(names) < end else None,
+            "version": self.version,
+            "hash": self.hash,
+        }
+
+    def to_document(self) -> Dict[str, Any]:
+        return {"_id": f"{self.host}|{self.kind}", "host": self.host, "kind": self.kind, "version": self.version,
+                "hash": self.hash, "items": list(self.items.values()), "updated_at": datetime.now(timezone.utc)}
+
+    @classmethod
+    def from_document(cls, doc: Dict[str, Any]) -> "Inventory":
+        return cls(doc["host"], doc["kind"], {item["name"]: item for item in doc["items"]}, doc["version"], doc["hash"])
+
+
+class InventoryStore:
+    """In-memory index of every host's inventories, persisted to ``collection``"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._index: Dict[Tuple[str, str], Inventory] = {}
+        self.stats = {"full": 0, "diffs": 0, "drifts": 0, "saved": 0, "stale": 0}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def cached(self, host: str, kind: str) -> Optional[Inventory]:
+        return self._index.get((host, kind))
+
+    async def get(self, host: str, kind: str) -> Optional[Inventory]:
+        """From memory, else from MongoDB (a worker that dropped it after a drift)"""
+        inventory = self._index.get((host, kind))
+        if inventory is None:
+            doc = await self._collection.find_one({"_id": f"{host}|{kind}"})
+            if doc is not None:
+                inventory = self._index[(host, kind)] = Inventory.from_document(doc)
+        return inventory
+
+    async def load(self) -> None:
+        async for doc in self._collection.find():
+            self._index[(doc["host"], doc["kind"])] = Inventory.from_document(doc)
+
+    def apply(self, sample: Dict[str, Any]) -> Tuple[List[Inventory], bool]:
+        """Folds a sample's full lists ("services": [...]) and diffs
+        ("inventory": {"apps": {...}}) into the index.
+
+        Returns the inventories that changed and False when a diff could not
+        be applied; that host's entry is then dropped until its next full list.
+        """
+        host = sample["hostname"]
+        sampled_at = int(sample["timestamp"].timestamp() * 1000)
+        changed, in_sync = [], True
+        for kind in INVENTORY_KINDS:
+            current = self._index.get((host, kind))
+            version = max(sampled_at, current.version + 1) if current is not None else sampled_at
+            if sample.get(kind) is not None:
+                updated = Inventory.from_list(host, kind, sample[kind], version)
+                self.stats["full"] += 1
+                if current is not None and updated.hash == current.hash:
+                    continue
+            elif (sample.get("inventory") or {}).get(kind) is not None:
+                updated = current.apply(sample["inventory"][kind], version) if current is not None else None
+                self.stats["diffs"] += 1
+                if updated is None:
+                    self.stats["drifts"] += 1
+                    self._index.pop((host, kind), None)
+                    in_sync = False
+                    continue
+            else:
+                continue
+            self._index[(host, kind)] = updated
+            changed.append(updated)
+        return changed, in_sync
+
+    async def save(self, inventories: List[Inventory]) -> None:
+        """Writes the latest version of each inventory; never replaces a newer one"""
+        latest = {}
+        for inventory in inventories:
+            latest[(inventory.host, inventory.kind)] = inventory
+        ops = [ReplaceOne({"_id": doc["_id"], "version": {"$lt": doc["version"]}}, doc, upsert=True)
+               for doc in (inventory.to_document() for inventory in latest.values())]
+        stale = 0
+        try:
+            await self._collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # The upsert of a filter that missed because a newer version is stored
+            errors = e.details.get("writeErrors", [])
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+            stale = len(errors)
+        self.stats["saved"] += len(ops) - stale
+        self.stats["stale"] += stale
@@ -0,0 +1,257 @@
+"""Per-process CPU and memory series with incremental top-N aggregates
+
+Every process list an agent pushes is folded into series keyed by (host,
+process name, cmdline hash): raw documents per series per RAW_WINDOW as in
+tsstore, plus 5 min and 1 h rollups holding CPU-seconds, sums and peaks,
+updated with $inc/$max upserts. "Top processes of a host" and "hosts
+running a process above N%" read a few indexed rollup documents instead
+of scanning process dumps.
+
+Agents only report their top processes, so time spent outside that list is
+not counted: CPU-seconds are a lower bound for processes near the cut-off.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import bson
+import numpy as np
+from bson import Binary
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from codec import decode_block, encode_block
+from tsstore import RAW_WINDOW
+
+PROCESS_RESOLUTIONS = (300, 3600)
+HOURLY_FROM = 6 * 3600  # spans from 6 h up are answered from the 1 h rollups
+
+# Seconds one process list stands for when the previous one is unknown or too
+# old (the agent's PROCESSES_INTERVAL); longer gaps are not CPU time
+DEFAULT_INTERVAL = 10
+MAX_INTERVAL = 60
+
+# ?by= of top(): rollup field to rank on
+TOP_ORDERS = {"cpu_seconds": "cpu_s", "cpu_max": "cpu_max", "memory": "mem_max"}
+
+SeriesKey = Tuple[str, str, str]  # host, name, cmdline hash ("" from older agents)
+SERIES_COLUMNS = ("cpu", "mem")
+
+
+def _ms(ts: datetime) -> int:
+    return int(ts.timestamp() * 1000)
+
+
+def _iso(seconds: int) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+def _number(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) else 0.0
+
+
+def group_processes(processes: List[Dict[str, Any]]) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """(name, cmdline hash) -> summed (cpu, memory) percent; workers sharing a
+    command line (php-fpm, gunicorn...) count as one series"""
+    grouped: Dict[Tuple[str, str], List[float]] = {}
+    for proc in processes:
+        if not isinstance(proc, dict) or not proc.get("name"):
+            continue
+        totals = grouped.setdefault((str(proc["name"]), str(proc.get("cmdline_hash") or "")), [0.0, 0.0])
+        totals[0] += _number(proc.get("cpu_percent"))
+        totals[1] += _number(proc.get("memory_percent"))
+    return {key: (cpu, mem) for key, (cpu, mem) in grouped.items()}
+
+
+def series_rows(doc: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Timestamps and (rows, SERIES_COLUMNS) values of a raw series bucket, unsorted"""
+    ts_parts, value_parts = [], []
+    if "block" in doc:
+        ts, columns = decode_block(doc["block"])
+        ts_parts.append(ts)
+        value_parts.append(columns)
+    if "ts" in doc:
+        ts_parts.append(np.asarray(doc["ts"], dtype=np.int64))
+        value_parts.append(np.column_stack([np.asarray(doc[c], dtype=np.float64) for c in SERIES_COLUMNS]))
+    if not ts_parts:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(SERIES_COLUMNS)))
+    return np.concatenate(ts_parts), np.concatenate(value_parts)
+
+
+class ProcessStore:
+    def __init__(self, db):
+        self.raw = db.process_buckets
+        self.rollups = db.process_rollups
+        self._last: Dict[str, int] = {}  # host -> timestamp (ms) of its latest process list
+
+    async def ensure_indexes(self) -> None:
+        await self.raw.create_index([("host", ASCENDING), ("name", ASCENDING), ("start", ASCENDING)])
+        await self.raw.create_index([("start", ASCENDING)])
+        # Top-N of one host, and one process name across the fleet
+        await self.rollups.create_index([("host", ASCENDING), ("res", ASCENDING), ("start", ASCENDING)])
+        await self.rollups.create_index([("name", ASCENDING), ("res", ASCENDING), ("start", ASCENDING),
+                                         ("cpu_max", DESCENDING)])
+        await self.rollups.create_index([("res", ASCENDING), ("start", ASCENDING)])  # retention
+
+    def remember(self, samples: List[Dict[str, Any]]) -> None:
+        """Notes process lists stored by another worker, so intervals stay right"""
+        for sample in samples:
+            if sample.get("processes"):
+                host, ts = sample["hostname"], _ms(sample["timestamp"])
+                self._last[host] = max(self._last.get(host, ts), ts)
+
+    def _interval(self, host: str, ts: int) -> float:
+        previous = self._last.get(host)
+        self._last[host] = max(previous or ts, ts)
+        if previous is None or not 0 < ts - previous <= MAX_INTERVAL * 1000:
+            return DEFAULT_INTERVAL
+        return (ts - previous) / 1000
+
+    async def write(self, batch: List[Dict[str, Any]]) -> None:
+        """Appends the process lists of ``batch`` to their series and rollups"""
+        lists = sorted(
+            ((_ms(sample["timestamp"]), sample["hostname"], sample["processes"])
+             for sample in batch if sample.get("processes")),
+            key=lambda row: row[0],
+        )
+        raw: Dict[Tuple[SeriesKey, int], Tuple[List[int], List[float], List[float]]] = {}
+        rollups: Dict[Tuple[SeriesKey, int, int], Dict[str, float]] = defaultdict(
+            lambda: {"n": 0, "cpu_s": 0.0, "cpu_sum": 0.0, "mem_sum": 0.0, "cpu_max": 0.0, "mem_max": 0.0}
+        )
+        for ts, host, processes in lists:
+            interval = self._interval(host, ts)
+            for (name, cmd), (cpu, mem) in group_processes(processes).items():
+                key = (host, name, cmd)
+                series = raw.setdefault((key, ts // 1000 // RAW_WINDOW * RAW_WINDOW), ([], [], []))
+                series[0].append(ts)
+                series[1].append(cpu)
+                series[2].append(mem)
+                for res in PROCESS_RESOLUTIONS:
+                    agg = rollups[(key, res, ts // 1000 // res * res)]
+                    agg["n"] += 1
+                    agg["cpu_s"] += cpu / 100 * interval
+                    agg["cpu_sum"] += cpu
+                    agg["mem_sum"] += mem
+                    agg["cpu_max"] = max(agg["cpu_max"], cpu)
+                    agg["mem_max"] = max(agg["mem_max"], mem)
+
+        raw_ops = [
+            UpdateOne(
+                {"_id": f"{host}|{name}|{cmd}|{start}"},
+                {"$setOnInsert": {"host": host, "name": name, "cmd": cmd, "start": start},
+                 "$push": {"ts": {"$each": ts}, "cpu": {"$each": cpu}, "mem": {"$each": mem}},
+                 "$inc": {"n": len(ts)}},
+                upsert=True,
+            )
+            for ((host, name, cmd), start), (ts, cpu, mem) in raw.items()
+        ]
+        rollup_ops = [
+            UpdateOne(
+                {"_id": f"{host}|{name}|{cmd}|{res}|{start}"},
+                {"$setOnInsert": {"host": host, "name": name, "cmd": cmd, "res": res, "start": start},
+                 "$inc": {k: agg[k] for k in ("n", "cpu_s", "cpu_sum", "mem_sum")},
+                 "$max": {"cpu_max": agg["cpu_max"], "mem_max": agg["mem_max"]}},
+                upsert=True,
+            )
+            for ((host, name, cmd), res, start), agg in rollups.items()
+        ]
+        if raw_ops:
+            await self.raw.bulk_write(raw_ops, ordered=False)
+        if rollup_ops:
+            await self.rollups.bulk_write(rollup_ops, ordered=False)
+
+    async def top(self, host: str, since: datetime, until: datetime, limit: int = 10,
+                  by: str = "cpu_seconds") -> List[Dict[str, Any]]:
+        """Heaviest processes of ``host`` over [since, until] ranked by TOP_ORDERS[by].
+
+        The range is widened to the rollup boundaries (5 min, or 1 h from
+        HOURLY_FROM up).
+        """
+        res = 3600 if (until - since).total_seconds() >= HOURLY_FROM else 300
+        pipeline = [
+            {"$match": {"host": host, "res": res,
+                        "start": {"$gte": int(since.timestamp()) // res * res, "$lte": int(until.timestamp())}}},
+            {"$group": {"_id": {"name": "$name", "cmd": "$cmd"},
+                        "n": {"$sum": "$n"}, "cpu_s": {"$sum": "$cpu_s"},
+                        "cpu_sum": {"$sum": "$cpu_sum"}, "mem_sum": {"$sum": "$mem_sum"},
+                        "cpu_max": {"$max": "$cpu_max"}, "mem_max": {"$max": "$mem_max"},
+                        "first": {"$min": "$start"}, "last": {"$max": "$start"}}},
+            {"$sort": {TOP_ORDERS[by]: DESCENDING}},
+            {"$limit": limit},
+        ]
+        return [
+            {
+                "name": row["_id"]["name"],
+                "cmdline_hash": row["_id"]["cmd"] or None,
+                "cpu_seconds": round(row["cpu_s"], 1),
+                "cpu_avg": round(row["cpu_sum"] / row["n"], 1),
+                "cpu_max": row["cpu_max"],
+                "memory_avg": round(row["mem_sum"] / row["n"], 1),
+                "memory_max": row["mem_max"],
+                "samples": row["n"],
+                "first_seen": _iso(row["first"]),
+                "last_seen": _iso(row["last"] + res),
+            }
+            async for row in self.rollups.aggregate(pipeline)
+        ]
+
+    async def hosts_running(self, name: str, since: datetime, until: datetime,
+                            min_cpu: float = 0.0) -> List[Dict[str, Any]]:
+        """Hosts where ``name`` peaked above ``min_cpu`` percent, from the 5 min rollups"""
+        res = PROCESS_RESOLUTIONS[0]
+        pipeline = [
+            {"$match": {"name": name, "res": res,
+                        "start": {"$gte": int(since.timestamp()) // res * res, "$lte": int(until.timestamp())},
+                        "cpu_max": {"$gt": min_cpu}}},
+            {"$group": {"_id": "$host", "cpu_max": {"$max": "$cpu_max"}, "cpu_s": {"$sum": "$cpu_s"},
+                        "windows": {"$sum": 1}, "first": {"$min": "$start"}, "last": {"$max": "$start"}}},
+            {"$sort": {"cpu_max": DESCENDING}},
+        ]
+        return [
+            {
+                "host": row["_id"],
+                "cpu_max": row["cpu_max"],
+                "cpu_seconds": round(row["cpu_s"], 1),
+                "windows_above": row["windows"],  # 5 min windows with a peak above min_cpu
+                "first_above": _iso(row["first"]),
+                "last_above": _iso(row["last"] + res),
+            }
+            async for row in self.rollups.aggregate(pipeline)
+        ]
+
+    async def history(self, host: str, name: str, since: datetime, until: datetime,
+                      cmd: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Raw CPU and memory series of ``name`` on ``host``, one per command line"""
+        lo, hi = _ms(since), _ms(until)
+        query: Dict[str, Any] = {"host": host, "name": name,
+                                 "start": {"$gte": lo // 1000 // RAW_WINDOW * RAW_WINDOW, "$lte": hi // 1000}}
+        if cmd is not None:
+            query["cmd"] = cmd
+        parts: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {}
+        async for doc in self.raw.find(query).sort("start", ASCENDING):
+            ts, values = series_rows(doc)
+            mask = (ts >= lo) & (ts <= hi)
+            if mask.any():
+                parts.setdefault(doc["cmd"], []).append((ts[mask], values[mask]))
+        result = []
+        for series_cmd, chunks in parts.items():
+            ts = np.concatenate([chunk[0] for chunk in chunks])
+            values = np.concatenate([chunk[1] for chunk in chunks])
+            order = np.argsort(ts, kind="stable")  # backfills append out of order
+            result.append({"cmdline_hash": series_cmd or None, "timestamps": ts[order].tolist(),
+                           "cpu_percent": values[order, 0].tolist(), "memory_percent": values[order, 1].tolist()})
+        return result
+
+    def uncompacted(self, since: int, until: int):
+        """Cursor over raw series buckets starting in [since, until) that still hold arrays"""
+        return self.raw.find({"start": {"$gte": since, "$lt": until}, "ts": {"$exists": True}})
+
+    async def compact(self, doc: Dict[str, Any]) -> Optional[int]:
+        """Same as TimeSeriesStore.compact for one process series bucket"""
+        ts, values = series_rows(doc)
+        order = np.argsort(ts, kind="stable")
+        compacted = {"_id": doc["_id"], **{k: doc[k] for k in ("host", "name", "cmd", "start")},
+                     "n": doc.get("n"), "block": Binary(encode_block(ts[order], values[order]))}
+        result = await self.raw.replace_one({"_id": doc["_id"], "n": doc.get("n")}, compacted)
+        if not result.modified_count:
+            return None
+        return len(bson.encode(doc)) - len(bson.encode(compacted))
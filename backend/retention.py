@@ -0,0 +1,187 @@
+"""Retention and compaction of the stored metrics
+
+RetentionScheduler runs from the app lifespan every ``interval`` seconds:
+
+- expiry: each Policy drops the buckets of its collection older than its
+  retention with range deletes on their indexed start, EXPIRE_SLICE of
+  history per delete, never document by document
+- compaction: closed raw buckets still made of BSON arrays are rewritten as
+  one compressed block (codec.py) by their store, at most ``compact_rate``
+  buckets per second and only while ``busy()`` (an ingest backlog) is false
+
+Byte counts are logical BSON sizes, before WiredTiger's own compression;
+expired bytes are estimated from the collection's average document size.
+With several workers, a lease document lets a single one do the work.
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+RETENTION_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*(s|m|h|d|w|y)$")
+RETENTION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400, "y": 365 * 86400}
+
+EXPIRE_SLICE = 86400  # seconds of buckets removed per delete
+COMPACT_BATCH = 16  # buckets per cursor batch; raw buckets weigh up to ~100 KB
+BUSY_BACKOFF = 0.5  # seconds between two checks of busy()
+INDEX_OPTIONS_CONFLICT = 85
+
+
+def parse_retention(value: str) -> float:
+    """Seconds from "48h", "14d", "1y"..."""
+    match = RETENTION_RE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid retention: {value}")
+    return float(match.group(1)) * RETENTION_UNITS[match.group(2)]
+
+
+async def ensure_ttl_index(collection, field: str, seconds: float) -> None:
+    """TTL index on a date field; a changed retention is applied in place"""
+    try:
+        await collection.create_index(field, expireAfterSeconds=int(seconds))
+    except OperationFailure as e:
+        if e.code != INDEX_OPTIONS_CONFLICT:
+            raise
+        await collection.database.command(
+            "collMod", collection.name, index={"keyPattern": {field: 1}, "expireAfterSeconds": int(seconds)},
+        )
+
+
+class Policy:
+    """Buckets of ``collection`` matching ``match`` are kept ``keep`` seconds after their start"""
+
+    __slots__ = ("name", "collection", "keep", "match")
+
+    def __init__(self, name: str, collection, keep: float, match: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.collection = collection
+        self.keep = keep
+        self.match = match or {}
+
+
+class RetentionScheduler:
+    def __init__(self, policies: List[Policy], compactors: Dict[str, Any], leases=None, owner: str = "",
+                 interval: float = 3600, compact_rate: float = 20.0, closed_after: float = 7200,
+                 busy: Optional[Callable[[], bool]] = None, first_run: float = 60):
+        """``compactors`` maps a policy name to the store compacting its buckets
+        (uncompacted/compact, see TimeSeriesStore). Buckets are compacted once
+        they started ``closed_after`` seconds ago, so late pushes are rare."""
+        self.policies = {policy.name: policy for policy in policies}
+        self.compactors = compactors
+        self._leases = leases
+        self.owner = owner
+        self.interval = interval
+        self.compact_rate = compact_rate
+        self.closed_after = closed_after
+        self.busy = busy
+        self.first_run = first_run
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"runs": 0, "failed": 0, "skipped": 0, "conflicts": 0,
+                      "last_run": 0.0, "last_duration": 0.0, "paused_seconds": 0.0}
+        self.deleted: Dict[str, int] = defaultdict(int)  # policy -> documents
+        self.compacted: Dict[str, int] = defaultdict(int)  # policy -> buckets
+        self.reclaimed: Dict[tuple, int] = defaultdict(int)  # (policy, "expire" | "compact") -> bytes
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="retention")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        await asyncio.sleep(self.first_run)
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                self.stats["failed"] += 1
+                logger.exception("Retention run failed")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        if not await self._acquire(now):
+            self.stats["skipped"] += 1
+            return
+        start = time.perf_counter()
+        for policy in self.policies.values():
+            await self.expire(policy, now)
+        for name, store in self.compactors.items():
+            await self.compact(name, store, now)
+        self.stats["runs"] += 1
+        self.stats["last_run"] = now
+        self.stats["last_duration"] = time.perf_counter() - start
+
+    async def _acquire(self, now: float) -> bool:
+        """Takes (or renews) the lease for one interval, unless another worker holds it"""
+        if self._leases is None:
+            return True
+        try:
+            await self._leases.find_one_and_update(
+                {"_id": "retention", "$or": [{"until": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "until": now + self.interval}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def expire(self, policy: Policy, now: float) -> None:
+        cutoff = int(now - policy.keep)
+        average = None
+        while True:
+            oldest = await policy.collection.find_one(
+                {**policy.match, "start": {"$lt": cutoff}}, projection={"start": 1}, sort=[("start", ASCENDING)],
+            )
+            if oldest is None:
+                return
+            if average is None:
+                average = await self._average_size(policy.collection)
+            query = {**policy.match, "start": {"$lt": min(cutoff, oldest["start"] + EXPIRE_SLICE)}}
+            result = await policy.collection.delete_many(query)
+            self.deleted[policy.name] += result.deleted_count
+            self.reclaimed[(policy.name, "expire")] += int(average * result.deleted_count)
+            await self._idle()
+
+    async def compact(self, name: str, store, now: float) -> None:
+        since = int(now - self.policies[name].keep)  # expiring soon anyway
+        cursor = store.uncompacted(since, int(now - self.closed_after)).batch_size(COMPACT_BATCH)
+        async for doc in cursor:
+            await self._idle()
+            saved = await store.compact(doc)
+            if saved is None:
+                self.stats["conflicts"] += 1  # pushed to meanwhile, next run gets it
+            else:
+                self.compacted[name] += 1
+                self.reclaimed[(name, "compact")] += saved
+            await asyncio.sleep(1 / self.compact_rate)
+
+    async def _idle(self) -> None:
+        """Waits until ingestion has no backlog"""
+        while self.busy is not None and self.busy():
+            self.stats["paused_seconds"] += BUSY_BACKOFF
+            await asyncio.sleep(BUSY_BACKOFF)
+
+    @staticmethod
+    async def _average_size(collection) -> float:
+        """Average document size from collStats: one metadata read, where summing
+        the documents' sizes would scan every one of them before deleting it"""
+        try:
+            stats = await collection.database.command("collStats", collection.name)
+        except OperationFailure:
+            return 0.0
+        return stats.get("avgObjSize", 0.0)
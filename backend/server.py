@@ -1,98 +1,102 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import gzip
+import hashlib
+import json
 import logging
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional
 from datetime import datetime, timezone, timedelta
-import random
+
+from aggregate import FleetAggregator, parse_func
+from alerts import AlertEngine, RuleError
+from cache import ResponseCache
+from downsample import METHODS as DOWNSAMPLE_METHODS
+from export import EXPORT_FORMATS, chunks, csv_stream, parquet_stream, pq
+from fleet import HostRegistry, HostState
+from hub import MetricsHub
+from ingest import CounterRates, DeltaDecoder, IngestBuffer, IngestQueueFull
+from inventory import MAX_PAGE_SIZE, PAGE_SIZE, Inventory, InventoryStore
+from procstore import TOP_ORDERS as PROCESS_TOP_ORDERS, ProcessStore
+from retention import Policy, RetentionScheduler, ensure_ttl_index, parse_retention
+from shared import SharedPreferences, StateBus
+from simulator import FleetSimulator, stable_seed
+from telemetry import CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE, Registry, RouteLatencyMiddleware
+from tsstore import (FIELDS, ROLLUP_RESOLUTIONS, TimeSeriesStore, pick_resolution, to_columnar, to_packed, to_samples,
+                     to_values)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts background workers, flushes them and closes MongoDB on shutdown"""
+    await metrics_store.ensure_indexes()
+    await process_store.ensure_indexes()
+    await ensure_ttl_index(db.alert_events, "recorded_at", retention_for("alerts"))
+    await inventories.load()
+    ingest_buffer.start()
+    alert_log.start()
+    inventory_log.start()
+    retention.start()
+    fleet_aggregator.start()
+    if state_bus is not None:
+        await state_bus.start(size_bytes=int(os.environ.get('STATE_BUS_SIZE', 64 * 1024 * 1024)))
+    feed = asyncio.create_task(simulated_feed())
+    yield
+    feed.cancel()
+    await retention.stop()
+    if state_bus is not None:
+        await state_bus.stop()
+    await ingest_buffer.stop()
+    await alert_log.stop()
+    await inventory_log.stop()
+    fleet_aggregator.close()
+    client.close()
+
 # Create the main app
-app = FastAPI(title="Matrix VPS Monitor API")
+app = FastAPI(title="Matrix VPS Monitor API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Slow-changing GET routes (apps, services, host info, fleet aggregates), invalidated when pushes bring new data
+response_cache = ResponseCache(max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', 1024)))
+
+# Self-monitoring exposed at /metrics (see the PROMETHEUS section)
+telemetry = Registry()
+
 # ============== VPS DATA SIMULATION ==============
 
 def generate_vps_metrics() -> Dict[str, Any]:
     """Simulates VPS metrics - will be replaced by real agent data"""
-    base_cpu = random.uniform(15, 45)
-    base_ram = random.uniform(2.5, 5.5)
-    
-    return {
-        "cpu_percent": round(base_cpu + random.uniform(-5, 5), 1),
-        "cpu_cores": 4,
-        "ram_used_gb": round(base_ram + random.uniform(-0.3, 0.3), 2),
-        "ram_total_gb": 8.0,
-        "ram_percent": round((base_ram / 8.0) * 100, 1),
-        "disk_used_gb": round(random.uniform(45, 55), 1),
-        "disk_total_gb": 80.0,
-        "disk_percent": round(random.uniform(56, 69), 1),
-        "network_in_mbps": round(random.uniform(0.5, 25), 2),
-        "network_out_mbps": round(random.uniform(0.2, 15), 2),
-        "uptime_seconds": random.randint(86400, 864000),
-        "load_average": [round(random.uniform(0.1, 2), 2) for _ in range(3)],
-        "processes_count": random.randint(80, 150),
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }
+    simulated_host.advance(time.time())
+    sample = simulated_host.samples()[0]
+    del sample["hostname"]
+    return sample
 
 def generate_processes() -> List[Dict[str, Any]]:
     """Simulates process list"""
-    processes = [
-        {"name": "nginx", "user": "www-data", "base_cpu": 0.5, "base_mem": 1.2},
-        {"name": "python3", "user": "root", "base_cpu": 2.5, "base_mem": 3.5},
-        {"name": "node", "user": "node", "base_cpu": 1.8, "base_mem": 4.2},
-        {"name": "mongod", "user": "mongodb", "base_cpu": 3.2, "base_mem": 8.5},
-        {"name": "redis-server", "user": "redis", "base_cpu": 0.3, "base_mem": 0.8},
-        {"name": "sshd", "user": "root", "base_cpu": 0.1, "base_mem": 0.2},
-        {"name": "systemd", "user": "root", "base_cpu": 0.2, "base_mem": 0.5},
-        {"name": "cron", "user": "root", "base_cpu": 0.0, "base_mem": 0.1},
-        {"name": "containerd", "user": "root", "base_cpu": 1.5, "base_mem": 2.8},
-        {"name": "uvicorn", "user": "root", "base_cpu": 0.8, "base_mem": 1.5},
-    ]
-    
-    result = []
-    for i, proc in enumerate(processes):
-        result.append({
-            "pid": 1000 + i * random.randint(10, 100),
-            "name": proc["name"],
-            "cpu_percent": round(proc["base_cpu"] + random.uniform(-0.2, 0.5), 1),
-            "memory_percent": round(proc["base_mem"] + random.uniform(-0.3, 0.8), 1),
-            "status": random.choice(["running", "sleeping"]),
-            "user": proc["user"]
-        })
-    return sorted(result, key=lambda x: x["cpu_percent"], reverse=True)
+    simulated_host.advance(time.time())
+    return simulated_host.processes(0)
 
 def generate_services() -> List[Dict[str, Any]]:
     """Simulates systemd services"""
-    services = [
-        {"name": "nginx.service", "desc": "A high performance web server"},
-        {"name": "mongod.service", "desc": "MongoDB Database Server"},
-        {"name": "docker.service", "desc": "Docker Application Container Engine"},
-        {"name": "ssh.service", "desc": "OpenBSD Secure Shell server"},
-        {"name": "cron.service", "desc": "Regular background program processing"},
-        {"name": "ufw.service", "desc": "Uncomplicated firewall"},
-        {"name": "fail2ban.service", "desc": "Fail2Ban Service"},
-        {"name": "containerd.service", "desc": "containerd container runtime"},
-        {"name": "vps-monitor.service", "desc": "VPS Monitor Backend"},
-    ]
-    
-    result = []
-    for svc in services:
-        is_active = random.random() > 0.1
-        result.append({
-            "name": svc["name"],
-            "status": "active (running)" if is_active else "inactive (dead)",
-            "active": is_active,
-            "description": svc["desc"]
-        })
-    return result
+    simulated_host.advance(time.time())
+    return simulated_host.services(0)
 
 def generate_installed_apps() -> List[Dict[str, Any]]:
     """Simulates installed applications"""
@@ -121,77 +125,714 @@ DEFAULT_METRICS = [
     {"id": "services", "name": "System Services", "enabled": True},
     {"id": "apps", "name": "Installed Applications", "enabled": True},
     {"id": "uptime", "name": "Uptime & Load", "enabled": True},
+    {"id": "agent", "name": "Agent Overhead", "enabled": True},
 ]
 
-# Store preferences in memory (no auth needed)
-current_preferences = DEFAULT_METRICS.copy()
+# Shared by every worker (no auth needed)
+preferences = SharedPreferences(db.preferences, DEFAULT_METRICS)
+
+# ============== INGESTION ==============
+
+# Host monitored by the single-host routes until the fleet views exist
+DEFAULT_HOST = os.environ.get('VPS_HOSTNAME', 'vps-ovh-51210242096')
+
+# Stand-in for DEFAULT_HOST until its agent pushes (see generate_vps_metrics): one
+# seeded virtual host whose series (diurnal CPU, growing counters, flapping
+# services) hang together
+simulated_host = FleetSimulator(1, seed=stable_seed(DEFAULT_HOST))
+
+metrics_store = TimeSeriesStore(db)
+process_store = ProcessStore(db)
+counter_rates = CounterRates()
+delta_decoder = DeltaDecoder()
+
+# Newest 1-minute rollup bucket written. The fleet aggregate is dropped from the
+# cache when a flush opens a new one; within a bucket (and on workers that did
+# not write it) its ttl bounds how stale it gets
+flushed_bucket = {"start": 0}
+
+async def store_samples(batch: List[Dict[str, Any]]):
+    await asyncio.gather(metrics_store.write(batch), process_store.write(batch))
+    if not batch:
+        return
+    res = ROLLUP_RESOLUTIONS[0]
+    start = int(max(sample["timestamp"] for sample in batch).timestamp()) // res * res
+    if start > flushed_bucket["start"]:
+        flushed_bucket["start"] = start
+        response_cache.invalidate("fleet:aggregate")
+
+ingest_buffer = IngestBuffer(
+    store_samples,
+    max_samples=int(os.environ.get('INGEST_QUEUE_SIZE', 100_000)),
+    batch_size=int(os.environ.get('INGEST_BATCH_SIZE', 1000)),
+)
+
+def parse_timestamp(value: Any) -> datetime:
+    """Parses an agent timestamp (ISO string, naive means UTC), defaults to now"""
+    if value is None or value == "":
+        return datetime.now(timezone.utc)
+    if isinstance(value, str):
+        ts = datetime.fromisoformat(value)
+    elif isinstance(value, datetime):
+        ts = value
+    else:
+        raise TypeError(f"Expected an ISO timestamp, got {type(value).__name__}")
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+def read_frames(data: dict) -> List[Dict[str, Any]]:
+    """The frames of a push: a single agent sample or a batch {"samples": [...]} from many hosts"""
+    frames = data["samples"] if "samples" in data else [data]
+    if not isinstance(frames, list):
+        raise HTTPException(status_code=422, detail="samples must be a list")
+    for frame in frames:
+        if not isinstance(frame, dict) or not frame.get("hostname") or not isinstance(frame["hostname"], str):
+            raise HTTPException(status_code=422, detail="Each sample needs a hostname")
+    return frames
+
+def extract_samples(frames: List[Dict[str, Any]], resync: set) -> List[Dict[str, Any]]:
+    """Delta frames are rebuilt into full samples; hosts whose deltas cannot be
+    applied are added to `resync` and their frames are dropped.
+    """
+    received_at = datetime.now(timezone.utc)
+    result = []
+    for frame in frames:
+        try:
+            sample = delta_decoder.decode(frame)
+        except (AttributeError, TypeError, ValueError):
+            raise HTTPException(status_code=422, detail=f"Invalid delta frame from {frame['hostname']}")
+        if sample is None:
+            resync.add(frame["hostname"])
+            continue
+        try:
+            timestamp = parse_timestamp(sample.get("timestamp"))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=422, detail=f"Invalid timestamp: {sample.get('timestamp')}")
+        sample = {**sample, "timestamp": timestamp, "received_at": received_at}
+        try:
+            counter_rates.apply(sample)
+        except TypeError:
+            raise HTTPException(status_code=422, detail=f"Invalid network counters from {sample['hostname']}")
+        result.append(sample)
+    return result
+
+# ============== LIVE STREAM ==============
+
+SIMULATION_INTERVAL = 5
+STREAM_KEEPALIVE = 15
+
+metrics_hub = MetricsHub(max_frames=int(os.environ.get('STREAM_QUEUE_SIZE', 32)))
+
+# Every host that has pushed real samples; the others are simulated
+fleet = HostRegistry()
+
+# Services and installed packages of every host, built from full lists and diffs
+inventories = InventoryStore(db.inventory)
+inventory_log = IngestBuffer(inventories.save, max_samples=10_000, batch_size=100)
+
+def observe_samples(samples: List[Dict[str, Any]], persist: bool = True) -> List[str]:
+    """Folds a push into the fleet registry and inventories and publishes each host's new latest sample.
+
+    Returns the hosts whose inventory (info, services, apps) is still unknown
+    or drifted, so the agent can be asked to resend it in full. Inventory
+    changes are stored by the worker that received the push (`persist`).
+    """
+    updated, drifted = set(), set()
+    for sample in samples:
+        host = sample["hostname"]
+        if fleet.observe(sample):
+            updated.add(host)
+        if sample.get("info"):
+            response_cache.invalidate(f"info:{host}")
+        changed, in_sync = inventories.apply(sample)
+        if not in_sync:
+            drifted.add(host)
+        for inventory in changed:
+            response_cache.invalidate(f"{inventory.kind}:{host}")
+        if changed and persist:
+            try:
+                inventory_log.put_many(changed)
+            except IngestQueueFull:
+                logger.warning("Inventory log full, %s stays unsaved until its next change", host)
+    hosts = {sample["hostname"] for sample in samples}
+    for host in hosts:
+        state = fleet.get(host)
+        state.services, state.apps = inventories.cached(host, "services"), inventories.cached(host, "apps")
+    for host in updated:
+        metrics_hub.publish(host, fleet.get(host).sample)
+    return sorted(host for host in hosts if host in drifted or fleet.get(host).needs_inventory)
+
+def simulate_if_idle(host: str):
+    """Without an agent, publishes at most one simulated sample per interval
+    for the default host; other hosts only exist once they pushed"""
+    if host != DEFAULT_HOST or host in fleet:
+        return
+    published_at = metrics_hub.published_at(host)
+    if published_at is None or time.monotonic() - published_at >= SIMULATION_INTERVAL:
+        metrics_hub.publish(host, generate_vps_metrics())
+
+async def simulated_feed():
+    while True:
+        if metrics_hub.subscriber_count(DEFAULT_HOST):
+            simulate_if_idle(DEFAULT_HOST)
+        await asyncio.sleep(SIMULATION_INTERVAL)
 
 # ============== METRICS ROUTES ==============
 
+async def read_json_body(request: Request) -> dict:
+    """JSON request body, gunzipped when the agent sends Content-Encoding: gzip"""
+    body = await request.body()
+    try:
+        if request.headers.get("content-encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        data = json.loads(body)
+    except (OSError, EOFError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid JSON or gzip body")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="Expected a JSON object")
+    return data
+
+push_outcomes = telemetry.counter("vps_monitor_push_requests_total", "Agent pushes by outcome", ("outcome",))
+PUSHES_ACCEPTED = push_outcomes.labels("accepted")
+PUSHES_THROTTLED = push_outcomes.labels("throttled")
+PUSHES_RESYNC = push_outcomes.labels("resync")
+
+def after_enqueue(step: Callable, samples: List[Dict[str, Any]]) -> Any:
+    """Runs a step of a push whose samples are already queued: failing the ack
+    would make the agent spool and send them again, so errors are only logged"""
+    try:
+        return step(samples)
+    except Exception:
+        logger.exception("%s failed for %d queued samples", step.__name__, len(samples))
+        return None
+
+@api_router.post("/metrics/push")
+async def push_metrics(request: Request):
+    """Queues agent samples; the database write happens in the background"""
+    frames = read_frames(await read_json_body(request))
+    resync = set()
+    # A rejected push is sent again: its frames must still follow the decoder and counter state
+    hosts = {frame["hostname"] for frame in frames}
+    decoders, counters = delta_decoder.checkpoint(hosts), counter_rates.checkpoint(hosts)
+    try:
+        samples = extract_samples(frames, resync)
+        ingest_buffer.put_many(samples)
+    except (HTTPException, IngestQueueFull) as e:
+        delta_decoder.rollback(decoders)
+        counter_rates.rollback(counters)
+        if isinstance(e, HTTPException):
+            raise
+        PUSHES_THROTTLED.inc()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    PUSHES_ACCEPTED.inc()
+    resend_inventory = after_enqueue(observe_samples, samples) or []
+    after_enqueue(evaluate_alerts, samples)
+    after_enqueue(share_samples, samples)
+    ack = {"accepted": len(samples), "queued": ingest_buffer.depth}
+    if resync:
+        PUSHES_RESYNC.inc()
+        ack["resync"] = sorted(resync)
+    if resend_inventory:
+        ack["resend_inventory"] = resend_inventory
+    return ack
+
 @api_router.get("/metrics/current")
 async def get_current_metrics():
-    return generate_vps_metrics()
+    simulate_if_idle(DEFAULT_HOST)
+    return metrics_hub.latest(DEFAULT_HOST)
+
+@api_router.get("/metrics/stream")
+async def stream_metrics(host: Optional[str] = None):
+    """Server-Sent Events feed of live samples, one `metrics` event per sample"""
+    topic = host or DEFAULT_HOST
+    if topic != DEFAULT_HOST:
+        get_host_state(topic)
+
+    async def events():
+        simulate_if_idle(topic)
+        sub = metrics_hub.subscribe(topic)
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                frame = await sub.next(timeout=STREAM_KEEPALIVE)
+                yield frame if frame is not None else b": keepalive\n\n"
+        finally:
+            metrics_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+HISTORY_FORMATS = ("rows", "columnar", "binary")
 
 @api_router.get("/metrics/history")
-async def get_metrics_history(hours: int = 1):
-    """Returns simulated historical metrics"""
-    history = []
+async def get_metrics_history(
+    hours: int = 1,
+    points: int = 60,
+    host: Optional[str] = None,
+    max_points: Optional[int] = None,
+    downsample: str = "lttb",
+    field: str = "cpu_percent",
+    format: str = "rows",
+):
+    """Stored history, read from the coarsest rollup that still gives `points` points.
+
+    `max_points` caps the rows returned: they are picked on `field` with
+    LTTB or min/max envelopes (`downsample=lttb|minmax`), so spikes survive.
+    `format=columnar` returns one array per field with constant fields
+    hoisted out, `format=binary` packed float32 columns (see tsstore.to_packed).
+    """
+    if hours <= 0 or points <= 0:
+        raise HTTPException(status_code=422, detail="hours and points must be positive")
+    if max_points is not None and max_points < 4:
+        raise HTTPException(status_code=422, detail="max_points must be at least 4")
+    if downsample not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=422, detail=f"downsample must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+    if field not in FIELDS:
+        raise HTTPException(status_code=422, detail=f"Unknown field: {field}")
+    if format not in HISTORY_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(HISTORY_FORMATS)}")
     now = datetime.now(timezone.utc)
-    points = min(hours * 12, 72)  # 5 min intervals, max 6 hours
-    
-    for i in range(points):
-        timestamp = now - timedelta(minutes=i * 5)
-        metrics = generate_vps_metrics()
-        metrics["timestamp"] = timestamp.isoformat()
-        history.append(metrics)
-    
-    return list(reversed(history))
+    ts, values = await metrics_store.history(
+        host or DEFAULT_HOST, now - timedelta(hours=hours), now, points, max_points, downsample, field,
+    )
+    if format == "columnar":
+        # Plain lists of numbers: skip jsonable_encoder and hand them to orjson
+        return ORJSONResponse(to_columnar(ts, values))
+    if format == "binary":
+        return Response(to_packed(ts, values), media_type="application/octet-stream")
+    return to_samples(ts, values)
+
+@api_router.get("/metrics/export")
+async def export_metrics(
+    format: str = "csv",
+    host: Optional[str] = None,
+    hours: int = 24,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    resolution: int = 0,
+):
+    """Streams stored history as CSV or Parquet, chunk by chunk.
+
+    `host=*` exports every host; `since`/`until` (ISO) override `hours`;
+    `resolution` is 0 for raw samples or a rollup size in seconds.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet" and pq is None:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow on the server")
+    if resolution and resolution not in ROLLUP_RESOLUTIONS:
+        raise HTTPException(status_code=422, detail=f"resolution must be 0 or one of {ROLLUP_RESOLUTIONS}")
+    until = until or datetime.now(timezone.utc)
+    since = since or until - timedelta(hours=hours)
+    until, since = (t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in (until, since))
+    if since >= until:
+        raise HTTPException(status_code=422, detail="since must be before until")
+
+    host = host or DEFAULT_HOST
+    frames = chunks(metrics_store.scan(None if host == "*" else host, since, until, resolution))
+    body = csv_stream(frames) if format == "csv" else parquet_stream(frames)
+    filename = f"metrics-{'all' if host == '*' else host}-{since:%Y%m%d%H%M}-{until:%Y%m%d%H%M}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @api_router.get("/processes")
 async def get_processes():
-    return generate_processes()
+    state = fleet.get(DEFAULT_HOST)
+    return state.processes if state and state.processes is not None else generate_processes()
 
-@api_router.get("/services")
-async def get_services():
-    return generate_services()
+async def inventory_page(host: str, kind: str, prefix: str, after: Optional[str], limit: int) -> Dict[str, Any]:
+    """One page of a host's services or apps: {items, total, next, version, hash}"""
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    inventory = inventories.cached(host, kind)
+    if inventory is None and host in fleet:
+        inventory = await inventories.get(host, kind)  # dropped from memory after a drift
+    if inventory is None:
+        simulated = {"services": generate_services, "apps": generate_installed_apps}[kind]
+        inventory = Inventory.from_list(host, kind, simulated() if host == DEFAULT_HOST else [], version=0)
+    return inventory.page(prefix, after, limit)
 
-@api_router.get("/apps")
-async def get_installed_apps():
-    return generate_installed_apps()
+@response_cache.get_route(api_router, "/services", ttl=60, tags=(f"services:{DEFAULT_HOST}",))
+async def get_services(prefix: str = "", after: Optional[str] = None, limit: int = PAGE_SIZE):
+    """Services of the monitored host whose name starts with `prefix`, `limit` per page;
+    `after` is the previous page's `next`"""
+    return await inventory_page(DEFAULT_HOST, "services", prefix, after, limit)
+
+@response_cache.get_route(api_router, "/apps", ttl=3600, tags=(f"apps:{DEFAULT_HOST}",))
+async def get_installed_apps(prefix: str = "", after: Optional[str] = None, limit: int = PAGE_SIZE):
+    """Installed packages of the monitored host, paginated like /services"""
+    return await inventory_page(DEFAULT_HOST, "apps", prefix, after, limit)
 
 # ============== PREFERENCES ROUTES ==============
 
 @api_router.get("/preferences")
 async def get_preferences():
-    return current_preferences
+    return await preferences.get()
 
 @api_router.put("/preferences")
 async def update_preferences(data: dict):
-    global current_preferences
-    prefs = data.get("preferences", [])
-    
-    for update in prefs:
-        for pref in current_preferences:
-            if pref["id"] == update.get("metric_id"):
-                pref["enabled"] = update.get("enabled", True)
-                break
-    
-    return current_preferences
+    changes = {update.get("metric_id"): update.get("enabled", True) for update in data.get("preferences", [])}
+    updated = await preferences.update(changes)
+    if state_bus is not None:
+        state_bus.publish("preferences")
+    return updated
 
 # ============== VPS INFO ==============
 
-@api_router.get("/vps/info")
+# Shown until the agent of DEFAULT_HOST reports its own description
+DEFAULT_VPS_INFO = {
+    "hostname": "vps-ovh-51210242096",
+    "ip": "51.210.242.96",
+    "os": "Ubuntu 22.04.5 LTS",
+    "kernel": "5.15.0-164-generic",
+    "architecture": "x86_64",
+    "provider": "OVH",
+    "datacenter": "GRA (Gravelines, France)"
+}
+
+@response_cache.get_route(api_router, "/vps/info", ttl=3600, tags=(f"info:{DEFAULT_HOST}",))
 async def get_vps_info():
+    state = fleet.get(DEFAULT_HOST)
+    return {**DEFAULT_VPS_INFO, **state.info} if state else DEFAULT_VPS_INFO
+
+# ============== FLEET ==============
+
+def get_host_state(host_id: str) -> HostState:
+    state = fleet.get(host_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Unknown host: {host_id}")
+    return state
+
+@api_router.get("/hosts")
+async def list_hosts():
+    """Fleet overview, served from the in-memory latest-value cache"""
+    return fleet.overview()
+
+@api_router.get("/hosts/{host_id}")
+async def get_host(host_id: str):
+    state = get_host_state(host_id)
+    return {**state.summary(), "info": state.info}
+
+@response_cache.get_route(api_router, "/hosts/{host_id}/info", ttl=3600, tags=("info:{host_id}",))
+async def get_host_info(host_id: str):
+    return get_host_state(host_id).info
+
+@api_router.get("/hosts/{host_id}/metrics/current")
+async def get_host_current_metrics(host_id: str):
+    return get_host_state(host_id).sample
+
+@api_router.get("/hosts/{host_id}/metrics/history")
+async def get_host_metrics_history(host_id: str, hours: int = 1, points: int = 60, max_points: Optional[int] = None,
+                                   downsample: str = "lttb", field: str = "cpu_percent", format: str = "rows"):
+    get_host_state(host_id)
+    return await get_metrics_history(hours=hours, points=points, host=host_id, max_points=max_points,
+                                     downsample=downsample, field=field, format=format)
+
+@api_router.get("/hosts/{host_id}/metrics/stream")
+async def stream_host_metrics(host_id: str):
+    get_host_state(host_id)
+    return await stream_metrics(host=host_id)
+
+@api_router.get("/hosts/{host_id}/processes")
+async def get_host_processes(host_id: str):
+    return get_host_state(host_id).processes or []
+
+@api_router.get("/hosts/{host_id}/processes/top")
+async def get_host_top_processes(host_id: str, hours: int = 24, limit: int = 10, by: str = "cpu_seconds"):
+    """Heaviest processes over the last hours, e.g. by CPU-seconds, from the process rollups"""
+    if by not in PROCESS_TOP_ORDERS:
+        raise HTTPException(status_code=422, detail=f"by must be one of {', '.join(PROCESS_TOP_ORDERS)}")
+    now = datetime.now(timezone.utc)
+    return await process_store.top(host_id, now - timedelta(hours=hours), now, max(1, min(limit, 100)), by)
+
+@api_router.get("/hosts/{host_id}/processes/history")
+async def get_host_process_history(host_id: str, name: str, cmdline_hash: Optional[str] = None, hours: int = 1):
+    """CPU and memory series of one process name, one series per command line"""
+    now = datetime.now(timezone.utc)
+    return await process_store.history(host_id, name, now - timedelta(hours=hours), now, cmdline_hash)
+
+@api_router.get("/processes/{name}/hosts")
+async def get_process_hosts(name: str, min_cpu: float = 0, hours: int = 1):
+    """Hosts where a process peaked above min_cpu percent, e.g. mongod above 50 in the last hour"""
+    now = datetime.now(timezone.utc)
+    return await process_store.hosts_running(name, now - timedelta(hours=hours), now, min_cpu)
+
+@response_cache.get_route(api_router, "/hosts/{host_id}/services", ttl=60, tags=("services:{host_id}",))
+async def get_host_services(host_id: str, prefix: str = "", after: Optional[str] = None, limit: int = PAGE_SIZE):
+    get_host_state(host_id)
+    return await inventory_page(host_id, "services", prefix, after, limit)
+
+@response_cache.get_route(api_router, "/hosts/{host_id}/apps", ttl=3600, tags=("apps:{host_id}",))
+async def get_host_apps(host_id: str, prefix: str = "", after: Optional[str] = None, limit: int = PAGE_SIZE):
+    get_host_state(host_id)
+    return await inventory_page(host_id, "apps", prefix, after, limit)
+
+# ============== FLEET AGGREGATES ==============
+
+AGGREGATE_GROUPS = ("provider", "datacenter")  # host description fields, as in /vps/info
+AGGREGATE_POINTS = 288  # values per host: a day is read from the 5-minute rollups
+
+fleet_aggregator = FleetAggregator(
+    metrics_store, processes=int(os.environ.get('AGGREGATE_PROCESSES', min(4, os.cpu_count() or 1))),
+)
+
+@response_cache.get_route(api_router, "/fleet/aggregate", ttl=30, tags=("fleet:aggregate",))
+async def get_fleet_aggregate(field: str = "cpu_percent", funcs: str = "avg,max,p95", group_by: Optional[str] = None,
+                              hours: float = 1, points: int = AGGREGATE_POINTS):
+    """`field` aggregated over every host of the fleet, one row per `group_by` value.
+
+    `funcs` is a comma-separated list of avg, min, max and percentiles (p50,
+    p95, p99.9...), e.g. `field=ram_percent&funcs=p95&group_by=datacenter&hours=24`.
+    Like the history, values come from the coarsest rollup still giving `points`
+    values per host: avg, min and max stay exact, percentiles are then those of
+    the rollup averages. Percentiles are within 1 % of the true value.
+    """
+    if field not in FIELDS:
+        raise HTTPException(status_code=422, detail=f"Unknown field: {field}")
+    if group_by is not None and group_by not in AGGREGATE_GROUPS:
+        raise HTTPException(status_code=422, detail=f"group_by must be one of {', '.join(AGGREGATE_GROUPS)}")
+    if hours <= 0 or points <= 0:
+        raise HTTPException(status_code=422, detail="hours and points must be positive")
+    names = [name.strip() for name in funcs.split(",") if name.strip()]
+    try:
+        functions = {name: parse_func(name) for name in names}
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not functions:
+        raise HTTPException(status_code=422, detail="funcs must name at least one aggregate")
+
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(hours=hours)
+    res = pick_resolution(int((now - since).total_seconds()), points)
+    groups = {state.host_id: (state.info.get(group_by) or "unknown") if group_by else "fleet" for state in fleet}
+    started = time.perf_counter()
+    results = await fleet_aggregator.aggregate(groups, field, since, now, res)
+    return {
+        "field": field,
+        "group_by": group_by,
+        "since": since.isoformat(),
+        "until": now.isoformat(),
+        "resolution": res,
+        "groups": [
+            {"group": group, "hosts": hosts, "samples": int(sketch.n),
+             **{name: function(sketch) for name, function in functions.items()}}
+            for group, (hosts, sketch) in sorted(results.items())
+        ],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+# ============== ALERTS ==============
+
+alert_engine = AlertEngine()
+
+async def store_alert_events(events: List[Dict[str, Any]]):
+    # recorded_at (a BSON date) carries the collection's TTL index, see RETENTION
+    recorded_at = datetime.now(timezone.utc)
+    await db.alert_events.insert_many([{**event, "recorded_at": recorded_at} for event in events], ordered=False)
+
+# Transitions are rare but must not delay the push ack either
+alert_log = IngestBuffer(store_alert_events, max_samples=10_000, batch_size=100)
+
+def evaluate_alerts(samples: List[Dict[str, Any]], log: bool = True):
+    """Runs every pushed sample through the rule engine and logs the transitions.
+
+    Samples pushed to another worker update the rule state without logging:
+    the receiving worker already stored their transitions.
+    """
+    events = []
+    for sample in samples:
+        events.extend(alert_engine.evaluate(sample))
+    if events and log:
+        try:
+            alert_log.put_many(events)
+        except IngestQueueFull:
+            logger.warning("Alert log full, dropping %d events", len(events))
+
+@api_router.get("/alerts")
+async def get_active_alerts(host: Optional[str] = None):
+    """Currently firing alerts, one per rule and host"""
+    return [event for event in alert_engine.active.values() if host is None or event["host"] == host]
+
+@api_router.get("/alerts/events")
+async def get_alert_events(limit: int = 100):
+    """Most recent firing/resolved transitions, newest first"""
+    return list(reversed(alert_engine.events))[:limit]
+
+@api_router.get("/alerts/rules")
+async def get_alert_rules():
+    return [rule.to_dict() for rule in alert_engine.rules]
+
+@api_router.put("/alerts/rules")
+async def update_alert_rules(data: dict):
+    """Replaces the rule set, e.g. {"rules": [{"id": "cpu_high", "field": "cpu_percent",
+    "op": ">", "threshold": 90, "clear": 80, "for": "2m"}]}"""
+    try:
+        alert_engine.set_rules(data.get("rules", []))
+    except RuleError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if state_bus is not None:
+        state_bus.publish("alert_rules", rules=[rule.to_dict() for rule in alert_engine.rules])
+    return [rule.to_dict() for rule in alert_engine.rules]
+
+# ============== WORKERS ==============
+
+# Under `uvicorn --workers N` each push reaches one worker: it forwards the
+# decoded samples so every worker's fleet registry, hub subscribers, response
+# cache, alert state and delta decoder stay in step (see shared.py)
+state_bus = StateBus(db.state_events) if os.environ.get('SHARED_STATE', '1') != '0' else None
+EVENT_SAMPLES = 100  # samples per event, well under the 16 MB document limit
+
+def share_samples(samples: List[Dict[str, Any]]):
+    if state_bus is None or not samples:
+        return
+    hosts = {sample["hostname"] for sample in samples}
+    decoders = [[host, *state] for host in hosts if (state := delta_decoder.export(host)) is not None]
+    batches, batch = [], []
+    for sample in samples:
+        # A full package list can hold thousands of entries: it travels alone, in order
+        if batch and (len(batch) == EVENT_SAMPLES or sample.get("apps")):
+            batches.append(batch)
+            batch = []
+        batch.append({k: v for k, v in sample.items() if k != "received_at"})
+        if sample.get("apps"):
+            batches.append(batch)
+            batch = []
+    if batch:
+        batches.append(batch)
+    for i, batch in enumerate(batches):
+        state_bus.publish("samples", samples=batch, decoders=decoders if i == 0 else [])
+
+def apply_shared_samples(event: Dict[str, Any]):
+    """Replays another worker's push without storing it again"""
+    samples = event["samples"]
+    for sample in samples:
+        sample["timestamp"] = parse_timestamp(sample["timestamp"])  # BSON dates come back naive
+        counter_rates.remember(sample)
+    process_store.remember(samples)
+    for host, seq, state in event["decoders"]:
+        delta_decoder.restore(host, seq, state)
+    observe_samples(samples, persist=False)
+    evaluate_alerts(samples, log=False)
+
+def apply_shared_rules(event: Dict[str, Any]):
+    alert_engine.set_rules(event["rules"])
+
+def apply_shared_preferences(event: Dict[str, Any]):
+    preferences.invalidate()
+
+if state_bus is not None:
+    state_bus.on("samples", apply_shared_samples)
+    state_bus.on("alert_rules", apply_shared_rules)
+    state_bus.on("preferences", apply_shared_preferences)
+
+# ============== RETENTION ==============
+
+# Overridden per policy with RETENTION_<NAME>, e.g. RETENTION_METRICS_RAW=72h
+RETENTION_DEFAULTS = {
+    "metrics_raw": "48h", "metrics_1m": "14d", "metrics_5m": "90d", "metrics_1h": "1y",
+    "processes_raw": "48h", "processes_5m": "14d", "processes_1h": "1y",
+    "alerts": "90d",
+}
+
+def retention_for(name: str) -> float:
+    return parse_retention(os.environ.get(f'RETENTION_{name.upper()}', RETENTION_DEFAULTS[name]))
+
+retention = RetentionScheduler(
+    policies=[
+        Policy("metrics_raw", metrics_store.raw, retention_for("metrics_raw")),
+        Policy("metrics_1m", metrics_store.rollups, retention_for("metrics_1m"), {"res": 60}),
+        Policy("metrics_5m", metrics_store.rollups, retention_for("metrics_5m"), {"res": 300}),
+        Policy("metrics_1h", metrics_store.rollups, retention_for("metrics_1h"), {"res": 3600}),
+        Policy("processes_raw", process_store.raw, retention_for("processes_raw")),
+        Policy("processes_5m", process_store.rollups, retention_for("processes_5m"), {"res": 300}),
+        Policy("processes_1h", process_store.rollups, retention_for("processes_1h"), {"res": 3600}),
+    ],
+    compactors={"metrics_raw": metrics_store, "processes_raw": process_store},
+    leases=db.leases,
+    owner=state_bus.worker_id if state_bus is not None else "",
+    interval=float(os.environ.get('RETENTION_INTERVAL', 3600)),
+    compact_rate=float(os.environ.get('COMPACT_RATE', 20)),
+    # Compaction backs off as soon as pushes queue up faster than they flush
+    busy=lambda: ingest_buffer.depth >= ingest_buffer.batch_size,
+)
+
+@api_router.get("/retention")
+async def get_retention():
+    """Policies and what the last runs deleted, compacted and reclaimed"""
     return {
-        "hostname": "vps-ovh-51210242096",
-        "ip": "51.210.242.96",
-        "os": "Ubuntu 22.04.5 LTS",
-        "kernel": "5.15.0-164-generic",
-        "architecture": "x86_64",
-        "provider": "OVH",
-        "datacenter": "GRA (Gravelines, France)"
+        "policies": {name: {"keep_seconds": policy.keep, "deleted": retention.deleted[name],
+                            "compacted": retention.compacted.get(name, 0),
+                            "reclaimed_bytes": {action: retention.reclaimed[(name, action)]
+                                                for action in ("expire", "compact")}}
+                     for name, policy in retention.policies.items()},
+        **retention.stats,
     }
 
+# ============== DASHBOARD SNAPSHOT ==============
+
+CHART_MAX_POINTS = 500  # the CPU chart is a few hundred pixels wide
+
+# section -> (preferences gating it, shown if any is enabled; None if always shown)
+SNAPSHOT_SECTIONS = {
+    "metrics": None,
+    "history": ("cpu", "agent"),
+    "processes": ("processes",),
+    "services": ("services",),
+    "apps": ("apps",),
+    "vps_info": None,
+    "preferences": None,
+}
+
+def section_version(payload: Any) -> str:
+    """Content token clients echo back to skip unchanged sections"""
+    encoded = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(encoded.encode()).hexdigest()[:16]
+
+def parse_versions(versions: Optional[str]) -> Dict[str, str]:
+    """Parses `section:token,section:token`"""
+    known = {}
+    for item in (versions or "").split(","):
+        name, _, token = item.partition(":")
+        if name and token:
+            known[name.strip()] = token.strip()
+    return known
+
+@api_router.get("/dashboard/snapshot")
+async def get_dashboard_snapshot(hours: int = 1, versions: Optional[str] = None):
+    """Everything the dashboard polls, built concurrently in one request.
+
+    Sections disabled in the preferences are skipped; sections whose token
+    matches the one sent in `versions` are listed in `unchanged` instead.
+    """
+    enabled = {pref["id"] for pref in await preferences.get() if pref["enabled"]}
+    builders = {
+        "metrics": get_current_metrics,
+        "history": lambda: get_metrics_history(hours=hours, max_points=CHART_MAX_POINTS),
+        "processes": get_processes,
+        "services": lambda: inventory_page(DEFAULT_HOST, "services", "", None, PAGE_SIZE),
+        "apps": lambda: inventory_page(DEFAULT_HOST, "apps", "", None, PAGE_SIZE),
+        "vps_info": get_vps_info,
+        "preferences": get_preferences,
+    }
+    names = [name for name, prefs in SNAPSHOT_SECTIONS.items() if prefs is None or enabled.intersection(prefs)]
+    results = await asyncio.gather(*(builders[name]() for name in names))
+
+    known = parse_versions(versions)
+    snapshot = {"sections": {}, "versions": {}, "unchanged": []}
+    for name, payload in zip(names, results):
+        token = section_version(payload)
+        snapshot["versions"][name] = token
+        if known.get(name) == token:
+            snapshot["unchanged"].append(name)
+        else:
+            snapshot["sections"][name] = payload
+    return snapshot
+
 # ============== HEALTH CHECK ==============
 
 @api_router.get("/")
@@ -202,6 +843,76 @@ async def root():
 async def health():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
 
+@api_router.get("/cache/stats")
+async def cache_stats():
+    return {**response_cache.stats, "entries": len(response_cache), "max_entries": response_cache.max_entries}
+
+# ============== PROMETHEUS ==============
+
+request_latency = telemetry.histogram(
+    "vps_monitor_request_duration_seconds", "Time to response headers per route", ("route", "method"),
+)
+flush_latency = telemetry.histogram(
+    "vps_monitor_db_flush_seconds", "Duration of one write-behind flush to MongoDB", ("buffer",),
+)
+ingest_buffer.on_flush = flush_latency.labels("metrics").observe
+alert_log.on_flush = flush_latency.labels("alerts").observe
+inventory_log.on_flush = flush_latency.labels("inventory").observe
+
+@telemetry.collector
+def collect_internals():
+    buffers = (("metrics", ingest_buffer), ("alerts", alert_log), ("inventory", inventory_log))
+    yield ("vps_monitor_ingest_queue_depth", "gauge", "Samples waiting in the ingest buffer",
+           [((("buffer", name),), buffer.depth) for name, buffer in buffers])
+    yield ("vps_monitor_ingest_samples_total", "counter", "Samples through the ingest buffer by outcome",
+           [((("buffer", name), ("outcome", outcome)), buffer.stats[outcome])
+            for name, buffer in buffers for outcome in ("accepted", "rejected", "flushed", "failed")])
+    yield ("vps_monitor_stream_subscribers", "gauge", "Open live stream connections",
+           [((), metrics_hub.subscriber_count())])
+    yield ("vps_monitor_stream_frames_total", "counter", "Live stream frames by stage",
+           [((("stage", stage),), count) for stage, count in metrics_hub.stats.items()])
+    cache = response_cache.stats
+    lookups = cache["hits"] + cache["misses"]
+    yield ("vps_monitor_cache_requests_total", "counter", "Response cache lookups by result",
+           [((("result", "hit"),), cache["hits"]), ((("result", "miss"),), cache["misses"])])
+    yield ("vps_monitor_cache_evictions_total", "counter", "Response cache LRU evictions",
+           [((), cache["evictions"])])
+    yield ("vps_monitor_cache_hit_ratio", "gauge", "Response cache hits / lookups since start",
+           [((), cache["hits"] / lookups if lookups else 0.0)])
+    yield ("vps_monitor_alerts_firing", "gauge", "Alerts currently firing", [((), len(alert_engine.active))])
+    yield ("vps_monitor_inventory_updates_total", "counter", "Inventory lists and diffs received by outcome",
+           [((("outcome", outcome),), inventories.stats[outcome]) for outcome in ("full", "diffs", "drifts")])
+    yield ("vps_monitor_retention_deleted_documents_total", "counter", "Buckets dropped by retention policy",
+           [((("policy", name),), retention.deleted[name]) for name in retention.policies])
+    yield ("vps_monitor_compacted_buckets_total", "counter", "Raw buckets rewritten as binary blocks",
+           [((("policy", name),), retention.compacted[name]) for name in retention.compactors])
+    yield ("vps_monitor_storage_reclaimed_bytes_total", "counter", "BSON bytes freed by expiry and compaction",
+           [((("policy", name), ("action", action)), count) for (name, action), count in list(retention.reclaimed.items())])
+    yield ("vps_monitor_retention_last_run_seconds", "gauge", "Duration of the last retention run",
+           [((), retention.stats["last_duration"])])
+    if state_bus is not None:
+        yield ("vps_monitor_state_bus_events_total", "counter", "Cross-worker events by outcome",
+               [((("outcome", outcome),), count) for outcome, count in state_bus.stats.items()])
+
+@telemetry.collector
+def collect_fleet():
+    """Latest sample of every host, so Prometheus scrapes the fleet through one target"""
+    hosts = [state for state in fleet if state.sample is not None]
+    yield ("vps_host_up", "gauge", "1 if the host pushed within the offline delay",
+           [((("host", state.host_id),), int(state.online)) for state in hosts])
+    yield ("vps_host_last_seen_timestamp_seconds", "gauge", "Unix time of the host's last push",
+           [((("host", state.host_id),), state.last_seen) for state in hosts])
+    rows = [(state.host_id, to_values(state.sample)) for state in hosts]
+    for i, field in enumerate(FIELDS):
+        yield (f"vps_host_{field}", "gauge", f"Latest {field} reported by the host agent",
+               [((("host", host_id),), values[i]) for host_id, values in rows if values[i] == values[i]])
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(telemetry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+app.add_middleware(RouteLatencyMiddleware, histograms=request_latency)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -0,0 +1,158 @@
+"""State shared between uvicorn workers through MongoDB
+
+Preferences live in a single document, and each update only $sets the flags
+it changes; workers keep a copy, reloaded after an update event or `ttl`
+seconds. Everything else that a push changes is kept in memory: the fleet
+registry, the live hub, cached responses, alert state and delta decoding.
+Workers keep those in step by broadcasting events on a capped collection.
+Each worker tails it with an awaitData cursor and applies the other workers'
+events as if the push had reached it directly. Change streams would need a
+replica set; a tailable cursor also works on a standalone mongod.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import CursorType, ReturnDocument
+from pymongo.errors import CollectionInvalid
+
+from ingest import IngestBuffer, IngestQueueFull
+
+logger = logging.getLogger(__name__)
+
+# Workers stamp ObjectIds with their own clock; a tailing worker starts this
+# far before its marker so a slightly late clock does not hide events
+CLOCK_SKEW = timedelta(seconds=5)
+
+
+class SharedPreferences:
+    """Dashboard preferences stored as {"enabled": {"cpu": true, ...}} in one document"""
+
+    def __init__(self, collection, defaults: List[Dict[str, Any]], doc_id: str = "dashboard", ttl: float = 30):
+        self._collection = collection
+        self.defaults = defaults
+        self.doc_id = doc_id
+        self.ttl = ttl
+        self._doc: Optional[Dict[str, Any]] = None
+        self._loaded_at: Optional[float] = None  # time.monotonic() of the last read
+
+    async def get(self) -> List[Dict[str, Any]]:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+            self._doc = await self._collection.find_one({"_id": self.doc_id})
+            self._loaded_at = time.monotonic()
+        return self._merge(self._doc)
+
+    def invalidate(self) -> None:
+        """Reads the document again on the next get() (another worker updated it)"""
+        self._loaded_at = None
+
+    async def update(self, changes: Dict[str, bool]) -> List[Dict[str, Any]]:
+        """Sets the given flags atomically; unknown metric ids are ignored"""
+        known = {pref["id"] for pref in self.defaults}
+        fields = {f"enabled.{metric}": bool(enabled) for metric, enabled in changes.items() if metric in known}
+        if not fields:
+            return await self.get()
+        doc = await self._collection.find_one_and_update(
+            {"_id": self.doc_id}, {"$set": fields}, upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        self._doc, self._loaded_at = doc, time.monotonic()
+        return self._merge(doc)
+
+    def _merge(self, doc) -> List[Dict[str, Any]]:
+        # Metrics added after the document was written fall back to their default
+        enabled = (doc or {}).get("enabled", {})
+        return [{**pref, "enabled": enabled.get(pref["id"], pref["enabled"])} for pref in self.defaults]
+
+
+class StateBus:
+    """Broadcasts events to the other workers over a capped collection.
+
+    publish() only queues the event; a background writer inserts the events
+    in order. A second task tails the collection and passes every event from
+    another worker to the handler registered for its kind. When the cursor
+    dies (the collection wrapped past it, or the connection dropped), the
+    worker reconnects and continues from new events. Events missed meanwhile
+    are not replayed; the next push of each host brings it up to date again.
+    """
+
+    def __init__(self, collection, worker_id: Optional[str] = None, max_queued: int = 10_000, retry_delay: float = 1.0):
+        self._collection = collection
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.retry_delay = retry_delay
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._writer = IngestBuffer(self._insert, max_samples=max_queued, batch_size=100, linger=0)
+        self._tail_task = None
+        self.stats = {"published": 0, "dropped": 0, "received": 0, "failed": 0, "reconnects": 0}
+
+    def on(self, kind: str, handler: Callable[[Dict[str, Any]], None]) -> None:
+        self._handlers[kind] = handler
+
+    def publish(self, kind: str, **fields: Any) -> None:
+        try:
+            self._writer.put_many([{"worker": self.worker_id, "kind": kind, **fields}])
+            self.stats["published"] += 1
+        except IngestQueueFull:
+            self.stats["dropped"] += 1
+
+    async def start(self, size_bytes: int) -> None:
+        try:
+            await self._collection.database.create_collection(self._collection.name, capped=True, size=size_bytes)
+        except CollectionInvalid:
+            pass  # created by another worker
+        self._writer.start()
+        self._tail_task = asyncio.create_task(self._tail(), name="state-bus")
+
+    async def stop(self) -> None:
+        if self._tail_task is not None:
+            self._tail_task.cancel()
+            try:
+                await self._tail_task
+            except asyncio.CancelledError:
+                pass
+            self._tail_task = None
+        await self._writer.stop()
+
+    async def _insert(self, events: List[Dict[str, Any]]) -> None:
+        await self._collection.insert_many(events)
+
+    async def _tail(self) -> None:
+        while True:
+            try:
+                await self._follow()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("State bus cursor failed")
+            self.stats["reconnects"] += 1
+            await asyncio.sleep(self.retry_delay)
+
+    async def _follow(self) -> None:
+        # Capped collections return documents in insertion order, which ObjectIds
+        # from several clients do not follow: skip everything up to our own marker
+        marker = ObjectId()
+        await self._collection.insert_one({"_id": marker, "worker": self.worker_id, "kind": "hello"})
+        since = ObjectId.from_datetime(marker.generation_time - CLOCK_SKEW)
+        cursor = self._collection.find({"_id": {"$gte": since}}, cursor_type=CursorType.TAILABLE_AWAIT)
+        caught_up = False
+        while cursor.alive:
+            async for event in cursor:
+                if not caught_up:
+                    caught_up = event["_id"] == marker
+                elif event["worker"] != self.worker_id:
+                    self._dispatch(event)
+
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        handler = self._handlers.get(event["kind"])
+        if handler is None:
+            return
+        self.stats["received"] += 1
+        try:
+            handler(event)
+        except Exception:
+            self.stats["failed"] += 1
+            logger.exception("Failed to apply %s event from %s", event["kind"], event["worker"])
@@ -0,0 +1,327 @@
+"""Seeded, stateful simulator of a fleet of virtual hosts
+
+Every host has a fixed profile (size, timezone, baseline load, traffic)
+and an evolving state advanced for the whole fleet at once with NumPy:
+
+- CPU follows a diurnal curve in the host's local time, AR(1) noise and
+  occasional bursts; load averages are the kernel's 1/5/15 min EMAs of it
+- memory leaks on some hosts until an OOM restart drops it back
+- disks fill up slowly and get cleaned up near full
+- network byte counters only grow, except when the host reboots
+- services flap (go down for a while) and processes come and go
+
+The same seed always yields the same fleet and the same series.
+"""
+import hashlib
+import math
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Column order of FleetSimulator.values (same names as the agent sample)
+COLUMNS = (
+    "cpu_percent", "cpu_cores",
+    "ram_used_gb", "ram_total_gb", "ram_percent",
+    "disk_used_gb", "disk_total_gb", "disk_percent",
+    "network_in_mbps", "network_out_mbps",
+    "network_in_bytes", "network_out_bytes",
+    "uptime_seconds", "processes_count",
+    "load_1", "load_5", "load_15",
+)
+DECIMALS = np.array([1, 0, 2, 1, 1, 1, 1, 1, 2, 2, 0, 0, 0, 0, 2, 2, 2])
+LOAD_WINDOWS = np.array([60.0, 300.0, 900.0])
+
+NOISE_CORRELATION = 60.0  # seconds
+BURST_EVERY = 3 * 3600  # mean seconds between two CPU bursts of one host
+REBOOT_EVERY = 30 * 86400
+SERVICE_FLAP_EVERY = 12 * 3600  # per service
+LEAKING_SHARE = 0.1  # hosts with a memory leak
+
+PROVIDERS = {
+    "OVH": ["GRA (Gravelines, France)", "SBG (Strasbourg, France)", "RBX (Roubaix, France)", "BHS (Beauharnois, Canada)"],
+    "Hetzner": ["FSN1 (Falkenstein, Germany)", "NBG1 (Nuremberg, Germany)", "HEL1 (Helsinki, Finland)"],
+    "Scaleway": ["PAR1 (Paris, France)", "AMS1 (Amsterdam, Netherlands)"],
+    "DigitalOcean": ["FRA1 (Frankfurt, Germany)", "NYC3 (New York, USA)", "SGP1 (Singapore)"],
+}
+SYSTEMS = [
+    ("Ubuntu 22.04.5 LTS", "5.15.0-164-generic"),
+    ("Ubuntu 24.04.1 LTS", "6.8.0-51-generic"),
+    ("Debian GNU/Linux 12 (bookworm)", "6.1.0-28-amd64"),
+]
+
+# name, user, share of the host's CPU, memory percent
+DAEMONS = [
+    ("systemd", "root", 0.01, 0.3), ("sshd", "root", 0.005, 0.2), ("cron", "root", 0.001, 0.1),
+    ("nginx", "www-data", 0.08, 1.2), ("mongod", "mongodb", 0.25, 8.5), ("postgres", "postgres", 0.2, 6.0),
+    ("redis-server", "redis", 0.04, 0.8), ("node", "node", 0.2, 4.2), ("python3", "root", 0.15, 3.5),
+    ("containerd", "root", 0.05, 2.8), ("dockerd", "root", 0.05, 2.1), ("uvicorn", "root", 0.12, 1.5),
+    ("php-fpm", "www-data", 0.1, 2.5), ("fail2ban-server", "root", 0.01, 0.6),
+]
+# Short-lived processes spawned under load
+TRANSIENTS = [("python3", "root"), ("sh", "root"), ("php", "www-data"), ("gzip", "root"),
+              ("rsync", "root"), ("certbot", "root"), ("node", "node")]
+TRANSIENT_LIFETIME = (5, 300)
+TRANSIENT_SPAWN = 30.0
+
+SERVICES = [
+    ("nginx.service", "A high performance web server"),
+    ("mongod.service", "MongoDB Database Server"),
+    ("docker.service", "Docker Application Container Engine"),
+    ("ssh.service", "OpenBSD Secure Shell server"),
+    ("cron.service", "Regular background program processing"),
+    ("ufw.service", "Uncomplicated firewall"),
+    ("fail2ban.service", "Fail2Ban Service"),
+    ("containerd.service", "containerd container runtime"),
+    ("vps-monitor.service", "VPS Monitor Backend"),
+]
+
+APPS = [
+    ("nginx", "1.24.0-1", "1.2 MB"), ("nodejs", "20.11.0", "45.3 MB"), ("python3", "3.10.12", "23.8 MB"),
+    ("mongodb-org", "7.0.5", "178.2 MB"), ("docker-ce", "25.0.3", "89.5 MB"), ("certbot", "2.8.0", "8.7 MB"),
+    ("git", "2.43.0", "12.4 MB"), ("vim", "9.0.2116", "3.2 MB"), ("htop", "3.3.0", "0.3 MB"),
+    ("fail2ban", "1.0.2", "2.8 MB"), ("ufw", "0.36.2", "0.5 MB"), ("postgresql-16", "16.4-1", "52.1 MB"),
+    ("redis-server", "7.0.15", "4.1 MB"), ("php8.3-fpm", "8.3.6", "18.9 MB"), ("curl", "8.5.0", "0.5 MB"),
+]
+
+
+class _ProcessTable:
+    """Processes of one host: its daemons plus transient workers"""
+
+    __slots__ = ("rng", "daemons", "transients", "next_pid", "boots", "updated")
+
+    def __init__(self, rng: np.random.Generator, boots: int, now: float):
+        self.rng = rng
+        picks = rng.choice(len(DAEMONS), size=rng.integers(5, 10), replace=False)
+        self.next_pid = int(rng.integers(300, 900))
+        self.daemons = []
+        for i in sorted(picks):
+            self.daemons.append((self.next_pid, *DAEMONS[i]))
+            self.next_pid += int(rng.integers(1, 40))
+        self.transients: List[tuple] = []  # (pid, name, user, expires_at)
+        self.boots = boots
+        self.updated = now - TRANSIENT_LIFETIME[1]
+
+
+class FleetSimulator:
+    def __init__(self, hosts: int, seed: int = 0, start: Optional[float] = None,
+                 interval: float = 5.0, prefix: str = "sim"):
+        self.seed = seed
+        self.interval = interval
+        self.t = time.time() if start is None else start
+        self.host_ids = [f"{prefix}-{i:05d}" for i in range(hosts)]
+        rng = self.rng = np.random.default_rng(seed)
+
+        # Static profile
+        self.cores = rng.choice([1, 2, 4, 8, 16], hosts, p=[0.1, 0.3, 0.35, 0.2, 0.05]).astype(np.float64)
+        self.ram_total = rng.choice([2, 4, 8, 16, 32, 64], hosts, p=[0.1, 0.25, 0.3, 0.2, 0.1, 0.05]).astype(np.float64)
+        self.disk_total = rng.choice([20, 40, 80, 160, 320, 640], hosts).astype(np.float64)
+        self.tz_hours = rng.integers(-8, 10, hosts)
+        self.cpu_base = rng.uniform(3, 35, hosts)
+        self.cpu_swing = rng.uniform(5, 40, hosts)
+        self.cpu_jitter = rng.uniform(1, 6, hosts)
+        self.ram_base = rng.uniform(0.15, 0.55, hosts)
+        self.leak_rate = np.where(rng.random(hosts) < LEAKING_SHARE, rng.uniform(0.02, 0.2, hosts) / 3600, 0.0)
+        self.disk_growth = rng.uniform(0, 0.5, hosts) / 86400  # GB/s
+        self.net_base = rng.lognormal(np.log(2e5), 1.2, hosts)  # bytes/s inbound
+        self.net_out_ratio = rng.uniform(0.3, 3, hosts)
+        self.proc_base = rng.integers(70, 260, hosts)
+
+        # Evolving state
+        self.noise = rng.standard_normal(hosts)
+        self.burst_left = np.zeros(hosts)
+        self.burst_level = np.zeros(hosts)
+        self.leaked = np.zeros(hosts)
+        self.disk_used = self.disk_total * rng.uniform(0.15, 0.7, hosts)
+        self.net_in = rng.integers(0, 10**12, hosts).astype(np.float64)
+        self.net_out = rng.integers(0, 10**12, hosts).astype(np.float64)
+        self.uptime = rng.uniform(3600, 90 * 86400, hosts)
+        self.boots = np.zeros(hosts, dtype=np.int64)  # reboot count, resets process tables
+        self.cpu = np.clip(self.cpu_base + self.cpu_swing * self._diurnal(), 0, 100)
+        self.load = np.repeat((self.cpu / 100 * self.cores)[:, None], 3, axis=1)
+        self.service_down_until = np.zeros((hosts, len(SERVICES)))
+        self.values = np.zeros((hosts, len(COLUMNS)))
+        self._processes: Dict[int, _ProcessTable] = {}
+        self.step(0.0)
+
+    def __len__(self) -> int:
+        return len(self.host_ids)
+
+    def _diurnal(self) -> np.ndarray:
+        """0 at 04:00, 1 at 16:00 local time of each host"""
+        hour = (self.t / 3600 + self.tz_hours) % 24
+        return 0.5 - 0.5 * np.cos(2 * np.pi * (hour - 4) / 24)
+
+    def step(self, dt: Optional[float] = None) -> np.ndarray:
+        """Advances every host by ``dt`` seconds (default: interval); returns ``values``"""
+        dt = self.interval if dt is None else dt
+        hosts = len(self.host_ids)
+        rng = self.rng
+        self.t += dt
+        diurnal = self._diurnal()
+
+        rho = math.exp(-dt / NOISE_CORRELATION)
+        self.noise = rho * self.noise + math.sqrt(1 - rho * rho) * rng.standard_normal(hosts)
+        burst = rng.random(hosts) < dt / BURST_EVERY
+        self.burst_left = np.where(burst, rng.uniform(15, 300, hosts), self.burst_left - dt)
+        self.burst_level = np.where(burst, rng.uniform(30, 70, hosts), self.burst_level)
+        bursting = self.burst_left > 0
+        self.cpu = np.clip(self.cpu_base + self.cpu_swing * diurnal + self.cpu_jitter * self.noise
+                           + np.where(bursting, self.burst_level, 0.0), 0, 100)
+
+        decay = np.exp(-dt / LOAD_WINDOWS)
+        runnable = self.cpu / 100 * self.cores
+        self.load = self.load * decay + runnable[:, None] * (1 - decay)
+
+        self.leaked += self.leak_rate * dt
+        ram_fraction = self.ram_base + self.leaked + 0.05 * self.cpu / 100
+        oom = ram_fraction > 0.95
+        self.leaked[oom] = 0.0
+
+        self.disk_used += self.disk_growth * dt
+        full = self.disk_used > 0.9 * self.disk_total
+        self.disk_used[full] -= 0.25 * self.disk_total[full]
+
+        rate_in = self.net_base * (0.25 + 0.75 * diurnal) * np.exp(0.3 * rng.standard_normal(hosts))
+        rate_in *= np.where(bursting, 3.0, 1.0)
+        rate_out = rate_in * self.net_out_ratio
+        self.net_in += np.floor(rate_in * dt)
+        self.net_out += np.floor(rate_out * dt)
+        self.uptime += dt
+
+        reboot = rng.random(hosts) < dt / REBOOT_EVERY
+        if reboot.any():
+            self.net_in[reboot] = 0.0
+            self.net_out[reboot] = 0.0
+            self.uptime[reboot] = 0.0
+            self.leaked[reboot] = 0.0
+            self.boots[reboot] += 1
+
+        flap = rng.random(self.service_down_until.shape) < dt / SERVICE_FLAP_EVERY
+        flap &= self.service_down_until <= self.t
+        self.service_down_until[flap] = self.t + rng.uniform(10, 600, int(flap.sum()))
+
+        v = self.values
+        v[:, 0] = self.cpu
+        v[:, 1] = self.cores
+        v[:, 3] = self.ram_total
+        v[:, 4] = np.minimum(ram_fraction, 0.97) * 100
+        v[:, 2] = v[:, 4] / 100 * self.ram_total
+        v[:, 5] = self.disk_used
+        v[:, 6] = self.disk_total
+        v[:, 7] = self.disk_used / self.disk_total * 100
+        v[:, 8] = rate_in * 8 / 1e6
+        v[:, 9] = rate_out * 8 / 1e6
+        v[:, 10] = self.net_in
+        v[:, 11] = self.net_out
+        v[:, 12] = self.uptime
+        v[:, 13] = self.proc_base + np.round(self.cpu / 5) + rng.integers(-3, 4, hosts)
+        v[:, 14:17] = self.load
+        return v
+
+    def advance(self, now: float) -> None:
+        """Catches up with the wall clock in one step"""
+        if now > self.t:
+            self.step(now - self.t)
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.t, timezone.utc)
+
+    def samples(self, hosts: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Current values as agent samples (hostname, ISO timestamp, load_average)"""
+        scale = 10.0 ** DECIMALS
+        rounded = np.round(self.values * scale) / scale
+        rows = rounded.tolist() if hosts is None else rounded[hosts].tolist()
+        indices = range(len(self.host_ids)) if hosts is None else hosts
+        timestamp = self.timestamp.isoformat()
+        result = []
+        for i, row in zip(indices, rows):
+            sample = dict(zip(COLUMNS, row))
+            for field in ("cpu_cores", "network_in_bytes", "network_out_bytes", "uptime_seconds", "processes_count"):
+                sample[field] = int(sample[field])
+            sample["load_average"] = [sample.pop("load_1"), sample.pop("load_5"), sample.pop("load_15")]
+            sample["hostname"] = self.host_ids[i]
+            sample["timestamp"] = timestamp
+            result.append(sample)
+        return result
+
+    def _host_rng(self, host: int, *salt: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, host, *salt])
+
+    def info(self, host: int) -> Dict[str, Any]:
+        rng = self._host_rng(host, 1)
+        provider = list(PROVIDERS)[int(rng.integers(len(PROVIDERS)))]
+        os_name, kernel = SYSTEMS[int(rng.integers(len(SYSTEMS)))]
+        return {
+            "hostname": self.host_ids[host],
+            "ip": f"10.{host >> 16 & 255}.{host >> 8 & 255}.{host & 255}",
+            "os": os_name,
+            "kernel": kernel,
+            "architecture": "x86_64",
+            "provider": provider,
+            "datacenter": PROVIDERS[provider][int(rng.integers(len(PROVIDERS[provider])))],
+        }
+
+    def apps(self, host: int) -> List[Dict[str, Any]]:
+        rng = self._host_rng(host, 2)
+        picks = sorted(rng.choice(len(APPS), size=int(rng.integers(6, len(APPS))), replace=False))
+        return [{"name": name, "version": version, "size": size} for name, version, size in (APPS[i] for i in picks)]
+
+    def services(self, host: int) -> List[Dict[str, Any]]:
+        down = self.service_down_until[host] > self.t
+        return [
+            {
+                "name": name,
+                "status": "inactive (dead)" if is_down else "active (running)",
+                "active": not is_down,
+                "description": description,
+            }
+            for (name, description), is_down in zip(SERVICES, down.tolist())
+        ]
+
+    def processes(self, host: int, top: int = 20) -> List[Dict[str, Any]]:
+        """Top processes by CPU; transient workers spawn with load and expire"""
+        table = self._processes.get(host)
+        boots = int(self.boots[host])
+        if table is None or table.boots != boots:
+            table = self._processes[host] = _ProcessTable(self._host_rng(host, 3, boots), boots, self.t)
+        rng = table.rng
+        cpu_total = float(self.cpu[host] * self.cores[host])
+        table.transients = [p for p in table.transients if p[3] > self.t]
+        # About one spawn per busy core every TRANSIENT_SPAWN seconds
+        spawns = rng.poisson(cpu_total / 100 * max(self.t - table.updated, 0) / TRANSIENT_SPAWN)
+        table.updated = self.t
+        for _ in range(int(spawns)):
+            name, user = TRANSIENTS[int(rng.integers(len(TRANSIENTS)))]
+            table.transients.append((table.next_pid, name, user, self.t + rng.uniform(*TRANSIENT_LIFETIME)))
+            table.next_pid += int(rng.integers(1, 25))
+
+        result = []
+        shares = rng.dirichlet(np.ones(len(table.daemons) + len(table.transients)) * 2).tolist()
+        weights = [share for _, _, _, share, _ in table.daemons]
+        scale = sum(weights) or 1.0
+        for (pid, name, user, share, mem), noise in zip(table.daemons, shares):
+            result.append({"pid": pid, "name": name, "cpu_percent": round(cpu_total * (0.7 * share / scale + 0.3 * noise), 1),
+                           "memory_percent": round(mem * (1 + 0.1 * noise), 1),
+                           "status": "running" if noise > 0.15 else "sleeping", "user": user,
+                           "cmdline_hash": cmdline_hash(f"/usr/sbin/{name}")})
+        for (pid, name, user, _), noise in zip(table.transients, shares[len(table.daemons):]):
+            # A few distinct jobs per program, so one name maps to several command lines
+            result.append({"pid": pid, "name": name, "cpu_percent": round(cpu_total * 0.3 * noise, 1),
+                           "memory_percent": round(0.1 + noise, 1), "status": "running", "user": user,
+                           "cmdline_hash": cmdline_hash(f"{name}\0job-{pid % 4}")})
+        result.sort(key=lambda p: p["cpu_percent"], reverse=True)
+        return result[:top]
+
+
+def cmdline_hash(cmdline: str) -> str:
+    """Same digest as the agent's (blake2b, 6 bytes) over a made-up command line"""
+    return hashlib.blake2b(cmdline.encode(), digest_size=6).hexdigest()
+
+
+def stable_seed(text: str) -> int:
+    """Seed derived from a name, stable across runs (unlike hash())"""
+    return zlib.crc32(text.encode())
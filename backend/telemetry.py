@@ -0,0 +1,171 @@
+"""Prometheus text exposition for the monitor's own hot paths
+
+Counters and histograms are plain objects bound to their label values once
+(route, sink...): recording is an attribute increment and a bisect, with no
+lock (the event loop is single-threaded) and no label dict per call.
+Everything else (queue depths, cache ratios, fleet samples) is read from
+its owner at scrape time by collector callbacks.
+"""
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, type, help, [(labels, value), ...]) as produced by collectors
+Family = Tuple[str, str, str, List[Tuple[Labels, float]]]
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    __slots__ = ("labels", "value")
+
+    def __init__(self, labels: Labels = ()):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ("labels", "bounds", "counts", "sum")
+
+    def __init__(self, labels: Labels = (), bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.labels = labels
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class MetricFamily:
+    """Children of one metric name, created once per label values and kept"""
+
+    def __init__(self, name: str, kind: str, help: str, label_names: Tuple[str, ...] = (),
+                 bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.label_names = label_names
+        self.bounds = bounds
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            labels = tuple(zip(self.label_names, values))
+            child = Histogram(labels, self.bounds) if self.kind == "histogram" else Counter(labels)
+            self._children[values] = child
+        return child
+
+    def render(self, lines: List[str]) -> None:
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for child in list(self._children.values()):
+            if self.kind == "counter":
+                lines.append(f"{self.name}{format_labels(child.labels)} {format_value(child.value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+                cumulative += count
+                le = 'le="' + format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{format_labels(child.labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(child.labels)} {format_value(child.sum)}")
+            lines.append(f"{self.name}_count{format_labels(child.labels)} {cumulative}")
+
+
+class Registry:
+    def __init__(self):
+        self._families: List[MetricFamily] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, help: str, label_names: Tuple[str, ...] = ()) -> MetricFamily:
+        family = MetricFamily(name, "counter", help, label_names)
+        self._families.append(family)
+        return family
+
+    def histogram(self, name: str, help: str, label_names: Tuple[str, ...] = (),
+                  bounds: Tuple[float, ...] = LATENCY_BUCKETS) -> MetricFamily:
+        family = MetricFamily(name, "histogram", help, label_names, bounds)
+        self._families.append(family)
+        return family
+
+    def collector(self, func: Callable[[], Iterable[Family]]) -> Callable[[], Iterable[Family]]:
+        """Registers a scrape-time callback yielding (name, type, help, samples)"""
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for family in self._families:
+            family.render(lines)
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class RouteLatencyMiddleware:
+    """ASGI middleware timing every HTTP request up to its response headers.
+
+    Streaming routes (SSE, exports) are thereby timed to their first byte
+    rather than to the end of the stream. Requests are labelled with the
+    matched route's path template, bound once per route.
+    """
+
+    def __init__(self, app, histograms: MetricFamily):
+        self.app = app
+        self.histograms = histograms
+        self._bound: Dict[int, Histogram] = {}
+        self._unmatched = histograms.labels("unmatched", "")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                self._histogram(scope.get("route")).observe(time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+    def _histogram(self, route: Optional[Any]) -> Histogram:
+        if route is None:
+            return self._unmatched
+        # Routes define __eq__ (unhashable) and live as long as the app: key by id
+        histogram = self._bound.get(id(route))
+        if histogram is None:
+            methods = ",".join(sorted(getattr(route, "methods", None) or ()))
+            histogram = self._bound[id(route)] = self.histograms.labels(route.path, methods)
+        return histogram
@@ -0,0 +1,359 @@
+"""Bucketed time-series storage with incremental multi-resolution rollups
+
+Raw samples are appended to one document per host per RAW_WINDOW seconds,
+holding a timestamp array and one fixed-width numeric array per field.
+Every flush also folds the samples into 1 min / 5 min / 1 h rollup
+documents (count, sum, min, max per field) with $inc/$min/$max upserts,
+so long-range queries never touch raw data. Closed raw buckets are later
+rewritten into one compressed block (see codec.py and retention.py).
+"""
+import math
+import struct
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import bson
+import numpy as np
+from bson import Binary
+from pymongo import ASCENDING, UpdateOne
+
+from codec import decode_block, encode_block
+from downsample import downsample
+
+RAW_WINDOW = 3600
+ROLLUP_RESOLUTIONS = (60, 300, 3600)
+
+# Numeric fields kept per sample; load_average is flattened into load_1/5/15
+# and the agent's own cost (agent_stats) into agent_*
+FIELDS = (
+    "cpu_percent", "cpu_cores",
+    "ram_used_gb", "ram_total_gb", "ram_percent",
+    "disk_used_gb", "disk_total_gb", "disk_percent",
+    "network_in_mbps", "network_out_mbps",
+    "network_in_bytes", "network_out_bytes",
+    "uptime_seconds", "processes_count",
+    "load_1", "load_5", "load_15",
+    "agent_cpu_percent", "agent_rss_mb", "agent_collect_ms", "agent_push_ms", "agent_spool",
+)
+LOAD_FIELDS = ("load_1", "load_5", "load_15")
+AGENT_FIELDS = {"agent_cpu_percent": "cpu_percent", "agent_rss_mb": "rss_mb", "agent_collect_ms": "collect_ms",
+                "agent_push_ms": "push_ms", "agent_spool": "spool"}
+FIELD_INDEX = {field: j for j, field in enumerate(FIELDS)}
+
+SCAN_BATCH = 16  # documents per cursor batch when scanning; bounds memory of exports
+
+
+def to_values(sample: Dict[str, Any]) -> List[float]:
+    """Flattens a sample into a FIELDS-ordered list, NaN for missing values"""
+    load = sample.get("load_average") or ()
+    flat = dict(zip(LOAD_FIELDS, load))
+    agent = sample.get("agent_stats") or {}
+    flat.update((field, agent.get(key)) for field, key in AGENT_FIELDS.items())
+    values = []
+    for field in FIELDS:
+        value = flat.get(field, sample.get(field))
+        values.append(float(value) if isinstance(value, (int, float)) else math.nan)
+    return values
+
+
+def to_sample(ts_ms: int, values: Iterable[Optional[float]]) -> Dict[str, Any]:
+    """Inverse of to_values: rebuilds the API sample shape"""
+    sample: Dict[str, Any] = {"timestamp": datetime.fromtimestamp(ts_ms / 1000, timezone.utc).isoformat()}
+    for field, value in zip(FIELDS, values):
+        sample[field] = None if value is None or math.isnan(value) else value
+    sample["load_average"] = [sample.pop(field) for field in LOAD_FIELDS]
+    return sample
+
+
+def to_samples(ts: np.ndarray, values: np.ndarray) -> List[Dict[str, Any]]:
+    return [to_sample(ts_ms, row) for ts_ms, row in zip(ts.tolist(), values.tolist())]
+
+
+def to_columnar(ts: np.ndarray, values: np.ndarray) -> Dict[str, Any]:
+    """Column per field, with fields holding a single value hoisted into ``constants``"""
+    result: Dict[str, Any] = {"timestamps": ts.tolist(), "constants": {}}
+    for j, field in enumerate(FIELDS):
+        col = values[:, j]
+        missing = np.isnan(col)
+        if missing.all():
+            result["constants"][field] = None
+        elif not missing.any() and (col == col[0]).all():
+            result["constants"][field] = col[0].item()
+        elif missing.any():
+            result[field] = np.where(missing, None, col.astype(object)).tolist()
+        else:
+            result[field] = col.tolist()
+    return result
+
+
+# Packed history: header, space-padded field names, float64 timestamps (epoch ms),
+# then one float32 column per field (NaN = missing). Sections are 8-byte aligned
+# so a browser can map them with Float64Array / Float32Array directly.
+PACKED_MAGIC = b"VPSH"
+PACKED_VERSION = 1
+PACKED_HEADER = struct.Struct("<4sBxHII")  # magic, version, fields, rows, names length
+
+
+def to_packed(ts: np.ndarray, values: np.ndarray) -> bytes:
+    names = ",".join(FIELDS).encode()
+    names += b" " * (-(PACKED_HEADER.size + len(names)) % 8)
+    header = PACKED_HEADER.pack(PACKED_MAGIC, PACKED_VERSION, len(FIELDS), len(ts), len(names))
+    columns = np.ascontiguousarray(values.T, dtype="<f4")
+    return b"".join((header, names, ts.astype("<f8").tobytes(), columns.tobytes()))
+
+
+def bucket_rows(doc: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Timestamps and (rows, FIELDS) values of a raw bucket, unsorted.
+
+    A compacted bucket keeps its block; samples pushed after compaction
+    (late or backfilled) land in the arrays next to it.
+    """
+    ts_parts, value_parts = [], []
+    if "block" in doc:
+        ts, columns = decode_block(doc["block"])
+        values = np.full((len(ts), len(FIELDS)), np.nan)
+        for j, field in enumerate(doc["fields"]):
+            if field in FIELD_INDEX:
+                values[:, FIELD_INDEX[field]] = columns[:, j]
+        ts_parts.append(ts)
+        value_parts.append(values)
+    if "ts" in doc:
+        ts = np.asarray(doc["ts"], dtype=np.int64)
+        values = np.full((len(ts), len(FIELDS)), np.nan)
+        for j, field in enumerate(FIELDS):
+            col = doc["v"].get(field, [])[:len(ts)]
+            # A field added to FIELDS while the bucket was open only has its latest rows
+            values[len(ts) - len(col):, j] = np.asarray(col, dtype=np.float64)
+        ts_parts.append(ts)
+        value_parts.append(values)
+    if len(ts_parts) == 1:
+        return ts_parts[0], value_parts[0]
+    if not ts_parts:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(FIELDS)))
+    return np.concatenate(ts_parts), np.concatenate(value_parts)
+
+
+def bucket_column(doc: Dict[str, Any], field: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Timestamps and values of one field of a raw bucket, unsorted; decodes
+    only that column of a compacted block"""
+    ts_parts, value_parts = [], []
+    if "block" in doc:
+        fields = doc["fields"]
+        ts, columns = decode_block(doc["block"], [fields.index(field)] if field in fields else [])
+        ts_parts.append(ts)
+        value_parts.append(columns[:, 0] if field in fields else np.full(len(ts), np.nan))
+    if "ts" in doc:
+        ts = np.asarray(doc["ts"], dtype=np.int64)
+        values = np.full(len(ts), np.nan)
+        col = doc["v"].get(field, [])[:len(ts)]
+        values[len(ts) - len(col):] = np.asarray(col, dtype=np.float64)
+        ts_parts.append(ts)
+        value_parts.append(values)
+    if not ts_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(ts_parts), np.concatenate(value_parts)
+
+
+def pick_resolution(span_seconds: int, points: int) -> int:
+    """Coarsest rollup resolution still yielding ``points`` points, 0 for raw"""
+    for res in reversed(ROLLUP_RESOLUTIONS):
+        if span_seconds / res >= points:
+            return res
+    return 0
+
+
+class TimeSeriesStore:
+    def __init__(self, db):
+        self.raw = db.metrics_buckets
+        self.rollups = db.metrics_rollups
+
+    async def ensure_indexes(self) -> None:
+        await self.raw.create_index([("host", ASCENDING), ("start", ASCENDING)])
+        await self.rollups.create_index([("host", ASCENDING), ("res", ASCENDING), ("start", ASCENDING)])
+        # Retention drops and compaction select buckets by age across hosts
+        await self.raw.create_index([("start", ASCENDING)])
+        await self.rollups.create_index([("res", ASCENDING), ("start", ASCENDING)])
+
+    async def write(self, batch: List[Dict[str, Any]]) -> None:
+        """Appends samples to their raw buckets and updates every rollup"""
+        buckets: Dict[Tuple[str, int], List[Tuple[int, List[float]]]] = defaultdict(list)
+        for sample in batch:
+            ts_ms = int(sample["timestamp"].timestamp() * 1000)
+            start = ts_ms // 1000 // RAW_WINDOW * RAW_WINDOW
+            buckets[(sample["hostname"], start)].append((ts_ms, to_values(sample)))
+
+        raw_ops = []
+        rollups: Dict[Tuple[str, int, int], Dict[str, Dict[str, float]]] = {}
+        for (host, start), rows in buckets.items():
+            push = {"ts": {"$each": [ts for ts, _ in rows]}}
+            for i, field in enumerate(FIELDS):
+                push[f"v.{field}"] = {"$each": [values[i] for _, values in rows]}
+            raw_ops.append(UpdateOne(
+                {"_id": f"{host}|{start}"},
+                {"$setOnInsert": {"host": host, "start": start}, "$push": push, "$inc": {"n": len(rows)}},
+                upsert=True,
+            ))
+            for ts_ms, values in rows:
+                for res in ROLLUP_RESOLUTIONS:
+                    key = (host, res, ts_ms // 1000 // res * res)
+                    if key not in rollups:
+                        rollups[key] = {"n": {}, "sum": {}, "min": {}, "max": {}}
+                    _fold(rollups[key], values)
+
+        rollup_ops = [
+            UpdateOne(
+                {"_id": f"{host}|{res}|{start}"},
+                {
+                    "$setOnInsert": {"host": host, "res": res, "start": start},
+                    "$inc": {**{f"n.{k}": v for k, v in agg["n"].items()},
+                             **{f"sum.{k}": v for k, v in agg["sum"].items()}},
+                    "$min": {f"min.{k}": v for k, v in agg["min"].items()},
+                    "$max": {f"max.{k}": v for k, v in agg["max"].items()},
+                },
+                upsert=True,
+            )
+            for (host, res, start), agg in rollups.items() if agg["n"]
+        ]
+        if raw_ops:
+            await self.raw.bulk_write(raw_ops, ordered=False)
+        if rollup_ops:
+            await self.rollups.bulk_write(rollup_ops, ordered=False)
+
+    async def history(self, host: str, since: datetime, until: datetime, points: int,
+                      max_points: Optional[int] = None, method: str = "lttb",
+                      field: str = "cpu_percent") -> Tuple[np.ndarray, np.ndarray]:
+        """Timestamps and (rows, FIELDS) values for [since, until] from the coarsest
+        resolution giving ``points`` points; see to_sample/to_columnar/to_packed.
+
+        With ``max_points`` the resolution is chosen for up to that many points
+        and the result downsampled to about that many rows, picked on ``field``
+        (see downsample.py).
+        """
+        res = pick_resolution(int((until - since).total_seconds()), max(points, max_points or 0))
+        if res:
+            ts, values = await self._read_rollups(host, res, since, until)
+        else:
+            ts, values = await self._read_raw(host, since, until)
+        if max_points and len(ts) > max_points:
+            keep = downsample(ts, values[:, FIELDS.index(field)], max_points, method)
+            ts, values = ts[keep], values[keep]
+        return ts, values
+
+    async def _read_raw(self, host: str, since: datetime, until: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """Raw samples as a timestamp column and a (rows, FIELDS) value matrix"""
+        lo, hi = int(since.timestamp() * 1000), int(until.timestamp() * 1000)
+        ts_parts, value_parts = [], []
+        cursor = self.raw.find(
+            {"host": host, "start": {"$gte": lo // 1000 // RAW_WINDOW * RAW_WINDOW, "$lte": hi // 1000}},
+        ).sort("start", ASCENDING)
+        async for doc in cursor:
+            ts, values = bucket_rows(doc)
+            mask = (ts >= lo) & (ts <= hi)
+            ts_parts.append(ts[mask])
+            value_parts.append(values[mask])
+        if not ts_parts:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(FIELDS)))
+        ts, values = np.concatenate(ts_parts), np.concatenate(value_parts)
+        order = np.argsort(ts, kind="stable")
+        return ts[order], values[order]
+
+    async def _read_rollups(self, host: str, res: int, since: datetime,
+                            until: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        cursor = self.rollups.find(
+            {"host": host, "res": res,
+             "start": {"$gte": int(since.timestamp()) // res * res, "$lte": int(until.timestamp())}},
+        ).sort("start", ASCENDING)
+        ts, rows = [], []
+        async for doc in cursor:
+            counts, sums = doc.get("n", {}), doc.get("sum", {})
+            ts.append(doc["start"] * 1000)
+            rows.append([round(sums[f] / counts[f], 2) if counts.get(f) else math.nan for f in FIELDS])
+        return np.asarray(ts, dtype=np.int64), np.asarray(rows, dtype=np.float64).reshape(-1, len(FIELDS))
+
+    async def scan(self, host: Optional[str], since: datetime, until: datetime,
+                   res: int = 0) -> AsyncIterator[Tuple[str, List[int], Dict[str, List[Optional[float]]]]]:
+        """Streams (host, timestamps, columns) one stored document at a time.
+
+        Documents come ordered by host then time, rows inside one document are
+        sorted; all hosts are scanned when ``host`` is None. ``res`` picks a
+        rollup resolution (averages), 0 reads raw samples.
+        """
+        lo, hi = int(since.timestamp() * 1000), int(until.timestamp() * 1000)
+        if res:
+            collection = self.rollups
+            query = {"res": res, "start": {"$gte": lo // 1000 // res * res, "$lte": hi // 1000}}
+        else:
+            collection = self.raw
+            query = {"start": {"$gte": lo // 1000 // RAW_WINDOW * RAW_WINDOW, "$lte": hi // 1000}}
+        if host is not None:
+            query["host"] = host
+        cursor = collection.find(query).sort([("host", ASCENDING), ("start", ASCENDING)]).batch_size(SCAN_BATCH)
+        async for doc in cursor:
+            if res:
+                counts, sums = doc.get("n", {}), doc.get("sum", {})
+                yield doc["host"], [doc["start"] * 1000], {
+                    f: [sums[f] / counts[f] if counts.get(f) else None] for f in FIELDS
+                }
+                continue
+            ts, values = bucket_rows(doc)
+            rows = np.flatnonzero((ts >= lo) & (ts <= hi))
+            if not len(rows):
+                continue
+            rows = rows[np.argsort(ts[rows], kind="stable")]
+            yield doc["host"], ts[rows].tolist(), {field: values[rows, j].tolist() for j, field in enumerate(FIELDS)}
+
+    async def rollup_stats(self, hosts: List[str], field: str, res: int, since: datetime,
+                           until: datetime) -> List[Dict[str, Any]]:
+        """Per host: the sample counts and sums of each ``res`` rollup holding
+        ``field``, and its overall min and max. Grouped by MongoDB, so a day
+        of 1,000 hosts comes back as 1,000 documents."""
+        pipeline = [
+            {"$match": {"host": {"$in": hosts}, "res": res, f"n.{field}": {"$gt": 0},
+                        "start": {"$gte": int(since.timestamp()) // res * res, "$lte": int(until.timestamp())}}},
+            {"$group": {"_id": "$host", "n": {"$push": f"$n.{field}"}, "sum": {"$push": f"$sum.{field}"},
+                        "min": {"$min": f"$min.{field}"}, "max": {"$max": f"$max.{field}"}}},
+        ]
+        return [doc async for doc in self.rollups.aggregate(pipeline)]
+
+    async def raw_buckets(self, hosts: List[str], field: str, since: datetime,
+                          until: datetime) -> List[Dict[str, Any]]:
+        """Raw buckets of ``hosts`` overlapping [since, until], with only ``field``
+        of the arrays (compacted blocks come whole); see bucket_column"""
+        lo, hi = int(since.timestamp()), int(until.timestamp())
+        cursor = self.raw.find(
+            {"host": {"$in": hosts}, "start": {"$gte": lo // RAW_WINDOW * RAW_WINDOW, "$lte": hi}},
+            projection={"host": 1, "ts": 1, f"v.{field}": 1, "fields": 1, "block": 1},
+        )
+        return await cursor.to_list(None)
+
+    def uncompacted(self, since: int, until: int):
+        """Cursor over raw buckets starting in [since, until) that still hold arrays"""
+        return self.raw.find({"start": {"$gte": since, "$lt": until}, "ts": {"$exists": True}})
+
+    async def compact(self, doc: Dict[str, Any]) -> Optional[int]:
+        """Rewrites a raw bucket as one sorted, compressed block; returns the BSON bytes saved,
+        or None when a push changed the bucket since it was read"""
+        ts, values = bucket_rows(doc)
+        order = np.argsort(ts, kind="stable")
+        compacted = {"_id": doc["_id"], "host": doc["host"], "start": doc["start"], "n": doc.get("n"),
+                     "fields": list(FIELDS), "block": Binary(encode_block(ts[order], values[order]))}
+        result = await self.raw.replace_one({"_id": doc["_id"], "n": doc.get("n")}, compacted)
+        if not result.modified_count:
+            return None
+        return len(bson.encode(doc)) - len(bson.encode(compacted))
+
+
+def _fold(agg: Dict[str, Dict[str, float]], values: List[float]) -> None:
+    for field, value in zip(FIELDS, values):
+        if math.isnan(value):
+            continue
+        if field in agg["n"]:
+            agg["n"][field] += 1
+            agg["sum"][field] += value
+            agg["min"][field] = min(agg["min"][field], value)
+            agg["max"][field] = max(agg["max"][field], value)
+        else:
+            agg["n"][field] = 1
+            agg["sum"][field] = value
+            agg["min"][field] = agg["max"][field] = value
@@ -9,6 +9,7 @@ import sys
 import json
 from datetime import datetime
 from typing import Dict, Any, Optional
+from urllib.parse import quote
 
 class MatrixVPSAPITester:
     def __init__(self, base_url: str = "https://ovh-dashboard.preview.emergentagent.com"):
@@ -207,6 +208,37 @@ class MatrixVPSAPITester:
             self.log_test("Processes endpoint (/processes)", False, 
                          "Invalid response format" if success else data.get('error', 'Unknown error'))
 
+    def check_inventory_page(self, label: str, endpoint: str, required_fields: list) -> Optional[list]:
+        """Walk a paginated inventory endpoint ({items, total, next, version, hash}) through `next`"""
+        page_keys = ['items', 'total', 'next', 'version', 'hash']
+        items, after = [], None
+        while True:
+            query = f"{endpoint}?limit=5" + (f"&after={quote(after)}" if after else "")
+            success, data = self.make_request('GET', query, use_auth=True)
+            if not success or not isinstance(data, dict) or any(key not in data for key in page_keys):
+                self.log_test(f"{label} endpoint ({endpoint})", False,
+                              "Invalid page format" if success else data.get('error', 'Unknown error'))
+                return None
+            if len(data['items']) > 5:
+                self.log_test(f"{label} pagination", False, f"Page of {len(data['items'])} items for limit=5")
+                return None
+            items.extend(data['items'])
+            after = data['next']
+            if after is None:
+                break
+        names = [item.get('name') for item in items]
+        if len(names) != data['total'] or len(set(names)) != len(names):
+            self.log_test(f"{label} pagination", False, f"{len(names)} items over pages, total {data['total']}")
+            return None
+        if not items:
+            self.log_test(f"{label} endpoint ({endpoint})", False, f"Empty {label.lower()} list")
+            return None
+        missing_fields = [field for field in required_fields if field not in items[0]]
+        if missing_fields:
+            self.log_test(f"{label} structure", False, f"Missing fields: {missing_fields}")
+            return None
+        return items
+
     def test_services_endpoint(self):
         """Test services endpoint"""
         print("\n🔍 Testing Services Endpoint...")
@@ -215,23 +247,11 @@ class MatrixVPSAPITester:
             self.log_test("Services endpoint", False, "No token available")
             return
 
-        success, data = self.make_request('GET', '/services', use_auth=True)
-        if success and isinstance(data, list):
-            if data:
-                required_fields = ['name', 'status', 'active', 'description']
-                first_service = data[0]
-                missing_fields = [field for field in required_fields if field not in first_service]
-                if missing_fields:
-                    self.log_test("Services structure", False, f"Missing fields: {missing_fields}")
-                else:
-                    active_services = sum(1 for svc in data if svc.get('active', False))
-                    self.log_test("Services endpoint (/services)", True, 
-                                 f"Services: {len(data)}, Active: {active_services}")
-            else:
-                self.log_test("Services endpoint (/services)", False, "Empty services list")
-        else:
-            self.log_test("Services endpoint (/services)", False,
-                         "Invalid response format" if success else data.get('error', 'Unknown error'))
+        services = self.check_inventory_page("Services", '/services', ['name', 'status', 'active', 'description'])
+        if services is not None:
+            active_services = sum(1 for svc in services if svc.get('active', False))
+            self.log_test("Services endpoint (/services)", True,
+                         f"Services: {len(services)}, Active: {active_services}")
 
     def test_apps_endpoint(self):
         """Test installed apps endpoint"""
@@ -241,21 +261,9 @@ class MatrixVPSAPITester:
             self.log_test("Apps endpoint", False, "No token available")
             return
 
-        success, data = self.make_request('GET', '/apps', use_auth=True)
-        if success and isinstance(data, list):
-            if data:
-                required_fields = ['name', 'version', 'size']
-                first_app = data[0]
-                missing_fields = [field for field in required_fields if field not in first_app]
-                if missing_fields:
-                    self.log_test("Apps structure", False, f"Missing fields: {missing_fields}")
-                else:
-                    self.log_test("Apps endpoint (/apps)", True, f"Installed apps: {len(data)}")
-            else:
-                self.log_test("Apps endpoint (/apps)", False, "Empty apps list")
-        else:
-            self.log_test("Apps endpoint (/apps)", False,
-                         "Invalid response format" if success else data.get('error', 'Unknown error'))
+        apps = self.check_inventory_page("Apps", '/apps', ['name', 'version', 'size'])
+        if apps is not None:
+            self.log_test("Apps endpoint (/apps)", True, f"Installed apps: {len(apps)}")
 
     def test_vps_info_endpoint(self):
         """Test VPS info endpoint"""
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Agent collector benchmark - psutil backend vs /proc reader
+
+Measures the CPU time of one collection cycle and of one process scan for
+each backend. That both return the same values is checked by
+tests/test_procreader.py.
+
+Usage: python benchmarks/bench_agent.py [--cycles 200]
+"""
+
+import argparse
+import importlib.util
+import json
+import time
+from pathlib import Path
+
+AGENT_PATH = Path(__file__).resolve().parent.parent / "scripts" / "vps-monitor-agent.py"
+
+
+def load_agent():
+    spec = importlib.util.spec_from_file_location("vps_monitor_agent", AGENT_PATH)
+    agent = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(agent)
+    return agent
+
+
+def cpu_cost(func, cycles):
+    """Mean CPU time (µs) of one call"""
+    func()
+    start = time.process_time()
+    for _ in range(cycles):
+        func()
+    return (time.process_time() - start) / cycles * 1e6
+
+
+def run(cycles=200):
+    agent = load_agent()
+    reader = agent.ProcReader()
+    sampler = agent.ProcessSampler()
+    results = {
+        "cycle_us": {
+            "psutil": cpu_cost(agent.collect_all_metrics, cycles),
+            "proc": cpu_cost(reader.collect_all_metrics, cycles),
+        },
+        "processes_us": {
+            "psutil": cpu_cost(sampler.sample, max(cycles // 10, 1)),
+            "proc": cpu_cost(reader.get_processes, max(cycles // 10, 1)),
+        },
+    }
+    reader.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=200)
+    args = parser.parse_args()
+
+    results = run(args.cycles)
+    print(json.dumps(results, indent=2))
+    for name in ("cycle_us", "processes_us"):
+        costs = results[name]
+        print(f"{name}: psutil {costs['psutil']:.0f} µs, proc {costs['proc']:.0f} µs "
+              f"({costs['psutil'] / costs['proc']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Alert engine benchmark - rule evaluation cost at fleet scale
+
+Feeds one sample per host per cycle (5 s agent cadence) through an
+AlertEngine loaded with N rules mixing plain, rate and windowed average
+rules, and reports how much of one core a cycle costs.
+
+Usage: python benchmarks/bench_alerts.py [--hosts 1000] [--rules 20] [--cycles 30]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from alerts import AlertEngine  # noqa: E402
+
+CADENCE = 5  # seconds between two samples of the same host
+
+RULE_TEMPLATES = [
+    {"field": "cpu_percent", "threshold": 90, "clear": 80, "for": "2m"},
+    {"field": "ram_percent", "threshold": 90, "clear": 85, "for": "2m"},
+    {"field": "disk_percent", "threshold": 90, "clear": 85, "for": "5m"},
+    {"field": "load_1", "threshold": 4, "mode": "avg", "window": "5m"},
+    {"field": "network_in_bytes", "threshold": 12_500_000, "mode": "rate", "for": "1m"},
+]
+
+
+def make_rules(count):
+    rules = []
+    for i in range(count):
+        rule = dict(RULE_TEMPLATES[i % len(RULE_TEMPLATES)], id=f"rule_{i}")
+        rule["threshold"] = rule["threshold"] * (1 + i // len(RULE_TEMPLATES) * 0.01)
+        rules.append(rule)
+    return rules
+
+
+def make_sample(host_id, ts, counter):
+    return {
+        "hostname": host_id,
+        "timestamp": ts,
+        "cpu_percent": random.uniform(5, 100),
+        "ram_percent": random.uniform(10, 100),
+        "disk_percent": random.uniform(20, 95),
+        "network_in_bytes": counter,
+        "load_average": [random.uniform(0, 8), 0.4, 0.3],
+    }
+
+
+def run(hosts=1000, rules=20, cycles=30):
+    random.seed(42)
+    engine = AlertEngine(make_rules(rules))
+    host_ids = [f"vps-{i:05d}" for i in range(hosts)]
+    start_ts = datetime.now(timezone.utc)
+    counters = [0] * hosts
+
+    cycle_cpu = []
+    transitions = 0
+    for cycle in range(cycles):
+        ts = start_ts + timedelta(seconds=cycle * CADENCE)
+        batch = []
+        for i, host_id in enumerate(host_ids):
+            counters[i] += random.randint(0, 150_000_000)
+            batch.append(make_sample(host_id, ts, counters[i]))
+
+        start = time.process_time()
+        for sample in batch:
+            transitions += len(engine.evaluate(sample))
+        cycle_cpu.append(time.process_time() - start)
+
+    mean_cpu = sum(cycle_cpu) / cycles
+    return {
+        "hosts": hosts,
+        "rules": rules,
+        "evaluations_per_sec": hosts * rules / mean_cpu,
+        "cycle_cpu_ms": mean_cpu * 1000,
+        "core_fraction": mean_cpu / CADENCE,
+        "transitions": transitions,
+        "active": len(engine.active),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--rules", type=int, default=20)
+    parser.add_argument("--cycles", type=int, default=30)
+    args = parser.parse_args()
+    print(json.dumps(run(args.hosts, args.rules, args.cycles), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Bucket codec benchmark - compressed blocks vs BSON arrays
+
+Fills one-hour raw buckets from the fleet simulator, then compares the BSON
+size of the array layout written at ingest with the compacted block, times
+encode/decode and checks that every bucket round-trips bit for bit.
+
+Usage: python benchmarks/bench_codec.py [--hosts 20] [--interval 5]
+Exit code 1 if a bucket does not decode to its original values.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import bson
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from codec import decode_block, encode_block  # noqa: E402
+from simulator import FleetSimulator  # noqa: E402
+from tsstore import FIELDS, RAW_WINDOW, to_values  # noqa: E402
+
+
+def make_buckets(hosts, interval, seed=0):
+    """(ts, values) of one raw bucket per host"""
+    sim = FleetSimulator(hosts, seed=seed, interval=interval)
+    rows = [[] for _ in range(hosts)]
+    stamps = []
+    for _ in range(int(RAW_WINDOW / interval)):
+        sim.step()
+        stamps.append(int(sim.timestamp.timestamp() * 1000))
+        for i, sample in enumerate(sim.samples()):
+            rows[i].append(to_values(sample))
+    ts = np.asarray(stamps, dtype=np.int64)
+    return [(ts, np.asarray(values)) for values in rows]
+
+
+def bson_size(ts, values):
+    """Size of the raw bucket layout: a ts array and one array per sample"""
+    return len(bson.encode({"ts": ts.tolist(), "v": values.tolist()}))
+
+
+def same(a, b):
+    return a.shape == b.shape and np.array_equal(a.view(np.uint64), b.view(np.uint64))
+
+
+def run(hosts=20, interval=5.0, repeat=3):
+    buckets = make_buckets(hosts, interval)
+    points = sum(values.size for _, values in buckets)
+
+    best_encode = best_decode = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        blocks = [encode_block(ts, values) for ts, values in buckets]
+        best_encode = min(best_encode, time.perf_counter() - start)
+        start = time.perf_counter()
+        decoded = [decode_block(block) for block in blocks]
+        best_decode = min(best_decode, time.perf_counter() - start)
+
+    errors = [f"bucket {i} differs after decoding" for i, ((ts, values), (ts2, values2))
+              in enumerate(zip(buckets, decoded)) if not (np.array_equal(ts, ts2) and same(values, values2))]
+    bson_bytes = sum(bson_size(ts, values) for ts, values in buckets)
+    float_bytes = sum(ts.nbytes + values.nbytes for ts, values in buckets)
+    block_bytes = sum(len(block) for block in blocks)
+    return {
+        "buckets": hosts,
+        "rows_per_bucket": len(buckets[0][0]),
+        "fields": len(FIELDS),
+        "bson_bytes_per_bucket": bson_bytes / hosts,
+        "block_bytes_per_bucket": block_bytes / hosts,
+        "ratio_vs_bson": bson_bytes / block_bytes,
+        "ratio_vs_float64": float_bytes / block_bytes,
+        "bits_per_value": block_bytes * 8 / points,
+        "encode_ms_per_bucket": best_encode * 1000 / hosts,
+        "decode_points_per_sec": points / best_decode,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=20, help="buckets to encode, one per host")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between two samples")
+    args = parser.parse_args()
+
+    results = run(args.hosts, args.interval)
+    print(json.dumps(results, indent=2))
+    if results["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
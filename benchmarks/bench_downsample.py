@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Downsampling benchmark - NumPy LTTB / min-max vs a naive Python loop
+
+Builds a CPU-like series with a few one-sample spikes, downsamples it to a
+chart-sized number of points and checks that the vectorized LTTB picks the
+same points as the reference loop and that every spike survives.
+
+Usage: python benchmarks/bench_downsample.py [--points 50000] [--max-points 500]
+Exit code 1 if the results differ or a spike is lost.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from downsample import lttb, minmax  # noqa: E402
+
+
+def naive_lttb(xs, ys, threshold):
+    """Textbook LTTB over Python lists"""
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(ys[avg_start:avg_end]) / (avg_end - avg_start)
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def make_series(points, seed=7):
+    rng = np.random.default_rng(seed)
+    ts = np.arange(points, dtype=np.int64) * 5000
+    cpu = 30 + 10 * np.sin(np.arange(points) / 500) + rng.normal(0, 3, points)
+    spikes = rng.choice(points, size=5, replace=False)
+    cpu[spikes] = 100.0
+    return ts, np.clip(cpu, 0, 100), spikes
+
+
+def timed(func, repeat):
+    """Result and best wall time (ms) over ``repeat`` calls"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def run(points=50000, max_points=500, repeat=5):
+    ts, cpu, spikes = make_series(points)
+    xs, ys = ts.tolist(), cpu.tolist()
+
+    reference, naive_ms = timed(lambda: naive_lttb(xs, ys, max_points), max(repeat // 2, 1))
+    fast, lttb_ms = timed(lambda: lttb(ts, cpu, max_points), repeat)
+    envelope, minmax_ms = timed(lambda: minmax(cpu, max_points), repeat)
+
+    errors = []
+    if fast.tolist() != reference:
+        errors.append("lttb differs from the reference loop")
+    for name, keep in (("lttb", fast), ("minmax", envelope)):
+        lost = sorted(set(spikes.tolist()) - set(keep.tolist()))
+        if lost:
+            errors.append(f"{name} lost spikes at {lost}")
+    return {
+        "points": points,
+        "max_points": max_points,
+        "naive_lttb_ms": naive_ms,
+        "lttb_ms": lttb_ms,
+        "minmax_ms": minmax_ms,
+        "speedup": naive_ms / lttb_ms,
+        "kept": {"lttb": len(fast), "minmax": len(envelope)},
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--max-points", type=int, default=500)
+    args = parser.parse_args()
+
+    results = run(args.points, args.max_points)
+    print(json.dumps(results, indent=2))
+    if results["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
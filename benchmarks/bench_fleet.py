@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Fleet registry benchmark - latest-value cache at fleet scale
+
+Pushes one sample (with a process list) per host for N hosts through the
+HostRegistry, then measures the fleet overview and per-host lookups the
+/api/hosts routes serve from memory.
+
+Usage: python benchmarks/bench_fleet.py [--hosts 1000] [--rounds 20]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fleet import HostRegistry  # noqa: E402
+
+
+def make_sample(host_id, with_processes):
+    sample = {
+        "hostname": host_id,
+        "timestamp": datetime.now(timezone.utc),
+        "cpu_percent": round(random.uniform(5, 95), 1),
+        "cpu_cores": 4,
+        "ram_used_gb": round(random.uniform(1, 7), 2),
+        "ram_total_gb": 8.0,
+        "ram_percent": round(random.uniform(10, 90), 1),
+        "disk_percent": round(random.uniform(20, 80), 1),
+        "network_in_bytes": random.randint(0, 10**12),
+        "network_out_bytes": random.randint(0, 10**12),
+        "load_average": [0.5, 0.4, 0.3],
+        "info": {"provider": "OVH", "datacenter": random.choice(["GRA", "SBG", "RBX", "BHS"])},
+    }
+    if with_processes:
+        sample["processes"] = [
+            {"pid": 1000 + i, "name": f"proc{i}", "cpu_percent": 1.0, "memory_percent": 0.5,
+             "status": "sleeping", "user": "root"}
+            for i in range(20)
+        ]
+    return sample
+
+
+def run(hosts=1000, rounds=20):
+    registry = HostRegistry()
+    host_ids = [f"vps-{i:05d}" for i in range(hosts)]
+    batches = [[make_sample(h, with_processes=(r % 2 == 0)) for h in host_ids] for r in range(rounds)]
+
+    start = time.perf_counter()
+    for batch in batches:
+        for sample in batch:
+            registry.observe(sample)
+    observe_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        overview = json.dumps(registry.overview())
+    overview_s = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for host_id in host_ids:
+        registry.get(host_id).sample
+    lookup_s = (time.perf_counter() - start) / hosts
+
+    return {
+        "hosts": hosts,
+        "observe_per_sec": hosts * rounds / observe_s,
+        "overview_ms": overview_s * 1000,
+        "overview_bytes": len(overview),
+        "lookup_us": lookup_s * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.hosts, args.rounds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite - agent, ingest, history, fan-out and dashboard latency
+
+Runs offline against the backend app in-process (httpx ASGI transport, the
+app's own lifespan) and a local MongoDB: MONGO_URL defaults to
+mongodb://localhost:27017 and DB_NAME to a scratch "vps_monitor_bench"
+database that is dropped afterwards. Results are written as JSON so two
+commits can be compared with --compare.
+
+Benchmarks:
+  agent      collector CPU cost per cycle (psutil vs /proc, see bench_agent.py)
+  ingest     pushes/s and samples/s from N simulated agents, until flushed
+  history    /api/metrics/history latency for 1 h .. 7 d ranges and formats
+  fanout     publish-to-delivery latency at N live stream subscribers
+  dashboard  p50/p99 of the dashboard endpoints under concurrent load
+  aggregate  /api/fleet/aggregate latency over N hosts for 1 h .. 24 h
+
+Usage: python benchmarks/run_suite.py [--only ingest,history] [--agents 100]
+           [--subscribers 1000] [--concurrency 50] [--output results.json]
+           [--fleet 1000] [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "vps_monitor_bench")
+
+BENCHMARKS = ("agent", "ingest", "history", "fanout", "dashboard", "aggregate")
+HISTORY_HOURS = (1, 6, 24, 168)
+AGGREGATE_HOURS = (1, 6, 24)
+DASHBOARD_ENDPOINTS = (
+    "/api/dashboard/snapshot",
+    "/api/metrics/current",
+    "/api/metrics/history",
+    "/api/processes",
+    "/api/services",
+    "/api/apps",
+    "/api/vps/info",
+    "/api/hosts",
+)
+
+
+def latency_summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_agent(args):
+    from bench_agent import run
+
+    return run(args.cycles)
+
+
+async def bench_ingest(server, client, args):
+    buffer = server.ingest_buffer
+    flushed_before = buffer.stats["flushed"]
+    start_ts = datetime.now(timezone.utc) - timedelta(seconds=args.pushes * 5)
+
+    async def agent(i):
+        host = f"bench-agent-{i:04d}"
+        for n in range(args.pushes):
+            sample = server.generate_vps_metrics()
+            sample["hostname"] = host
+            sample["timestamp"] = (start_ts + timedelta(seconds=n * 5)).isoformat()
+            resp = await client.post("/api/metrics/push", json=sample)
+            resp.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(agent(i) for i in range(args.agents)))
+    pushed = time.perf_counter() - start
+    total = args.agents * args.pushes
+    while buffer.stats["flushed"] + buffer.stats["failed"] - flushed_before < total:
+        await asyncio.sleep(0.01)
+    flushed = time.perf_counter() - start
+    return {
+        "agents": args.agents,
+        "samples": total,
+        "pushes_per_sec": total / pushed,
+        "flushed_samples_per_sec": total / flushed,
+        "failed": buffer.stats["failed"],
+    }
+
+
+async def bench_history(server, client, args):
+    """Backfills a week of 5 s samples for one host, then times the history routes"""
+    host = "bench-history"
+    now = datetime.now(timezone.utc)
+    rng = np.random.default_rng(1)
+    count = max(HISTORY_HOURS) * 720
+    cpu = np.clip(30 + 15 * np.sin(np.arange(count) / 2000) + rng.normal(0, 5, count), 0, 100)
+    batch = []
+    for i in range(count):
+        batch.append({"hostname": host, "timestamp": now - timedelta(seconds=(count - i) * 5),
+                      "cpu_percent": float(cpu[i]), "ram_percent": 40.0, "load_average": [0.5, 0.4, 0.3]})
+        if len(batch) == 5000:
+            await server.metrics_store.write(batch)
+            batch = []
+    if batch:
+        await server.metrics_store.write(batch)
+
+    results = {}
+    for hours in HISTORY_HOURS:
+        for label, params in (
+            ("rows", {}),
+            ("columnar", {"format": "columnar"}),
+            ("raw_500", {"points": 100_000, "max_points": 500, "format": "columnar"}),
+        ):
+            timings, size = [], 0
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                resp = await client.get("/api/metrics/history", params={"hours": hours, "host": host, **params})
+                timings.append(time.perf_counter() - start)
+                size = len(resp.content)
+            results[f"{hours}h_{label}"] = {**latency_summary(timings), "bytes": size}
+    return results
+
+
+async def bench_fanout(server, args):
+    from hub import MetricsHub
+
+    hub = MetricsHub()
+    subs = [hub.subscribe("bench") for _ in range(args.subscribers)]
+    received = []
+
+    async def reader(sub):
+        await sub.next()
+        received.append(time.perf_counter())
+
+    timings = []
+    payload = server.generate_vps_metrics()
+    for _ in range(args.repeat):
+        received.clear()
+        readers = [asyncio.create_task(reader(sub)) for sub in subs]
+        await asyncio.sleep(0)  # let every reader block on its queue
+        start = time.perf_counter()
+        hub.publish("bench", payload)
+        await asyncio.gather(*readers)
+        timings.append(max(received) - start)
+    for sub in subs:
+        hub.unsubscribe(sub)
+    return {"subscribers": args.subscribers, "last_delivery": latency_summary(timings), **hub.stats}
+
+
+async def bench_dashboard(server, client, args):
+    timings = {path: [] for path in DASHBOARD_ENDPOINTS}
+
+    async def user():
+        for _ in range(args.repeat):
+            for path in DASHBOARD_ENDPOINTS:
+                start = time.perf_counter()
+                resp = await client.get(path)
+                timings[path].append(time.perf_counter() - start)
+                resp.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    requests = args.concurrency * args.repeat * len(DASHBOARD_ENDPOINTS)
+    return {
+        "concurrency": args.concurrency,
+        "requests_per_sec": requests / elapsed,
+        "endpoints": {path: latency_summary(values) for path, values in timings.items()},
+    }
+
+
+async def bench_aggregate(server, client, args):
+    """Backfills a day of 5 min samples for --fleet simulated hosts, then times
+    fleet-wide aggregates grouped by datacenter"""
+    from simulator import FleetSimulator
+
+    steps = max(AGGREGATE_HOURS) * 12
+    sim = FleetSimulator(args.fleet, seed=2, interval=300, prefix="bench-fleet",
+                         start=time.time() - steps * 300)
+    start = time.perf_counter()
+    for _ in range(steps):
+        sim.step()
+        samples = sim.samples()
+        for sample in samples:
+            sample["timestamp"] = sim.timestamp
+        await server.metrics_store.write(samples)
+    backfill = time.perf_counter() - start
+    for i in range(args.fleet):
+        server.fleet.observe({"hostname": sim.host_ids[i], "timestamp": sim.timestamp, "info": sim.info(i)})
+
+    results = {"hosts": args.fleet, "backfill_seconds": backfill}
+    for hours in AGGREGATE_HOURS:
+        timings = []
+        for _ in range(args.repeat):
+            server.response_cache.clear()
+            start = time.perf_counter()
+            resp = await client.get("/api/fleet/aggregate", params={
+                "field": "cpu_percent", "funcs": "avg,max,p95", "group_by": "datacenter", "hours": hours,
+            })
+            timings.append(time.perf_counter() - start)
+            resp.raise_for_status()
+        results[f"{hours}h"] = {**latency_summary(timings), "resolution": resp.json()["resolution"]}
+    return results
+
+
+async def run_app_benchmarks(selected, args):
+    import httpx
+    import server
+
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.lifespan(server.app):
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                if "ingest" in selected:
+                    results["ingest"] = await bench_ingest(server, client, args)
+                if "history" in selected:
+                    results["history"] = await bench_history(server, client, args)
+                if "fanout" in selected:
+                    results["fanout"] = await bench_fanout(server, args)
+                if "dashboard" in selected:
+                    results["dashboard"] = await bench_dashboard(server, client, args)
+                if "aggregate" in selected:
+                    results["aggregate"] = await bench_aggregate(server, client, args)
+        finally:
+            if not args.keep_db:
+                await server.client.drop_database(os.environ["DB_NAME"])
+    return results
+
+
+def flatten(results, prefix=""):
+    """Numeric leaves as {"a.b.c": value}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    print(f"\n{'metric':<60} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name], new[name]
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{name:<60} {before:>12.4g} {after:>12.4g} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help=f"comma-separated subset of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--cycles", type=int, default=200, help="agent collection cycles")
+    parser.add_argument("--agents", type=int, default=100, help="simulated agents for ingest")
+    parser.add_argument("--pushes", type=int, default=20, help="pushes per simulated agent")
+    parser.add_argument("--subscribers", type=int, default=1000, help="live stream subscribers for fanout")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent dashboard users")
+    parser.add_argument("--fleet", type=int, default=1000, help="simulated hosts for aggregate")
+    parser.add_argument("--repeat", type=int, default=10, help="rounds per measurement")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the scratch database")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "results": {},
+    }
+    if "agent" in selected:
+        report["results"]["agent"] = bench_agent(args)
+    app_benchmarks = [name for name in selected if name != "agent"]
+    if app_benchmarks:
+        report["results"].update(asyncio.run(run_app_benchmarks(app_benchmarks, args)))
+
+    output = Path(args.output) if args.output else ROOT / "benchmarks" / "results" / f"{commit or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(json.dumps(report["results"], indent=2))
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import axios from 'axios';
 import { 
     Monitor, Cpu, HardDrive, Network, Activity, 
@@ -14,33 +14,33 @@ export default function DashboardPage() {
     const [metrics, setMetrics] = useState(null);
     const [history, setHistory] = useState([]);
     const [processes, setProcesses] = useState([]);
-    const [services, setServices] = useState([]);
-    const [apps, setApps] = useState([]);
+    // First page of each inventory: { items, total, next, version, hash }
+    const [services, setServices] = useState({ items: [], total: 0 });
+    const [apps, setApps] = useState({ items: [], total: 0 });
     const [vpsInfo, setVpsInfo] = useState(null);
     const [preferences, setPreferences] = useState([]);
     const [settingsOpen, setSettingsOpen] = useState(false);
     const [loading, setLoading] = useState(true);
     const [lastUpdate, setLastUpdate] = useState(new Date());
+    const versions = useRef({});
 
     const fetchData = useCallback(async () => {
         try {
-            const [metricsRes, historyRes, processesRes, servicesRes, appsRes, vpsRes, prefsRes] = await Promise.all([
-                axios.get(`${API}/metrics/current`),
-                axios.get(`${API}/metrics/history?hours=1`),
-                axios.get(`${API}/processes`),
-                axios.get(`${API}/services`),
-                axios.get(`${API}/apps`),
-                axios.get(`${API}/vps/info`),
-                axios.get(`${API}/preferences`),
-            ]);
+            // One aggregated request; sections we already hold come back as "unchanged"
+            const known = Object.entries(versions.current).map(([name, token]) => `${name}:${token}`).join(',');
+            const { data } = await axios.get(`${API}/dashboard/snapshot`, {
+                params: { hours: 1, versions: known || undefined },
+            });
+            const { sections } = data;
+            versions.current = data.versions;
 
-            setMetrics(metricsRes.data);
-            setHistory(historyRes.data);
-            setProcesses(processesRes.data);
-            setServices(servicesRes.data);
-            setApps(appsRes.data);
-            setVpsInfo(vpsRes.data);
-            setPreferences(prefsRes.data);
+            if (sections.metrics) setMetrics(sections.metrics);
+            if (sections.history) setHistory(sections.history);
+            if (sections.processes) setProcesses(sections.processes);
+            if (sections.services) setServices(sections.services);
+            if (sections.apps) setApps(sections.apps);
+            if (sections.vps_info) setVpsInfo(sections.vps_info);
+            if (sections.preferences) setPreferences(sections.preferences);
             setLastUpdate(new Date());
             setLoading(false);
         } catch (err) {
@@ -55,6 +55,16 @@ export default function DashboardPage() {
         return () => clearInterval(interval);
     }, [fetchData]);
 
+    // Live metrics pushed by the server; the snapshot poll keeps the other sections fresh
+    useEffect(() => {
+        const source = new EventSource(`${API}/metrics/stream`);
+        source.addEventListener('metrics', (event) => {
+            setMetrics(JSON.parse(event.data));
+            setLastUpdate(new Date());
+        });
+        return () => source.close();
+    }, []);
+
     const togglePreference = async (metricId) => {
         const newPrefs = preferences.map(p => 
             p.id === metricId ? { ...p, enabled: !p.enabled } : p
@@ -72,6 +82,12 @@ export default function DashboardPage() {
 
     const isEnabled = (metricId) => preferences.find(p => p.id === metricId)?.enabled ?? true;
 
+    // Agent cost: history holds agent_* points, the live sample the per-collector breakdown
+    const agentStats = metrics?.agent_stats;
+    const hasAgentHistory = history.some((point) => point.agent_cpu_percent != null);
+    const agentCollectors = Object.entries(agentStats?.collectors ?? {})
+        .sort(([, a], [, b]) => b.cpu_ms - a.cpu_ms);
+
     const formatUptime = (seconds) => {
         const days = Math.floor(seconds / 86400);
         const hours = Math.floor((seconds % 86400) / 3600);
@@ -305,6 +321,76 @@ export default function DashboardPage() {
                     </div>
                 )}
 
+                {/* Agent Overhead Chart */}
+                {isEnabled('agent') && hasAgentHistory && (
+                    <div className="matrix-card p-4 mt-4" data-testid="agent-overhead-chart">
+                        <h3 className="text-sm uppercase tracking-wider mb-4 flex items-center gap-2">
+                            <Monitor className="w-4 h-4" />
+                            COÛT DE L'AGENT (1H)
+                        </h3>
+                        {agentStats && (
+                            <div className="text-xs text-[var(--matrix-dark)] mb-2">
+                                CPU {agentStats.cpu_percent?.toFixed(2)}% · RSS {agentStats.rss_mb} MB
+                                · Collecte {agentStats.collect_ms?.toFixed(1)} ms
+                                · Envoi {agentStats.push_ms ?? '-'} ms · Tampon {agentStats.spool}
+                            </div>
+                        )}
+                        <div className="chart-container">
+                            <ResponsiveContainer width="100%" height="100%">
+                                <AreaChart data={history}>
+                                    <XAxis 
+                                        dataKey="timestamp" 
+                                        stroke="#003B00"
+                                        tick={{ fill: '#008F11', fontSize: 10 }}
+                                        tickFormatter={(v) => new Date(v).toLocaleTimeString('fr-FR', { hour: '2-digit', minute: '2-digit' })}
+                                    />
+                                    <YAxis 
+                                        stroke="#003B00" 
+                                        tick={{ fill: '#008F11', fontSize: 10 }}
+                                    />
+                                    <Tooltip 
+                                        contentStyle={{ 
+                                            background: '#000', 
+                                            border: '1px solid #00FF41',
+                                            color: '#00FF41'
+                                        }}
+                                        formatter={(v, name) => [
+                                            name === 'agent_cpu_percent' ? `${v?.toFixed(2)}%` : `${v?.toFixed(1)} ms`,
+                                            name === 'agent_cpu_percent' ? 'CPU agent' : 'Collecte',
+                                        ]}
+                                    />
+                                    <Area 
+                                        type="monotone" 
+                                        dataKey="agent_cpu_percent" 
+                                        stroke="#00FF41" 
+                                        fill="none"
+                                        connectNulls
+                                    />
+                                    <Area 
+                                        type="monotone" 
+                                        dataKey="agent_collect_ms" 
+                                        stroke="#008F11" 
+                                        fill="none"
+                                        connectNulls
+                                    />
+                                </AreaChart>
+                            </ResponsiveContainer>
+                        </div>
+                        {agentCollectors.length > 0 && (
+                            <div className="grid grid-cols-2 md:grid-cols-3 lg:grid-cols-5 gap-2 mt-2">
+                                {agentCollectors.map(([name, cost]) => (
+                                    <div key={name} className="text-xs p-2 border border-[var(--matrix-border)]">
+                                        <p className="truncate">{name}</p>
+                                        <p className="text-[var(--matrix-dark)]">
+                                            {cost.cpu_ms} ms CPU / {cost.wall_ms} ms
+                                        </p>
+                                    </div>
+                                ))}
+                            </div>
+                        )}
+                    </div>
+                )}
+
                 {/* Processes Table */}
                 {isEnabled('processes') && (
                     <div className="matrix-card p-4 mt-4" data-testid="processes-table">
@@ -350,9 +436,12 @@ export default function DashboardPage() {
                         <h3 className="text-sm uppercase tracking-wider mb-4 flex items-center gap-2">
                             <Layers className="w-4 h-4" />
                             SERVICES SYSTEMD
+                            <span className="text-[var(--matrix-dark)] normal-case">
+                                ({services.items.length}/{services.total})
+                            </span>
                         </h3>
                         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-2">
-                            {services.map((svc) => (
+                            {services.items.map((svc) => (
                                 <div 
                                     key={svc.name} 
                                     className="flex items-center gap-2 p-2 border border-[var(--matrix-border)]"
@@ -374,6 +463,9 @@ export default function DashboardPage() {
                         <h3 className="text-sm uppercase tracking-wider mb-4 flex items-center gap-2">
                             <Package className="w-4 h-4" />
                             APPLICATIONS INSTALLÉES
+                            <span className="text-[var(--matrix-dark)] normal-case">
+                                ({apps.items.length}/{apps.total})
+                            </span>
                         </h3>
                         <div className="overflow-x-auto">
                             <table className="matrix-table">
@@ -385,7 +477,7 @@ export default function DashboardPage() {
                                     </tr>
                                 </thead>
                                 <tbody>
-                                    {apps.map((app) => (
+                                    {apps.items.map((app) => (
                                         <tr key={app.name}>
                                             <td>{app.name}</td>
                                             <td>{app.version}</td>
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Fleet simulator - thousands of virtual hosts for load tests and demos
+
+Drives backend/simulator.py (seeded, NumPy-vectorized) in three modes:
+
+  push      acts as N agents: pushes gzip batches to /api/metrics/push every
+            interval (processes every 2 cycles, services every 12, info and
+            apps on start and whenever the API asks for the inventory)
+  backfill  writes HOURS of history (metrics and process series) straight
+            into MongoDB through the backend's stores (MONGO_URL / DB_NAME)
+  bench     measures how many samples per second the simulator produces
+
+Usage:
+  python scripts/fleet-simulator.py push --url http://localhost:8001/api --hosts 1000 [--speed 1]
+  python scripts/fleet-simulator.py backfill --hours 24 --hosts 100
+  python scripts/fleet-simulator.py bench --hosts 10000 --steps 200
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from simulator import FleetSimulator  # noqa: E402
+
+PROCESSES_EVERY = 2
+SERVICES_EVERY = 12
+
+
+def post_batch(session, url, samples):
+    body = gzip.compress(json.dumps({"samples": samples}).encode())
+    resp = session.post(f"{url}/metrics/push", data=body, timeout=(5, 30),
+                        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+    if resp.status_code == 503:
+        return None
+    resp.raise_for_status()
+    return resp.json()
+
+
+def run_push(args):
+    import requests
+
+    sim = FleetSimulator(args.hosts, seed=args.seed, interval=args.interval, prefix=args.prefix)
+    index = {host_id: i for i, host_id in enumerate(sim.host_ids)}
+    inventory = set(range(args.hosts))
+    session = requests.Session()
+    cycle = 0
+    deadline = time.monotonic()
+    while args.cycles is None or cycle < args.cycles:
+        started = time.perf_counter()
+        samples = sim.samples()
+        for i, sample in enumerate(samples):
+            if cycle % PROCESSES_EVERY == 0:
+                sample["processes"] = sim.processes(i)
+            if cycle % SERVICES_EVERY == 0 or i in inventory:
+                sample["services"] = sim.services(i)
+            if i in inventory:
+                sample["info"] = sim.info(i)
+                sample["apps"] = sim.apps(i)
+        inventory.clear()
+
+        throttled = 0
+        for start in range(0, len(samples), args.batch):
+            ack = post_batch(session, args.url, samples[start:start + args.batch])
+            if ack is None:
+                throttled += 1
+                continue
+            inventory.update(index[host] for host in ack.get("resend_inventory", ()) if host in index)
+        print(f"cycle {cycle}: {len(samples)} samples at {sim.timestamp:%H:%M:%S} "
+              f"in {time.perf_counter() - started:.2f}s" + (f", {throttled} batches throttled" if throttled else ""))
+
+        cycle += 1
+        sim.step()
+        deadline += args.interval / args.speed
+        time.sleep(max(deadline - time.monotonic(), 0))
+
+
+async def backfill(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from procstore import ProcessStore
+    from tsstore import TimeSeriesStore
+
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    store = TimeSeriesStore(client[os.environ["DB_NAME"]])
+    process_store = ProcessStore(client[os.environ["DB_NAME"]])
+    await store.ensure_indexes()
+    await process_store.ensure_indexes()
+    steps = int(args.hours * 3600 / args.interval)
+    sim = FleetSimulator(args.hosts, seed=args.seed, interval=args.interval, prefix=args.prefix,
+                         start=time.time() - steps * args.interval)
+    batch = []
+    started = time.perf_counter()
+    for step in range(steps):
+        sim.step()
+        timestamp = sim.timestamp
+        for i, sample in enumerate(sim.samples()):
+            sample["timestamp"] = timestamp
+            if step % PROCESSES_EVERY == 0:
+                sample["processes"] = sim.processes(i)
+            batch.append(sample)
+        if len(batch) >= args.batch or step == steps - 1:
+            await asyncio.gather(store.write(batch), process_store.write(batch))
+            batch = []
+        if step % 720 == 0:
+            print(f"{sim.timestamp:%Y-%m-%d %H:%M} ({step}/{steps} steps)")
+    elapsed = time.perf_counter() - started
+    print(f"{steps * args.hosts} samples written in {elapsed:.1f}s "
+          f"({steps * args.hosts / elapsed:.0f} samples/s)")
+    client.close()
+
+
+def run_bench(args):
+    sim = FleetSimulator(args.hosts, seed=args.seed, interval=args.interval)
+    started = time.perf_counter()
+    for _ in range(args.steps):
+        sim.step()
+    vectorized = time.perf_counter() - started
+    started = time.perf_counter()
+    samples = sim.samples()
+    as_dicts = time.perf_counter() - started
+    print(json.dumps({
+        "hosts": args.hosts,
+        "steps": args.steps,
+        "samples_per_sec": args.hosts * args.steps / vectorized,
+        "dict_samples_per_sec": len(samples) / as_dicts,
+        "simulated_until": datetime.isoformat(sim.timestamp),
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between two samples of a host")
+    parser.add_argument("--prefix", default="sim", help="host ids are <prefix>-00000, ...")
+    modes = parser.add_subparsers(dest="mode", required=True)
+
+    push = modes.add_parser("push", help="push live samples to the API")
+    push.add_argument("--url", default="http://localhost:8001/api")
+    push.add_argument("--batch", type=int, default=500, help="samples per request")
+    push.add_argument("--speed", type=float, default=1.0, help="simulated seconds per real second")
+    push.add_argument("--cycles", type=int, help="stop after N cycles (default: run forever)")
+
+    fill = modes.add_parser("backfill", help="write history directly into MongoDB")
+    fill.add_argument("--hours", type=float, default=24)
+    fill.add_argument("--batch", type=int, default=5000, help="samples per store write")
+
+    bench = modes.add_parser("bench", help="measure simulator throughput")
+    bench.add_argument("--steps", type=int, default=200)
+
+    args = parser.parse_args()
+    if args.mode == "push":
+        run_push(args)
+    elif args.mode == "backfill":
+        asyncio.run(backfill(args))
+    else:
+        run_bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,22 +26,62 @@ WantedBy=multi-user.target
 
 import psutil
 import requests
+import argparse
+import cProfile
+import gzip
+import hashlib
+import heapq
+import mmap
+import os
+import platform
+import pstats
+import pwd
+import random
+import re
+import resource
+import signal
 import time
 import socket
+import struct
 import subprocess
+import sys
 import json
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Configuration - À modifier selon votre installation
 API_URL = "https://votre-api.com/api"  # URL de l'API Matrix VPS Monitor
 API_TOKEN = "votre-token-jwt"  # Token d'authentification
-COLLECT_INTERVAL = 5  # Secondes entre chaque collecte
+PROVIDER = "OVH"  # Hébergeur, affiché et utilisé pour grouper la flotte
+DATACENTER = "GRA (Gravelines, France)"  # Datacenter de ce VPS
+COLLECT_INTERVAL = 5  # Secondes entre chaque collecte (CPU, RAM, réseau), 1 possible
+DISK_INTERVAL = 30  # Secondes entre deux mesures disque
+PROCESSES_INTERVAL = 10  # Secondes entre deux relevés des processus
+SERVICES_INTERVAL = 60  # Secondes entre deux relevés systemctl
+INFO_INTERVAL = 3600  # Secondes entre deux envois de la description du VPS
+DPKG_STATUS = "/var/lib/dpkg/status"  # Applications relues seulement si ce fichier change
+INVENTORY_KEYS = ("services", "apps")  # Envoyés en entier une fois, puis par différences
+COLLECTOR_BACKEND = "psutil"  # "psutil" ou "proc" (lecture directe de /proc, plus léger)
+DELTA_MODE = True  # N'envoyer que les champs modifiés entre deux keyframes
+KEYFRAME_INTERVAL = 12  # Une keyframe complète tous les N cycles
+HTTP_TIMEOUT = (5, 15)  # Secondes: connexion, lecture
+SPOOL_PATH = "/var/lib/vps-monitor/spool.bin"  # Tampon disque pendant les coupures de l'API
+SPOOL_SIZE = 16 * 1024 * 1024  # Taille fixe du tampon (les plus anciens échantillons sont écrasés)
+SPOOL_BATCH = 500  # Échantillons par requête lors du rejeu
+BACKOFF_BASE = 2  # Secondes avant le premier nouvel essai, doublées à chaque échec
+BACKOFF_MAX = 300  # Attente maximale entre deux essais
+SCHEDULE_SLACK = 0.001  # Secondes de tolérance sur les échéances (arrondis des sommes d'intervalles)
+AGENT_STATS = True  # Joindre à chaque échantillon le coût de l'agent lui-même (agent_stats)
+PROFILE_DIR = "/var/lib/vps-monitor/profiles"  # Instantanés du mode --profile (kill -USR1 <pid>)
 
 
 def get_cpu_metrics():
     """Récupère les métriques CPU"""
     return {
-        "cpu_percent": psutil.cpu_percent(interval=1),
+        # Non bloquant: pourcentage depuis l'appel précédent
+        "cpu_percent": psutil.cpu_percent(interval=None),
         "cpu_cores": psutil.cpu_count(),
         "load_average": list(psutil.getloadavg())
     }
@@ -76,77 +116,207 @@ def get_network_metrics():
     }
 
 
+def cmdline_hash(cmdline):
+    """Empreinte courte de la ligne de commande (arguments séparés par NUL).
+
+    Distingue les processus de même nom (deux instances de mongod, workers
+    python3...) pour l'historique par processus côté serveur.
+    """
+    return hashlib.blake2b(cmdline, digest_size=6).hexdigest()
+
+
+class ProcessSampler:
+    """Échantillonneur de processus persistant.
+
+    Les objets psutil.Process sont conservés d'un cycle à l'autre, indexés par
+    (pid, create_time): cpu_percent() dispose ainsi d'une mesure précédente et
+    renvoie une valeur correcte dès le deuxième échantillon. Les processus
+    terminés sont évincés. Seuls cpu_times et rss sont lus pour tous les
+    processus; nom, statut et utilisateur ne sont lus que pour le top K.
+    """
+
+    def __init__(self, top=20):
+        self.top = top
+        self.handles = {}  # pid -> ((pid, create_time), psutil.Process)
+
+    def _handle(self, pid):
+        entry = self.handles.get(pid)
+        if entry is None:
+            proc = psutil.Process(pid)
+            proc.cpu_percent(None)  # Référence: la vraie valeur arrive au cycle suivant
+            entry = self.handles[pid] = ((pid, proc.create_time()), proc)
+        return entry[1]
+
+    def sample(self):
+        pids = psutil.pids()
+        alive = set(pids)
+        for pid in [pid for pid in self.handles if pid not in alive]:
+            del self.handles[pid]
+
+        total_ram = psutil.virtual_memory().total
+        usage = []
+        for pid in pids:
+            try:
+                proc = self._handle(pid)
+                with proc.oneshot():
+                    usage.append((proc.cpu_percent(None), proc.memory_info().rss, pid))
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                self.handles.pop(pid, None)
+
+        processes = []
+        for cpu, rss, pid in heapq.nlargest(self.top, usage):
+            key, proc = self.handles[pid]
+            try:
+                if not proc.is_running():
+                    # PID réutilisé: nouveau processus, pas encore de mesure CPU
+                    del self.handles[pid]
+                    proc = self._handle(pid)
+                    cpu = 0.0
+                with proc.oneshot():
+                    processes.append({
+                        "pid": pid,
+                        "name": proc.name(),
+                        "cpu_percent": round(cpu, 1),
+                        "memory_percent": round(rss / total_ram * 100, 1),
+                        "status": proc.status(),
+                        "user": proc.username() or 'unknown',
+                        "cmdline_hash": cmdline_hash("\0".join(proc.cmdline()).encode())
+                    })
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                self.handles.pop(pid, None)
+        return processes
+
+
+PROCESS_SAMPLER = ProcessSampler()
+
+
 def get_processes():
-    """Récupère la liste des processus"""
-    processes = []
-    for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'status', 'username']):
+    """Récupère les 20 processus les plus consommateurs de CPU"""
+    return PROCESS_SAMPLER.sample()
+
+
+class CommandUnavailable(Exception):
+    """Commande absente de ce système (pas de dpkg sous RHEL, pas de systemd...)"""
+
+
+class CachedCommand:
+    """Commande dont la sortie n'est analysée à nouveau que si elle a changé.
+
+    Les erreurs (commande absente, code de retour non nul) remontent au
+    collecteur: une liste vide serait prise pour la suppression de tout
+    l'inventaire. Une commande absente lève CommandUnavailable, que
+    l'agent signale au serveur (clé unsupported).
+    """
+
+    def __init__(self, args, parse):
+        self.args = args
+        self.parse = parse
+        self.output = None
+        self.result = None
+
+    def __call__(self):
         try:
-            pinfo = proc.info
-            processes.append({
-                "pid": pinfo['pid'],
-                "name": pinfo['name'],
-                "cpu_percent": round(pinfo['cpu_percent'] or 0, 1),
-                "memory_percent": round(pinfo['memory_percent'] or 0, 1),
-                "status": pinfo['status'],
-                "user": pinfo['username'] or 'unknown'
-            })
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
-    
-    # Trier par CPU et retourner les 20 premiers
-    return sorted(processes, key=lambda x: x['cpu_percent'], reverse=True)[:20]
+            output = subprocess.run(self.args, capture_output=True, text=True, timeout=30, check=True).stdout
+        except FileNotFoundError:
+            raise CommandUnavailable(self.args[0]) from None
+        if output != self.output:
+            self.result = self.parse(output)
+            self.output = output
+        return self.result
 
 
-def get_services():
-    """Récupère l'état des services systemd"""
+def parse_services(output):
+    """Services systemd d'après `systemctl list-units --plain --no-legend`"""
     services = []
-    try:
-        result = subprocess.run(
-            ['systemctl', 'list-units', '--type=service', '--state=running,failed', '--plain', '--no-legend'],
-            capture_output=True, text=True
-        )
-        for line in result.stdout.strip().split('\n'):
-            if line:
-                parts = line.split()
-                if len(parts) >= 4:
-                    name = parts[0]
-                    active = parts[2] == 'running'
-                    desc = ' '.join(parts[4:]) if len(parts) > 4 else name
-                    services.append({
-                        "name": name,
-                        "status": f"{'active (running)' if active else 'inactive'}",
-                        "active": active,
-                        "description": desc
-                    })
-    except Exception as e:
-        print(f"Erreur lors de la récupération des services: {e}")
-    
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 4:
+            name = parts[0]
+            active = parts[2] == 'running'
+            desc = ' '.join(parts[4:]) if len(parts) > 4 else name
+            services.append({
+                "name": name,
+                "status": f"{'active (running)' if active else 'inactive'}",
+                "active": active,
+                "description": desc
+            })
     return services
 
 
-def get_installed_apps():
-    """Récupère la liste des applications installées (dpkg)"""
+def parse_installed_apps(output):
+    """Paquets installés d'après `dpkg-query -W` (état, nom, version, taille en KB)"""
     apps = []
-    try:
-        result = subprocess.run(
-            ['dpkg-query', '-W', '-f=${Package}\t${Version}\t${Installed-Size}\n'],
-            capture_output=True, text=True
-        )
-        for line in result.stdout.strip().split('\n')[:50]:  # Limiter à 50 apps
-            parts = line.split('\t')
-            if len(parts) >= 3:
-                size_kb = int(parts[2]) if parts[2].isdigit() else 0
-                apps.append({
-                    "name": parts[0],
-                    "version": parts[1],
-                    "size": f"{size_kb / 1024:.1f} MB" if size_kb > 1024 else f"{size_kb} KB"
-                })
-    except Exception as e:
-        print(f"Erreur lors de la récupération des applications: {e}")
-    
+    for line in output.splitlines():
+        parts = line.split('\t')
+        # Deuxième lettre de l'état: 'i' pour installé (exclut les paquets supprimés, config seule)
+        if len(parts) >= 4 and parts[0][1:2] == 'i':
+            size_kb = int(parts[3]) if parts[3].isdigit() else 0
+            apps.append({
+                "name": parts[1],
+                "version": parts[2],
+                "size": f"{size_kb / 1024:.1f} MB" if size_kb > 1024 else f"{size_kb} KB"
+            })
     return apps
 
 
+# État des services systemd
+get_services = CachedCommand(
+    ['systemctl', 'list-units', '--type=service', '--state=running,failed', '--plain', '--no-legend'],
+    parse_services,
+)
+# Liste complète des applications installées (dpkg)
+get_installed_apps = CachedCommand(
+    ['dpkg-query', '-W', '-f=${db:Status-Abbrev}\t${binary:Package}\t${Version}\t${Installed-Size}\n'],
+    parse_installed_apps,
+)
+
+
+def inventory_hash(items):
+    """Empreinte d'un inventaire, indépendante de l'ordre; le serveur calcule la même"""
+    encoded = json.dumps(sorted(items, key=lambda item: item["name"]), sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(encoded.encode(), digest_size=8).hexdigest()
+
+
+class InventoryTracker:
+    """Transforme les relevés successifs d'un inventaire en différences.
+
+    Le premier relevé (et le premier après reset) part en entier; ensuite
+    seuls les éléments ajoutés, modifiés et supprimés sont envoyés, avec
+    l'empreinte de l'état de départ (base) et celle du résultat (hash). Un
+    serveur qui n'a pas cette base ignore la différence et redemande
+    l'inventaire complet (resend_inventory).
+    """
+
+    def __init__(self):
+        self.source = None
+        self.items = None
+        self.hash = None
+
+    def reset(self):
+        """Le prochain relevé sera envoyé en entier"""
+        self.items = None
+
+    def update(self, source):
+        """None si rien n'a changé, sinon la liste complète ou une différence"""
+        if self.items is not None and source is self.source:
+            return None
+        items = {item["name"]: item for item in source}
+        digest = inventory_hash(list(items.values()))
+        previous, base = self.items, self.hash
+        self.source, self.items, self.hash = source, items, digest
+        if previous is None:
+            return list(items.values())
+        if digest == base:
+            return None
+        return {
+            "base": base,
+            "hash": digest,
+            "added": [item for name, item in items.items() if name not in previous],
+            "changed": [item for name, item in items.items() if name in previous and previous[name] != item],
+            "removed": [name for name in previous if name not in items],
+        }
+
+
 def get_system_info():
     """Récupère les informations système"""
     return {
@@ -156,6 +326,37 @@ def get_system_info():
     }
 
 
+def get_primary_ip():
+    """Adresse IP de l'interface de sortie (aucun paquet n'est envoyé)"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(("1.1.1.1", 53))
+            return sock.getsockname()[0]
+    except OSError:
+        return None
+
+
+def get_host_info():
+    """Description du VPS (même forme que /api/vps/info)"""
+    os_name = platform.system()
+    try:
+        with open('/etc/os-release') as f:
+            for line in f:
+                if line.startswith('PRETTY_NAME='):
+                    os_name = line.split('=', 1)[1].strip().strip('"')
+    except OSError:
+        pass
+    return {
+        "hostname": socket.gethostname(),
+        "ip": get_primary_ip(),
+        "os": os_name,
+        "kernel": platform.release(),
+        "architecture": platform.machine(),
+        "provider": PROVIDER,
+        "datacenter": DATACENTER
+    }
+
+
 def collect_all_metrics():
     """Collecte toutes les métriques"""
     metrics = {
@@ -169,38 +370,848 @@ def collect_all_metrics():
     return metrics
 
 
-def send_metrics(metrics):
-    """Envoie les métriques à l'API"""
-    headers = {
-        "Authorization": f"Bearer {API_TOKEN}",
-        "Content-Type": "application/json"
+class ProcReader:
+    """Collecteur rapide lisant /proc directement (Linux uniquement).
+
+    Les fichiers /proc globaux sont ouverts une seule fois et relus avec
+    os.preadv dans un tampon préalloué; l'analyse se fait par expressions
+    régulières compilées directement sur ce tampon, sans découper les
+    lignes en listes. Produit les mêmes dictionnaires que les fonctions
+    get_*_metrics() basées sur psutil.
+    """
+
+    FILES = {
+        "stat": "/proc/stat",
+        "meminfo": "/proc/meminfo",
+        "loadavg": "/proc/loadavg",
+        "net_dev": "/proc/net/dev",
+    }
+    CPU_RE = re.compile(rb'cpu +(\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+)')
+    BTIME_RE = re.compile(rb'btime (\d+)')
+    MEM_TOTAL_RE = re.compile(rb'MemTotal: +(\d+)')
+    MEM_AVAILABLE_RE = re.compile(rb'MemAvailable: +(\d+)')
+    LOADAVG_RE = re.compile(rb'([\d.]+) ([\d.]+) ([\d.]+)')
+    NET_DEV_RE = re.compile(rb':\s*(\d+)(?:\s+\d+){7}\s+(\d+)')
+    # Après "pid (comm) ": état, 10 champs, utime, stime, 6 champs, starttime, vsize, rss
+    PID_STAT_RE = re.compile(rb' (\S) (?:\S+ ){10}(\d+) (\d+) (?:\S+ ){6}(\d+) \d+ (\d+)')
+    STATES = {
+        "R": "running", "S": "sleeping", "D": "disk-sleep", "Z": "zombie",
+        "T": "stopped", "t": "tracing-stop", "I": "idle", "X": "dead",
     }
+
+    def __init__(self, top=20):
+        self.top = top
+        self.buf = bytearray(65536)
+        self.pid_buf = bytearray(1024)
+        self.fds = {name: os.open(path, os.O_RDONLY) for name, path in self.FILES.items()}
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.cpu_cores = os.cpu_count()
+        # Descripteurs /proc/[pid]/stat gardés ouverts, dans la limite de la moitié du quota de fichiers
+        self.max_pid_fds = resource.getrlimit(resource.RLIMIT_NOFILE)[0] // 2
+        self.pid_fds = {}  # pid -> fd
+        self.pid_ticks = {}  # pid -> (ticks utime+stime, instant de la mesure)
+        self.users = {}
+        n = self._read("stat")
+        self.boot_time = int(self.BTIME_RE.search(self.buf, 0, n).group(1))
+        self.last_cpu = self._cpu_times(n)
+
+    def close(self):
+        for fd in list(self.fds.values()) + list(self.pid_fds.values()):
+            os.close(fd)
+        self.fds, self.pid_fds = {}, {}
+
+    def _read(self, name):
+        """Relit un fichier /proc global dans le tampon, retourne la taille lue"""
+        n = os.preadv(self.fds[name], [self.buf], 0)
+        while n == len(self.buf):
+            self.buf = bytearray(len(self.buf) * 2)
+            n = os.preadv(self.fds[name], [self.buf], 0)
+        return n
+
+    def _cpu_times(self, n):
+        """(total, busy) en ticks selon le calcul de psutil (guest déjà compté dans user)"""
+        m = self.CPU_RE.match(self.buf, 0, n)
+        user, nice, system, idle, iowait, irq, softirq, steal, guest, guest_nice = map(int, m.groups())
+        total = user + nice + system + idle + iowait + irq + softirq + steal
+        return total, total - idle - iowait
+
+    def get_cpu_metrics(self):
+        total, busy = self._cpu_times(self._read("stat"))
+        percent = 0.0
+        if total > self.last_cpu[0]:
+            percent = round(max(0.0, (busy - self.last_cpu[1]) / (total - self.last_cpu[0]) * 100), 1)
+        self.last_cpu = (total, busy)
+        m = self.LOADAVG_RE.match(self.buf, 0, self._read("loadavg"))
+        return {
+            "cpu_percent": percent,
+            "cpu_cores": self.cpu_cores,
+            "load_average": [float(m.group(1)), float(m.group(2)), float(m.group(3))]
+        }
+
+    def get_memory_metrics(self):
+        n = self._read("meminfo")
+        total = int(self.MEM_TOTAL_RE.search(self.buf, 0, n).group(1)) * 1024
+        available = int(self.MEM_AVAILABLE_RE.search(self.buf, 0, n).group(1)) * 1024
+        return {
+            "ram_used_gb": round((total - available) / (1024**3), 2),
+            "ram_total_gb": round(total / (1024**3), 2),
+            "ram_percent": round((total - available) / total * 100, 1)
+        }
+
+    def get_disk_metrics(self):
+        st = os.statvfs('/')
+        total = st.f_blocks * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        free = st.f_bavail * st.f_frsize
+        return {
+            "disk_used_gb": round(used / (1024**3), 1),
+            "disk_total_gb": round(total / (1024**3), 1),
+            "disk_percent": round(used / (used + free) * 100, 1) if used + free else 0.0
+        }
+
+    def get_network_metrics(self):
+        n = self._read("net_dev")
+        received = sent = 0
+        for m in self.NET_DEV_RE.finditer(self.buf, 0, n):
+            received += int(m.group(1))
+            sent += int(m.group(2))
+        return {
+            "network_in_bytes": received,
+            "network_out_bytes": sent
+        }
+
+    def get_system_info(self):
+        return {
+            "hostname": socket.gethostname(),
+            "uptime_seconds": int(time.time() - self.boot_time),
+            "processes_count": sum(1 for entry in os.scandir('/proc') if entry.name.isdigit())
+        }
+
+    def _read_pid_stat(self, pid):
+        """Relit /proc/[pid]/stat; None si le processus a disparu.
+
+        Un descripteur ouvert reste lié au processus: si le PID est réutilisé,
+        la lecture échoue (ESRCH) au lieu de renvoyer un autre processus.
+        """
+        fd = self.pid_fds.get(pid)
+        try:
+            if fd is None:
+                fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+                if len(self.pid_fds) < self.max_pid_fds:
+                    self.pid_fds[pid] = fd
+                else:
+                    try:
+                        return os.preadv(fd, [self.pid_buf], 0)
+                    finally:
+                        os.close(fd)
+            return os.preadv(fd, [self.pid_buf], 0)
+        except OSError:
+            self._forget(pid)
+            return None
+
+    def _forget(self, pid):
+        fd = self.pid_fds.pop(pid, None)
+        if fd is not None:
+            os.close(fd)
+        self.pid_ticks.pop(pid, None)
+
+    def _user(self, pid):
+        try:
+            uid = os.stat(f"/proc/{pid}").st_uid
+        except OSError:
+            return 'unknown'
+        if uid not in self.users:
+            try:
+                self.users[uid] = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                self.users[uid] = str(uid)
+        return self.users[uid]
+
+    def _cmdline(self, pid):
+        """Contenu brut de /proc/[pid]/cmdline, sans le NUL final"""
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                return f.read().rstrip(b"\0")
+        except OSError:
+            return b""
+
+    @staticmethod
+    def _name(comm, cmdline):
+        """Nom du processus comme psutil: le noyau tronque comm à 15 caractères,
+        le nom complet est alors celui de argv[0] s'il le prolonge"""
+        if len(comm) >= 15 and cmdline:
+            first = cmdline.split(b"\0", 1)[0]
+            if b"\0" not in cmdline:  # Titre réécrit par le processus: arguments séparés par des espaces
+                first = first.split(b" ", 1)[0]
+            full = os.path.basename(first)
+            if full.startswith(comm):
+                comm = full
+        return comm.decode(errors="replace")
+
+    def get_processes(self):
+        """Top K des processus par CPU, même forme que get_processes()"""
+        now = time.monotonic()
+        alive = set()
+        usage = []
+        for entry in os.scandir('/proc'):
+            if not entry.name.isdigit():
+                continue
+            pid = int(entry.name)
+            n = self._read_pid_stat(pid)
+            if n is None:
+                continue
+            alive.add(pid)
+            end = self.pid_buf.rfind(b')', 0, n)
+            m = self.PID_STAT_RE.match(self.pid_buf, end + 1, n)
+            if m is None:
+                continue
+            ticks = int(m.group(2)) + int(m.group(3))
+            previous = self.pid_ticks.get(pid)
+            self.pid_ticks[pid] = (ticks, now)
+            cpu = 0.0
+            if previous is not None and now > previous[1]:
+                cpu = (ticks - previous[0]) / self.clock_ticks / (now - previous[1]) * 100
+            usage.append((cpu, int(m.group(5)), pid, m.group(1), bytes(self.pid_buf[self.pid_buf.find(b'(', 0, end) + 1:end])))
+        for pid in [pid for pid in self.pid_ticks if pid not in alive]:
+            self._forget(pid)
+
+        total_ram = int(self.MEM_TOTAL_RE.search(self.buf, 0, self._read("meminfo")).group(1)) * 1024
+        processes = []
+        for cpu, rss, pid, state, comm in heapq.nlargest(self.top, usage, key=lambda row: row[0]):
+            cmdline = self._cmdline(pid)
+            processes.append({
+                "pid": pid,
+                "name": self._name(comm, cmdline),
+                "cpu_percent": round(cpu, 1),
+                "memory_percent": round(rss * self.page_size / total_ram * 100, 1),
+                "status": self.STATES.get(state.decode(), state.decode()),
+                "user": self._user(pid),
+                "cmdline_hash": cmdline_hash(cmdline)
+            })
+        return processes
+
+    def collect_all_metrics(self):
+        """Équivalent de collect_all_metrics() sans psutil"""
+        return {
+            "timestamp": datetime.utcnow().isoformat(),
+            **self.get_cpu_metrics(),
+            **self.get_memory_metrics(),
+            **self.get_disk_metrics(),
+            **self.get_network_metrics(),
+            **self.get_system_info()
+        }
+
+
+def dpkg_status_mtime():
+    """Date de modification de la base dpkg (None si absente)"""
     try:
-        response = requests.post(f"{API_URL}/metrics/push", json=metrics, headers=headers)
-        if response.status_code == 200:
-            print(f"[{datetime.now()}] Métriques envoyées avec succès")
+        return os.stat(DPKG_STATUS).st_mtime
+    except OSError:
+        return None
+
+
+class Collector:
+    """Un collecteur et sa cadence.
+
+    - interval: secondes entre deux exécutions
+    - slow: exécuté dans le pool de threads pour ne jamais retarder le cycle
+    - key: le résultat (une liste) est envoyé sous cette clé, seulement quand il est nouveau;
+      pour les inventaires (services, apps), sous forme de différence (voir InventoryTracker)
+    - trigger: fonction dont le changement de valeur déclenche le collecteur
+    """
+
+    def __init__(self, name, func, interval=None, slow=False, key=None, trigger=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.slow = slow
+        self.key = key
+        self.trigger = trigger
+        self.next_run = 0.0
+        self.last_token = object()
+        self.future = None
+
+    def is_due(self, now):
+        if self.trigger is not None:
+            return self.trigger() != self.last_token
+        return now >= self.next_run - SCHEDULE_SLACK
+
+    def schedule(self, now):
+        """Prochaine échéance, comptée depuis la précédente pour ne pas dériver;
+        après un retard d'au moins un intervalle, repart de now"""
+        self.next_run += self.interval
+        if self.next_run <= now:
+            self.next_run = now + self.interval
+
+
+def build_collectors(backend=COLLECTOR_BACKEND):
+    """Liste des collecteurs pour le backend choisi ("psutil" ou "proc")"""
+    if backend == "proc":
+        source = ProcReader()
+    else:
+        source = sys.modules[__name__]
+        psutil.cpu_percent(interval=None)  # Référence pour le premier pourcentage CPU
+    return [
+        Collector("cpu", source.get_cpu_metrics, COLLECT_INTERVAL),
+        Collector("memory", source.get_memory_metrics, COLLECT_INTERVAL),
+        Collector("network", source.get_network_metrics, COLLECT_INTERVAL),
+        Collector("system", source.get_system_info, COLLECT_INTERVAL),
+        Collector("disk", source.get_disk_metrics, DISK_INTERVAL, slow=True),
+        Collector("processes", source.get_processes, PROCESSES_INTERVAL, slow=True, key="processes"),
+        Collector("services", get_services, SERVICES_INTERVAL, slow=True, key="services"),
+        Collector("apps", get_installed_apps, slow=True, key="apps", trigger=dpkg_status_mtime),
+        Collector("info", get_host_info, INFO_INTERVAL, slow=True, key="info"),
+    ]
+
+
+class CollectorScheduler:
+    """Exécute chaque collecteur à sa propre cadence.
+
+    Les collecteurs rapides tournent dans la boucle principale; les lents
+    (sous-processus, parcours de /proc) sont soumis au pool de threads et leur
+    dernier résultat est réutilisé tant que le suivant n'est pas prêt.
+    """
+
+    def __init__(self, collectors=None, workers=2, stats=None, profiler=None):
+        self.collectors = collectors if collectors is not None else build_collectors()
+        self.stats = stats
+        self.profiler = profiler
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="collecteur")
+        self.values = {}
+        self.pending = {}
+        self.snapshots = {}  # Dernier résultat de chaque collecteur à clé
+        self.trackers = {key: InventoryTracker() for key in INVENTORY_KEYS}
+        self.unsupported = set()  # Clés dont la commande manque sur ce système
+        self.last_resend = 0.0
+        for collector in self.collectors:
+            if collector.key is None:
+                self.values.update(collector.func())
+
+    def _run(self, collector):
+        """Exécute un collecteur en mesurant sa durée et le temps CPU de son thread"""
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            return self.profiler.run(collector.func) if self.profiler else collector.func()
+        finally:
+            if self.stats is not None:
+                self.stats.record(collector.name, time.perf_counter() - start, time.thread_time() - cpu)
+
+    def _store(self, collector, result):
+        if collector.key is None:
+            self.values.update(result)
+        else:
+            self.unsupported.discard(collector.key)
+            self.snapshots[collector.key] = result
+            if collector.key not in self.trackers:
+                self.pending[collector.key] = result
+
+    def _unsupported(self, collector):
+        """Le serveur cesse d'attendre cet inventaire (sinon il le redemanderait à chaque envoi)"""
+        if collector.key not in self.unsupported:
+            print(f"Collecteur {collector.name}: commande absente, inventaire non disponible")
+        self.unsupported.add(collector.key)
+        self.pending["unsupported"] = sorted(self.unsupported)
+
+    def resend_snapshots(self):
+        """Renvoie l'inventaire complet au prochain cycle (demandé par le serveur), au plus une fois par minute"""
+        if time.monotonic() - self.last_resend >= 60:
+            self.last_resend = time.monotonic()
+            if self.unsupported:
+                self.pending["unsupported"] = sorted(self.unsupported)
+            for key, result in self.snapshots.items():
+                if key in self.trackers:
+                    self.trackers[key].reset()
+                else:
+                    self.pending[key] = result
+
+    def _inventory_updates(self):
+        """Listes complètes sous leur clé, différences sous la clé inventory"""
+        for key, tracker in self.trackers.items():
+            if key not in self.snapshots:
+                continue
+            update = tracker.update(self.snapshots[key])
+            if isinstance(update, dict):
+                self.pending.setdefault("inventory", {})[key] = update
+            elif update is not None:
+                self.pending[key] = update
+
+    def collect(self, now=None):
+        """Retourne l'échantillon du cycle courant sans jamais attendre un collecteur lent.
+
+        now est l'échéance du cycle (time.monotonic() par défaut): la boucle
+        principale passe son tick absolu, pour qu'un réveil un peu plus tôt
+        que le précédent ne fasse pas sauter un cycle aux collecteurs rapides.
+        """
+        if now is None:
+            now = time.monotonic()
+        for collector in self.collectors:
+            if collector.future is not None:
+                if not collector.future.done():
+                    continue
+                try:
+                    self._store(collector, collector.future.result())
+                except CommandUnavailable:
+                    self._unsupported(collector)
+                except Exception as e:
+                    print(f"Erreur du collecteur {collector.name}: {e}")
+                collector.future = None
+            if not collector.is_due(now):
+                continue
+            if collector.trigger is not None:
+                collector.last_token = collector.trigger()
+            else:
+                collector.schedule(now)
+            if collector.slow:
+                collector.future = self.pool.submit(self._run, collector)
+            else:
+                self._store(collector, self._run(collector))
+
+        self._inventory_updates()
+        metrics = {"timestamp": datetime.utcnow().isoformat(), **self.values}
+        metrics.update(self.pending)
+        self.pending = {}
+        return metrics
+
+
+class AgentStats:
+    """Coût de l'agent lui-même, joint à chaque échantillon sous "agent_stats".
+
+    Par collecteur: durée et temps CPU de sa dernière exécution, en ms (le
+    CPU des commandes lancées, systemctl ou dpkg-query, n'y figure pas).
+    Pour le processus: CPU depuis l'échantillon précédent, commandes lancées
+    comprises, mémoire résidente, latence du dernier envoi et nombre
+    d'échantillons en attente dans le tampon disque.
+    """
+
+    def __init__(self):
+        self.collectors = {}
+        self.push_ms = None
+        self.process = psutil.Process()
+        self.last = (time.monotonic(), self._cpu_seconds())
+
+    @staticmethod
+    def _cpu_seconds():
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    def record(self, name, wall, cpu):
+        self.collectors[name] = {"wall_ms": round(wall * 1000, 2), "cpu_ms": round(cpu * 1000, 2)}
+
+    def snapshot(self, spool_depth):
+        now, cpu = time.monotonic(), self._cpu_seconds()
+        (then, cpu_then), self.last = self.last, (now, cpu)
+        collectors = dict(self.collectors)
+        return {
+            "cpu_percent": round((cpu - cpu_then) / (now - then) * 100, 2) if now > then else 0.0,
+            "rss_mb": round(self.process.memory_info().rss / (1024 * 1024), 1),
+            "push_ms": self.push_ms,
+            "spool": spool_depth,
+            # Un tour complet de collecteurs: suit par exemple la croissance de process_iter
+            "collect_ms": round(sum(cost["wall_ms"] for cost in collectors.values()), 2),
+            "collectors": collectors,
+        }
+
+
+class AgentProfiler:
+    """Mode --profile: cProfile et tracemalloc actifs, instantané sur SIGUSR1.
+
+    Jusqu'à Python 3.11, cProfile ne suit que le thread qui l'active: la
+    boucle principale et chaque thread collecteur ont leur profil, réunis
+    dans l'instantané. Depuis 3.12 il passe par sys.monitoring, commun à tout
+    l'interpréteur: un seul profil, actif tant qu'un thread en a besoin. Un
+    run() imbriqué (collecteur exécuté dans le cycle) ne fait qu'appeler la
+    fonction. Le signal ne fait que lever un drapeau; l'écriture a lieu entre
+    deux cycles.
+    """
+
+    SHARED = sys.version_info >= (3, 12)
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self.profiles = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.requested = False
+        self.shared = cProfile.Profile() if self.SHARED else None
+        self.users = 0  # Threads dans run() avec le profil partagé
+        if self.shared is not None:
+            self.profiles.append(self.shared)
+        tracemalloc.start(25)
+
+    def run(self, func):
+        if getattr(self.local, "active", False):
+            return func()
+        self.local.active = True
+        try:
+            if self.shared is not None:
+                return self._run_shared(func)
+            profile = getattr(self.local, "profile", None)
+            if profile is None:
+                profile = self.local.profile = cProfile.Profile()
+                with self.lock:
+                    self.profiles.append(profile)
+            profile.enable()
+            try:
+                return func()
+            finally:
+                profile.disable()
+        finally:
+            self.local.active = False
+
+    def _run_shared(self, func):
+        with self.lock:
+            if not self.users:
+                self.shared.enable()
+            self.users += 1
+        try:
+            return func()
+        finally:
+            with self.lock:
+                self.users -= 1
+                if not self.users:
+                    self.shared.disable()
+
+    def request(self, signum=None, frame=None):
+        self.requested = True
+
+    def dump_if_requested(self):
+        if not self.requested:
+            return
+        self.requested = False
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, datetime.now().strftime("agent-%Y%m%d-%H%M%S"))
+        with self.lock:
+            # Stats() arrête le profil; un collecteur lent encore en cours le retrouve actif
+            pstats.Stats(*self.profiles).dump_stats(base + ".prof")
+            if self.users:
+                self.shared.enable()
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(base + ".tracemalloc")
+        print(f"[{datetime.now()}] Profil écrit: {base}.prof, {base}.tracemalloc")
+        for stat in snapshot.statistics("lineno")[:10]:
+            print(f"  {stat}")
+
+
+class DeltaEncoder:
+    """Encode les échantillons en keyframes complètes et deltas.
+
+    Une keyframe contient tous les champs; entre deux keyframes seuls les
+    champs modifiés sont envoyés, et les compteurs réseau sont transmis sous
+    forme de différence avec l'échantillon précédent. Le numéro de séquence
+    permet au serveur de détecter un trou et de demander une resynchronisation.
+    """
+
+    COUNTERS = ("network_in_bytes", "network_out_bytes")
+    ALWAYS_SENT = ("hostname", "timestamp")
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.last = None
+        self.seq = 0
+        self.since_keyframe = 0
+
+    def force_keyframe(self):
+        """La prochaine trame sera une keyframe (demandé par le serveur)"""
+        self.last = None
+
+    def encode(self, metrics):
+        self.seq += 1
+        if self.last is None or self.since_keyframe >= self.keyframe_interval - 1:
+            payload = {**metrics, "seq": self.seq, "keyframe": True}
+            self.since_keyframe = 0
         else:
-            print(f"[{datetime.now()}] Erreur API: {response.status_code}")
-    except Exception as e:
-        print(f"[{datetime.now()}] Erreur d'envoi: {e}")
+            payload = {"seq": self.seq, "delta": True}
+            counters = {}
+            for key, value in metrics.items():
+                if key in self.COUNTERS and key in self.last:
+                    counters[key] = value - self.last[key]
+                elif key in self.ALWAYS_SENT or self.last.get(key) != value:
+                    payload[key] = value
+            if counters:
+                payload["counters"] = counters
+            self.since_keyframe += 1
+        self.last = metrics
+        return payload
+
+
+class ShippingError(Exception):
+    """Échec d'envoi; retry_after vient de l'en-tête Retry-After s'il est présent"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def create_session():
+    """Session HTTP keep-alive: une seule poignée de main TCP+TLS pour tous les envois"""
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0))
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0))
+    session.headers.update({
+        "Authorization": f"Bearer {API_TOKEN}",
+        "Content-Type": "application/json",
+        "Content-Encoding": "gzip"
+    })
+    return session
+
+
+SESSION = create_session()
+
+
+def send_metrics(metrics):
+    """Envoie un échantillon ou un lot {"samples": [...]} compressé en gzip.
+
+    Retourne l'accusé JSON de l'API; lève ShippingError en cas d'échec.
+    """
+    body = gzip.compress(json.dumps(metrics, separators=(",", ":")).encode(), compresslevel=5)
+    try:
+        response = SESSION.post(f"{API_URL}/metrics/push", data=body, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        raise ShippingError(f"Erreur d'envoi: {e}")
+    if response.status_code != 200:
+        retry_after = response.headers.get("Retry-After")
+        raise ShippingError(
+            f"Erreur API: {response.status_code}",
+            float(retry_after) if retry_after and retry_after.isdigit() else None
+        )
+    return response.json()
+
+
+class RingSpool:
+    """Tampon disque circulaire de taille fixe, projeté en mémoire (mmap).
+
+    Conserve les échantillons pendant une coupure de l'API. Chaque
+    enregistrement est [longueur u32][JSON]. Les enregistrements vivants vont
+    de head à tail; quand l'écriture est repartie du début du fichier, ils
+    vont de head à wrap (la fin des anciens) puis du début à tail. L'en-tête
+    stocke head, tail, wrap et leur nombre. Quand le fichier est plein, les
+    plus anciens échantillons sont écrasés.
+    """
+
+    MAGIC = b"VPSS"
+    VERSION = 2
+    HEADER = struct.Struct("<4sIQQQQ")  # magic, version, head, tail, count, wrap (0: pas de retour au début)
+    RECORD = struct.Struct("<I")
+
+    def __init__(self, path=SPOOL_PATH, size=SPOOL_SIZE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.size = size
+        self.start = self.HEADER.size
+        magic, version, head, tail, count, wrap = self.HEADER.unpack_from(self.map, 0)
+        valid = (magic == self.MAGIC and version == self.VERSION
+                 and self.start <= head <= size and self.start <= tail <= size
+                 and (head <= tail if wrap == 0 else tail <= head <= wrap <= size))
+        self.head, self.tail, self.count, self.wrap = (head, tail, count, wrap) if valid else (self.start, self.start, 0, 0)
+        self.dropped = 0
+        self._save()
+
+    def __len__(self):
+        return self.count
+
+    def _save(self):
+        self.HEADER.pack_into(self.map, 0, self.MAGIC, self.VERSION, self.head, self.tail, self.count, self.wrap)
+
+    def _next(self, pos):
+        """Position de l'enregistrement qui suit celui commençant à pos"""
+        (length,) = self.RECORD.unpack_from(self.map, pos)
+        pos += self.RECORD.size + length
+        return self.start if self.wrap and pos >= self.wrap else pos
+
+    def _pop(self):
+        """Retire l'enregistrement le plus ancien"""
+        nxt = self._next(self.head)
+        if self.wrap and nxt == self.start:
+            self.wrap = 0
+        self.head = nxt
+        self.count -= 1
+        if self.count == 0:
+            self.head = self.tail = self.start
+            self.wrap = 0
+
+    def append(self, data):
+        need = self.RECORD.size + len(data)
+        if need > self.size - self.start:
+            return False
+        if self.count == 0:
+            self.head = self.tail = self.start
+            self.wrap = 0
+        while True:
+            if not self.wrap:
+                if self.tail + need <= self.size:
+                    break
+                # Pas la place avant la fin du fichier: on repart du début
+                self.wrap, self.tail = self.tail, self.start
+                if self.count == 0:
+                    self.wrap = 0
+                    continue
+            # Écraser les plus anciens tant qu'ils chevauchent la zone à écrire
+            if self.tail + need <= self.head:
+                break
+            self._pop()
+            self.dropped += 1
+        self.RECORD.pack_into(self.map, self.tail, len(data))
+        self.map[self.tail + self.RECORD.size:self.tail + need] = data
+        self.tail += need
+        self.count += 1
+        self._save()
+        return True
+
+    def peek(self, limit):
+        """Jusqu'à limit enregistrements les plus anciens, sans les retirer"""
+        records, pos = [], self.head
+        for _ in range(min(limit, self.count)):
+            (length,) = self.RECORD.unpack_from(self.map, pos)
+            records.append(bytes(self.map[pos + self.RECORD.size:pos + self.RECORD.size + length]))
+            pos = self._next(pos)
+        return records
+
+    def consume(self, n):
+        """Retire les n plus anciens enregistrements (après un envoi réussi)"""
+        for _ in range(min(n, self.count)):
+            self._pop()
+        self._save()
+        self.map.flush()
+
+
+class Shipper:
+    """Expédie les échantillons, avec tampon disque et reprise progressive.
+
+    En fonctionnement normal les échantillons partent en direct (deltas si
+    activés). Si l'API est injoignable, ils sont écrits en entier dans le
+    tampon et rejoués dans l'ordre, par lots, dès que l'API répond; les
+    tentatives s'espacent exponentiellement avec une part aléatoire pour que
+    tous les agents ne se reconnectent pas en même temps après un redémarrage.
+    """
+
+    def __init__(self, spool=None, encoder=None, on_inventory_request=None, stats=None):
+        self.spool = spool if spool is not None else RingSpool()
+        self.encoder = encoder if encoder is not None else DeltaEncoder()
+        self.on_inventory_request = on_inventory_request
+        self.stats = stats
+        self.failures = 0
+        self.next_attempt = 0.0
+
+    def _backoff(self, error):
+        self.failures += 1
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1)) * random.uniform(0.5, 1.0)
+        if error.retry_after:
+            delay = max(delay, error.retry_after)
+        self.next_attempt = time.monotonic() + delay
+        print(f"[{datetime.now()}] {error} - nouvel essai dans {delay:.0f}s ({len(self.spool)} en attente)")
+
+    def _send(self, payload):
+        """send_metrics, avec la latence de l'envoi (réussi) notée dans agent_stats"""
+        start = time.perf_counter()
+        ack = send_metrics(payload)
+        if self.stats is not None:
+            self.stats.push_ms = round((time.perf_counter() - start) * 1000, 1)
+        return ack
+
+    def _handle_ack(self, ack):
+        if ack.get("resync"):
+            # État serveur inconnu: repartir d'une keyframe
+            self.encoder.force_keyframe()
+        if ack.get("resend_inventory") and self.on_inventory_request:
+            self.on_inventory_request()
+
+    def _replay(self):
+        """Rejoue le tampon par lots; False si l'API est encore indisponible"""
+        while len(self.spool):
+            records = self.spool.peek(SPOOL_BATCH)
+            samples = []
+            for record in records:
+                try:
+                    samples.append(json.loads(record))
+                except ValueError:  # JSON ou UTF-8 invalide: l'enregistrement est abandonné
+                    print(f"[{datetime.now()}] Enregistrement illisible retiré du tampon")
+            if not samples:
+                self.spool.consume(len(records))
+                continue
+            try:
+                ack = self._send({"samples": samples})
+            except ShippingError as e:
+                self._backoff(e)
+                return False
+            self.spool.consume(len(records))
+            self._handle_ack(ack)
+        return True
+
+    def ship(self, metrics):
+        if len(self.spool) or time.monotonic() < self.next_attempt:
+            self.spool.append(json.dumps(metrics, separators=(",", ":")).encode())
+            if time.monotonic() >= self.next_attempt and self._replay():
+                print(f"[{datetime.now()}] Tampon rejoué, reprise de l'envoi direct")
+                self.failures = 0
+            return
+        payload = self.encoder.encode(metrics) if DELTA_MODE else metrics
+        try:
+            ack = self._send(payload)
+        except ShippingError as e:
+            self.spool.append(json.dumps(metrics, separators=(",", ":")).encode())
+            self.encoder.force_keyframe()
+            self._backoff(e)
+            return
+        self.failures = 0
+        self._handle_ack(ack)
 
 
 def main():
     """Boucle principale de l'agent"""
+    parser = argparse.ArgumentParser(description="VPS Monitor Agent")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"profiler l'agent; kill -USR1 <pid> écrit un instantané dans {PROFILE_DIR}")
+    args = parser.parse_args()
+
     print("=== VPS Monitor Agent ===")
     print(f"API URL: {API_URL}")
-    print(f"Intervalle de collecte: {COLLECT_INTERVAL}s")
+    print(f"Intervalle de collecte: {COLLECT_INTERVAL}s (backend {COLLECTOR_BACKEND})")
+    print(f"Mode delta: {'oui' if DELTA_MODE else 'non'} (keyframe tous les {KEYFRAME_INTERVAL} cycles)")
+    print(f"Tampon disque: {SPOOL_PATH} ({SPOOL_SIZE // (1024 * 1024)} MB)")
     print("========================")
     
+    stats = AgentStats() if AGENT_STATS else None
+    profiler = None
+    if args.profile:
+        profiler = AgentProfiler()
+        signal.signal(signal.SIGUSR1, profiler.request)
+        print(f"Mode profil: kill -USR1 {os.getpid()} pour un instantané dans {PROFILE_DIR}")
+    scheduler = CollectorScheduler(stats=stats, profiler=profiler)
+    shipper = Shipper(on_inventory_request=scheduler.resend_snapshots, stats=stats)
+    if len(shipper.spool):
+        print(f"{len(shipper.spool)} échantillons en attente dans le tampon")
+
+    def cycle():
+        metrics = scheduler.collect(next_tick)
+        if stats is not None:
+            metrics["agent_stats"] = stats.snapshot(len(shipper.spool))
+        shipper.ship(metrics)
+
+    next_tick = time.monotonic()
     while True:
         try:
-            metrics = collect_all_metrics()
-            print(json.dumps(metrics, indent=2))
-            # send_metrics(metrics)  # Décommenter pour envoyer à l'API
+            if profiler:
+                profiler.run(cycle)
+                profiler.dump_if_requested()
+            else:
+                cycle()
         except Exception as e:
             print(f"Erreur de collecte: {e}")
         
-        time.sleep(COLLECT_INTERVAL)
+        # Échéances absolues: pas de dérive, et les cycles manqués sont sautés plutôt que rattrapés
+        next_tick += COLLECT_INTERVAL
+        delay = next_tick - time.monotonic()
+        if delay < 0:
+            next_tick += (-delay // COLLECT_INTERVAL + 1) * COLLECT_INTERVAL
+            delay = next_tick - time.monotonic()
+        time.sleep(delay)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,31 @@
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+
+@pytest.fixture(scope="session")
+def agent():
+    """scripts/vps-monitor-agent.py as a module; its file name cannot be imported"""
+    spec = importlib.util.spec_from_file_location("vps_monitor_agent", ROOT / "scripts" / "vps-monitor-agent.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def server():
+    """backend/server.py with a MongoDB client that is never connected: routes
+    that only touch memory (pushes, the fleet registry) run without a database"""
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:1")
+    os.environ.setdefault("DB_NAME", "vps_monitor_test")
+    os.environ.setdefault("SHARED_STATE", "0")
+    os.environ.setdefault("AGGREGATE_PROCESSES", "0")
+    import server
+    return server
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from alerts import DEFAULT_RULES, AlertEngine, Rule, RuleError
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def sample(seconds, host="vps-1", **fields):
+    return {"hostname": host, "timestamp": T0 + timedelta(seconds=seconds), **fields}
+
+
+def feed(engine, field, readings, step=10, start=0):
+    """Statuses of the transitions caused by one reading every `step` seconds"""
+    return [[event["status"] for event in engine.evaluate(sample(start + i * step, **{field: value}))]
+            for i, value in enumerate(readings)]
+
+
+def test_default_rules_are_valid():
+    assert [rule.id for rule in AlertEngine().rules] == [spec["id"] for spec in DEFAULT_RULES]
+
+
+@pytest.mark.parametrize("spec", [
+    {"id": "r", "field": "cpu_percent"},
+    {"id": "r", "field": "cpu_percent", "threshold": "high"},
+    {"id": "r", "field": "cpu_percent", "threshold": float("nan")},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "op": "=="},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "op": [">"]},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "clear": None},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "clear": 95},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "op": ">=", "clear": 95},
+    {"id": "r", "field": "cpu_percent", "threshold": 10, "op": "<", "clear": 5},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "for": "soon"},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "for": -60},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "mode": "median"},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "mode": "avg", "window": 0},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "mode": "avg", "window": "0s"},
+    {"id": "r", "field": "cpu_percent", "threshold": 90, "mode": "avg", "window": -300},
+])
+def test_invalid_rules_are_rejected(spec):
+    with pytest.raises(RuleError):
+        Rule(spec)
+
+
+def test_clear_may_equal_the_threshold():
+    assert Rule({"id": "r", "field": "cpu_percent", "threshold": 90, "op": ">="}).clear == 90
+    assert Rule({"id": "r", "field": "cpu_percent", "threshold": 10, "op": "<", "clear": 20}).clear == 20
+
+
+def test_invalid_rule_sets_are_rejected():
+    engine = AlertEngine()
+    for specs in (5, [5], [{"id": "a", "field": "cpu_percent", "threshold": 1}] * 2):
+        with pytest.raises(RuleError):
+            engine.set_rules(specs)
+    assert [rule.id for rule in engine.rules] == [spec["id"] for spec in DEFAULT_RULES]
+
+
+def test_hysteresis_and_for_duration():
+    engine = AlertEngine([{"id": "cpu", "field": "cpu_percent", "threshold": 90, "clear": 80, "for": 20}])
+    statuses = feed(engine, "cpu_percent", [95, 95, 70, 95, 95, 95, 85, 91, 80, 79, 85])
+    #              pending, then back under: the for duration starts over ^
+    assert statuses == [[], [], [], [], [], ["firing"], [], [], [], ["resolved"], []]
+    assert engine.active == {}
+    assert [event["status"] for event in engine.events] == ["firing", "resolved"]
+
+
+def test_hosts_are_evaluated_apart():
+    engine = AlertEngine([{"id": "cpu", "field": "cpu_percent", "threshold": 90}])
+    assert engine.evaluate(sample(0, host="a", cpu_percent=95))[0]["host"] == "a"
+    assert engine.evaluate(sample(0, host="b", cpu_percent=50)) == []
+    assert list(engine.active) == [("cpu", "a")]
+
+
+def test_below_rules_and_load_fields():
+    engine = AlertEngine([
+        {"id": "disk_low", "field": "disk_free_gb", "op": "<", "threshold": 5, "clear": 10},
+        {"id": "load", "field": "load_5", "threshold": 4},
+    ])
+    events = engine.evaluate(sample(0, disk_free_gb=4, load_average=[9, 5, 1]))
+    assert [(event["rule"], event["status"]) for event in events] == [("disk_low", "firing"), ("load", "firing")]
+    events = engine.evaluate(sample(10, disk_free_gb=8, load_average=[9, 3, 1]))
+    assert [(event["rule"], event["status"]) for event in events] == [("load", "resolved")]
+    assert engine.evaluate(sample(20, disk_free_gb=10)) == []  # resolves only past clear
+    events = engine.evaluate(sample(30, disk_free_gb=11))
+    assert [(event["rule"], event["status"]) for event in events] == [("disk_low", "resolved")]
+
+
+def test_avg_mode_smooths_over_the_window():
+    spec = {"id": "cpu", "field": "cpu_percent", "mode": "avg", "window": "100s", "threshold": 50}
+    engine = AlertEngine([spec])
+    # One spike is averaged away; a sustained level is not
+    assert feed(engine, "cpu_percent", [10, 10, 100, 10, 10]) == [[]] * 5
+    engine = AlertEngine([spec])
+    statuses = feed(engine, "cpu_percent", [10] * 5 + [90] * 6)
+    # At t=90 the mean is exactly 50; at t=100 the t=0 reading has left the window
+    assert statuses == [[]] * 10 + [["firing"]]
+    # Readings older than the window are forgotten
+    events = engine.evaluate(sample(1000, cpu_percent=10))
+    assert [(event["status"], event["value"]) for event in events] == [("resolved", 10.0)]
+
+
+def test_rate_mode():
+    engine = AlertEngine([{"id": "net", "field": "rx", "mode": "rate", "threshold": 100, "clear": 50}])
+    assert engine.evaluate(sample(0, rx=0)) == []  # no rate from a single reading
+    assert engine.evaluate(sample(10, rx=500)) == []  # 50/s
+    assert engine.evaluate(sample(20, rx=3000))[0]["value"] == 250
+    assert engine.evaluate(sample(30, rx=4000)) == []  # 100/s, still above clear
+    assert engine.evaluate(sample(40, rx=100)) == []  # counter reset: no reading
+    assert engine.evaluate(sample(50, rx=300))[0]["status"] == "resolved"  # 20/s
+
+
+def test_rate_mode_ignores_out_of_order_samples():
+    engine = AlertEngine([{"id": "net", "field": "rx", "mode": "rate", "threshold": 100}])
+    engine.evaluate(sample(0, rx=0))
+    engine.evaluate(sample(100, rx=1000))
+    # A sample replayed from an agent spool, then the next live one
+    assert engine.evaluate(sample(50, rx=500)) == []
+    assert engine.evaluate(sample(110, rx=1100)) == []  # 10/s since t=100, not 600/60
+    assert engine.evaluate(sample(100, rx=1000)) == []  # same time twice
+    assert engine.evaluate(sample(120, rx=3100))[0]["value"] == 200
+
+
+def test_invalid_rules_answer_422(server):
+    client = TestClient(server.app)
+    before = client.get("/api/alerts/rules").json()
+    for rule in ({"mode": "avg", "window": 0}, {"clear": None}, {"clear": 95}):
+        response = client.put("/api/alerts/rules", json={"rules": [
+            {"id": "cpu", "field": "cpu_percent", "threshold": 90, **rule}]})
+        assert response.status_code == 422
+    assert client.put("/api/alerts/rules", json={"rules": 5}).status_code == 422
+    assert client.get("/api/alerts/rules").json() == before
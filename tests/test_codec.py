@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from codec import CodecError, decode_block, encode_block
+
+rng = np.random.default_rng(0)
+ROWS = 240
+TS = 1_700_000_000_000 + np.arange(ROWS, dtype=np.int64) * 5000
+
+
+def same(a, b):
+    """Bit-for-bit equal, NaN (missing) only where NaN"""
+    a, b = np.asarray(a), np.asarray(b)
+    missing = np.isnan(a)
+    return (a.shape == b.shape and np.array_equal(missing, np.isnan(b))
+            and np.array_equal(a[~missing].view(np.uint64), b[~missing].view(np.uint64)))
+
+
+def roundtrip(ts, columns):
+    decoded_ts, decoded = decode_block(encode_block(ts, columns))
+    assert np.array_equal(decoded_ts, ts)
+    assert same(decoded, columns)
+    return decoded
+
+
+def with_gaps(column, share=0.1):
+    column = column.copy()
+    column[rng.random(len(column)) < share] = np.nan
+    return column
+
+
+COLUMNS = {
+    "decimals": np.round(rng.uniform(0, 100, ROWS), 1),
+    "counter": np.cumsum(rng.integers(0, 10_000, ROWS)).astype(np.float64),
+    "floats": rng.normal(size=ROWS),
+    "constant": np.full(ROWS, 42.5),
+    "zeros": np.zeros(ROWS),
+    "negative_zeros": np.full(ROWS, -0.0),
+    "mixed_zeros": np.where(np.arange(ROWS) % 3, 0.0, -0.0),
+    "infinities": np.where(np.arange(ROWS) % 2, np.inf, -np.inf),
+    "some_inf": np.where(np.arange(ROWS) == 7, np.inf, np.round(rng.uniform(0, 1, ROWS), 2)),
+    "all_missing": np.full(ROWS, np.nan),
+    "leading_gap": np.concatenate((np.full(10, np.nan), np.full(ROWS - 10, 3.0))),
+    "trailing_gap": np.concatenate((rng.normal(size=ROWS - 10), np.full(10, np.nan))),
+    "tiny": np.full(ROWS, 5e-324),
+}
+
+
+@pytest.mark.parametrize("name", sorted(COLUMNS))
+def test_column_roundtrip(name):
+    roundtrip(TS, COLUMNS[name][:, None])
+    roundtrip(TS, with_gaps(COLUMNS[name])[:, None])
+
+
+def test_block_with_every_column():
+    columns = np.column_stack([COLUMNS[name] for name in sorted(COLUMNS)])
+    roundtrip(TS, columns)
+
+
+@pytest.mark.parametrize("rows", [0, 1, 2, 3])
+def test_short_blocks(rows):
+    roundtrip(TS[:rows], np.column_stack([COLUMNS["floats"], COLUMNS["mixed_zeros"]])[:rows])
+
+
+def test_irregular_timestamps():
+    ts = np.sort(TS + rng.integers(-2000, 2000, ROWS))
+    roundtrip(ts, COLUMNS["decimals"][:, None])
+
+
+def test_column_selection():
+    columns = np.column_stack([COLUMNS[name] for name in sorted(COLUMNS)])
+    block = encode_block(TS, columns)
+    ts, picked = decode_block(block, [5, 0])
+    assert np.array_equal(ts, TS)
+    assert same(picked, columns[:, [5, 0]])
+    with pytest.raises(CodecError):
+        decode_block(block, [len(COLUMNS)])
+
+
+def test_rejects_foreign_blocks():
+    with pytest.raises(CodecError):
+        decode_block(b"\0" * 32)
@@ -0,0 +1,91 @@
+import pytest
+
+from ingest import DeltaDecoder
+
+
+def samples(count, host="vps-1"):
+    for i in range(count):
+        yield {
+            "hostname": host, "timestamp": f"2026-01-01T00:00:{i:02d}", "cpu_percent": float(i % 4),
+            "ram_percent": 40.0, "network_in_bytes": 1000 * i * i, "network_out_bytes": 500 * i,
+        }
+
+
+@pytest.fixture
+def encoder(agent):
+    return agent.DeltaEncoder(keyframe_interval=5)
+
+
+def test_rebuilds_the_agent_samples(encoder):
+    decoder = DeltaDecoder()
+    for sample in samples(12):
+        assert decoder.decode(encoder.encode(sample)) == sample
+
+
+def test_gap_forces_a_resync(encoder):
+    decoder = DeltaDecoder()
+    frames = [encoder.encode(sample) for sample in samples(4)]
+    assert decoder.decode(frames[0]) is not None
+    assert decoder.decode(frames[1]) is not None
+    # frames[2] is lost: the next delta does not follow the known state
+    assert decoder.decode(frames[3]) is None
+    assert decoder.export("vps-1") is None
+    # ...and neither does any later one, until the agent sends a keyframe
+    assert decoder.decode(encoder.encode(next(samples(5)))) is None
+    encoder.force_keyframe()
+    sample = list(samples(6))[5]
+    frame = encoder.encode(sample)
+    assert frame["keyframe"]
+    assert decoder.decode(frame) == sample
+
+
+def test_agent_restart_forces_a_resync(agent):
+    decoder = DeltaDecoder()
+    first = agent.DeltaEncoder()
+    for sample in samples(3):
+        decoder.decode(first.encode(sample))
+    # A restarted agent numbers from 1 again; a delta at seq 2 cannot follow seq 3
+    restarted = agent.DeltaEncoder()
+    restarted.encode(next(samples(1)))
+    assert decoder.decode(restarted.encode(list(samples(2))[1])) is None
+
+
+def test_unknown_host_delta_is_rejected():
+    assert DeltaDecoder().decode({"hostname": "new", "seq": 7, "delta": True, "cpu_percent": 3}) is None
+
+
+def test_plain_samples_pass_through():
+    sample = {"hostname": "vps-1", "cpu_percent": 5}
+    assert DeltaDecoder().decode(sample) == sample
+
+
+def test_snapshot_lists_are_not_carried_over():
+    decoder = DeltaDecoder()
+    decoder.decode({"hostname": "h", "seq": 1, "keyframe": True, "cpu_percent": 1,
+                    "processes": [{"pid": 1}], "inventory": {"apps": {"base": "x"}}})
+    sample = decoder.decode({"hostname": "h", "seq": 2, "delta": True, "cpu_percent": 2})
+    assert sample == {"hostname": "h", "cpu_percent": 2}
+
+
+def test_export_restore_hands_a_host_to_another_worker(encoder):
+    first, second = DeltaDecoder(), DeltaDecoder()
+    stream = list(samples(4))
+    for sample in stream[:3]:
+        first.decode(encoder.encode(sample))
+    second.restore("vps-1", *first.export("vps-1"))
+    assert second.decode(encoder.encode(stream[3])) == stream[3]
+
+
+def test_rollback_lets_a_rejected_push_be_decoded_again(encoder):
+    decoder = DeltaDecoder()
+    stream = list(samples(4))
+    decoder.decode(encoder.encode(stream[0]))
+    retried = [encoder.encode(sample) for sample in stream[1:3]]
+    checkpoint = decoder.checkpoint(["vps-1", "new"])
+    for frame in retried:
+        decoder.decode(frame)
+    decoder.decode({"hostname": "new", "seq": 1, "keyframe": True})
+    decoder.rollback(checkpoint)  # the push was not accepted
+    assert decoder.export("new") is None
+    assert [decoder.decode(frame) for frame in retried] == stream[1:3]
+    assert decoder.decode(encoder.encode(stream[3])) == stream[3]
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+from fleet import HostRegistry
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def sample(seconds, **fields):
+    return {"hostname": "vps-1", "timestamp": T0 + timedelta(seconds=seconds), "cpu_percent": float(seconds), **fields}
+
+
+def test_latest_sample_wins():
+    fleet = HostRegistry()
+    assert fleet.observe(sample(10))
+    assert not fleet.observe(sample(5))
+    assert fleet.observe(sample(10))  # same time: a resent sample replaces it
+    state = fleet.get("vps-1")
+    assert state.sample["cpu_percent"] == 10.0
+    assert state.sampled_at == T0 + timedelta(seconds=10)
+
+
+def test_backfilled_samples_do_not_replace_newer_snapshots():
+    fleet = HostRegistry()
+    fleet.observe(sample(60, processes=[{"pid": 2}], info={"os": "Ubuntu 24.04", "kernel": "6.8"}))
+    fleet.observe(sample(0, processes=[{"pid": 1}], info={"os": "Ubuntu 22.04", "provider": "OVH"}))
+    state = fleet.get("vps-1")
+    assert state.processes == [{"pid": 2}]
+    assert state.info == {"hostname": "vps-1", "os": "Ubuntu 24.04", "kernel": "6.8"}
+
+
+def test_snapshots_follow_their_own_time():
+    fleet = HostRegistry()
+    fleet.observe(sample(0, processes=[{"pid": 1}], info={"os": "Ubuntu 22.04"}))
+    fleet.observe(sample(60))  # no lists: sent only when refreshed
+    # Older than the latest sample, but newer than the stored lists
+    assert not fleet.observe(sample(30, processes=[{"pid": 2}], info={"os": "Ubuntu 24.04"}))
+    state = fleet.get("vps-1")
+    assert state.processes == [{"pid": 2}]
+    assert state.info["os"] == "Ubuntu 24.04"
+    assert state.sample["cpu_percent"] == 60.0
+
+
+def test_unknown_fields_stay_out_of_the_description():
+    fleet = HostRegistry()
+    fleet.observe(sample(0, info={"os": "Debian 12", "uptime_seconds": 5}))
+    assert fleet.get("vps-1").info == {"hostname": "vps-1", "os": "Debian 12"}
+
+
+def test_unsupported_inventories_are_not_awaited():
+    fleet = HostRegistry()
+    fleet.observe(sample(0, info={"os": "Rocky Linux 9"}))
+    state = fleet.get("vps-1")
+    state.services = object()  # set by the server from its InventoryStore
+    assert state.needs_inventory
+    fleet.observe(sample(10, unsupported=["apps", "bogus"]))
+    assert state.unsupported == {"apps"} and not state.needs_inventory
+    assert "unsupported" not in state.sample
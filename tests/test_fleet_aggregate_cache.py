@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+URL = "/api/fleet/aggregate?field=cpu_percent"
+
+
+@pytest.fixture
+def aggregates(server, monkeypatch):
+    """Counts the aggregations actually run; storage writes are no-ops"""
+    calls = []
+
+    async def aggregate(groups, field, since, until, res):
+        calls.append(field)
+        return {}
+
+    async def write(batch):
+        pass
+
+    monkeypatch.setattr(server.fleet_aggregator, "aggregate", aggregate)
+    monkeypatch.setattr(server.metrics_store, "write", write)
+    monkeypatch.setattr(server.process_store, "write", write)
+    monkeypatch.setitem(server.flushed_bucket, "start", 0)
+    server.response_cache.clear()
+    return calls
+
+
+def flush(server, *times):
+    batch = [{"hostname": "vps-1", "timestamp": datetime(2026, 1, 1, 12, *t, tzinfo=timezone.utc)} for t in times]
+    asyncio.run(server.store_samples(batch))
+
+
+def test_cached_aggregate_is_dropped_when_a_flush_opens_a_rollup_bucket(server, aggregates):
+    client = TestClient(server.app)
+    flush(server, (0, 5))
+    first = client.get(URL)
+    assert first.status_code == 200
+    assert client.get(URL).json() == first.json()
+    assert len(aggregates) == 1
+
+    flush(server, (0, 10), (0, 15))  # same minute: the ttl bounds staleness
+    flush(server, (0, 1))  # a late sample
+    asyncio.run(server.store_samples([]))
+    client.get(URL)
+    assert len(aggregates) == 1
+
+    flush(server, (0, 55), (1, 0))
+    client.get(URL)
+    client.get(URL)
+    assert len(aggregates) == 2
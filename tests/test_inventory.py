@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from inventory import Inventory, InventoryStore, inventory_hash
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+SERVICES = [{"name": "nginx.service", "state": "running"}, {"name": "cron.service", "state": "running"}]
+APPS = [{"name": "curl", "version": "8.5"}, {"name": "libc6", "version": "2.39"}]
+
+
+def sample(seconds, **fields):
+    return {"hostname": "vps-1", "timestamp": T0 + timedelta(seconds=seconds), **fields}
+
+
+@pytest.fixture
+def store():
+    return InventoryStore(collection=None)  # apply() never touches the database
+
+
+def test_full_lists_then_diffs(agent, store):
+    tracker = agent.InventoryTracker()
+    changed, in_sync = store.apply(sample(0, services=tracker.update(SERVICES), apps=APPS))
+    assert in_sync and {inventory.kind for inventory in changed} == {"services", "apps"}
+    assert store.cached("vps-1", "services").version == int(T0.timestamp() * 1000)
+
+    services = [{"name": "nginx.service", "state": "failed"}, {"name": "sshd.service", "state": "running"}]
+    diff = tracker.update(services)
+    assert diff["removed"] == ["cron.service"]
+    changed, in_sync = store.apply(sample(10, inventory={"services": diff}))
+    assert in_sync and [inventory.kind for inventory in changed] == ["services"]
+    current = store.cached("vps-1", "services")
+    assert current.hash == inventory_hash(services)
+    assert current.items == {item["name"]: item for item in services}
+    assert current.version == int(T0.timestamp() * 1000) + 10_000
+
+
+def test_unchanged_full_list_is_not_a_change(store):
+    store.apply(sample(0, services=SERVICES))
+    version = store.cached("vps-1", "services").version
+    assert store.apply(sample(10, services=list(reversed(SERVICES)))) == ([], True)
+    assert store.cached("vps-1", "services").version == version
+
+
+def test_versions_never_go_back(store):
+    store.apply(sample(60, services=SERVICES))
+    store.apply(sample(0, services=SERVICES[:1]))  # an older sample, replayed from an agent spool
+    assert store.cached("vps-1", "services").version == int(T0.timestamp() * 1000) + 60_001
+
+
+@pytest.mark.parametrize("diff", [
+    {"base": "0" * 16, "hash": inventory_hash(SERVICES[:1]), "removed": ["cron.service"]},  # unknown base
+    {"base": inventory_hash(SERVICES), "hash": "0" * 16, "removed": ["cron.service"]},  # result differs
+])
+def test_mismatched_diff_drops_the_inventory(store, diff):
+    store.apply(sample(0, services=SERVICES, apps=APPS))
+    changed, in_sync = store.apply(sample(10, inventory={"services": diff}))
+    assert (changed, in_sync) == ([], False)
+    assert store.cached("vps-1", "services") is None
+    assert store.cached("vps-1", "apps") is not None
+    assert store.stats["drifts"] == 1
+    # Later diffs cannot apply either, until the next full list
+    assert store.apply(sample(20, inventory={"services": {"base": diff["hash"], "hash": diff["hash"]}}))[1] is False
+    assert store.apply(sample(30, services=SERVICES)) == ([store.cached("vps-1", "services")], True)
+
+
+def test_diff_without_a_known_inventory(store):
+    diff = {"base": inventory_hash(SERVICES), "hash": inventory_hash(SERVICES), "added": []}
+    assert store.apply(sample(0, inventory={"services": diff})) == ([], False)
+
+
+def test_pages():
+    names = ["Apache2", "apt", "bash", "curl", "libc6", "libssl3", "LibXML2", "zlib1g"]
+    inventory = Inventory.from_list("vps-1", "apps", [{"name": name} for name in names])
+    assert inventory.page()["total"] == len(names)
+    page = inventory.page(prefix="lib", limit=2)
+    assert [item["name"] for item in page["items"]] == ["libc6", "libssl3"]
+    assert page["total"] == 3 and page["next"] == "libssl3"
+    page = inventory.page(prefix="LIB", after=page["next"], limit=2)
+    assert [item["name"] for item in page["items"]] == ["LibXML2"]
+    assert page["next"] is None
+    seen, after = [], None
+    while True:
+        page = inventory.page(after=after, limit=3)
+        seen += [item["name"] for item in page["items"]]
+        if page["next"] is None:
+            break
+        after = page["next"]
+    assert seen == sorted(names, key=str.lower)
+
+
+def test_push_ack_asks_for_drifted_inventories(agent, server):
+    client = TestClient(server.app)
+    tracker = agent.InventoryTracker()
+
+    def push(seconds, **fields):
+        timestamp = (T0 + timedelta(seconds=seconds)).isoformat()
+        frame = {"hostname": "vps-inventory", "timestamp": timestamp, "cpu_percent": 1.0, **fields}
+        response = client.post("/api/metrics/push", json={"samples": [frame]})
+        assert response.status_code == 200
+        return response.json()
+
+    assert push(0)["resend_inventory"] == ["vps-inventory"]
+    ack = push(10, info={"os": "Ubuntu 24.04"}, services=tracker.update(SERVICES), apps=APPS)
+    assert "resend_inventory" not in ack
+    assert "resend_inventory" not in push(20, inventory={"services": tracker.update(SERVICES[:1])})
+
+    # A diff the server never saw the base of (e.g. a push lost in between)
+    tracker.update(SERVICES)
+    skipped = tracker.update(SERVICES[1:])
+    assert skipped["base"] != server.inventories.cached("vps-inventory", "services").hash
+    assert push(30, inventory={"services": skipped})["resend_inventory"] == ["vps-inventory"]
+
+    tracker.reset()
+    assert "resend_inventory" not in push(40, services=tracker.update(SERVICES[1:]))
+
+
+def test_hosts_without_a_package_manager_are_not_asked_again(server):
+    client = TestClient(server.app)
+    frame = {"hostname": "vps-rhel", "timestamp": T0.isoformat(), "info": {"os": "Rocky Linux 9"}, "services": SERVICES}
+    assert client.post("/api/metrics/push", json=frame).json()["resend_inventory"] == ["vps-rhel"]
+    frame = {"hostname": "vps-rhel", "timestamp": (T0 + timedelta(seconds=10)).isoformat(), "unsupported": ["apps"]}
+    assert "resend_inventory" not in client.post("/api/metrics/push", json=frame).json()
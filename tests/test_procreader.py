@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+
+import pytest
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="ProcReader reads /proc")
+
+
+@pytest.fixture
+def reader(agent):
+    reader = agent.ProcReader(top=100_000)
+    yield reader
+    reader.close()
+
+
+def test_cpu_matches_psutil(agent, reader):
+    agent.psutil.cpu_percent(interval=None)
+    reader.get_cpu_metrics()
+    time.sleep(0.5)
+    expected, actual = agent.get_cpu_metrics(), reader.get_cpu_metrics()
+    assert actual["cpu_cores"] == expected["cpu_cores"]
+    # Same interval, read back to back: only the ticks between the two reads differ
+    assert actual["cpu_percent"] == pytest.approx(expected["cpu_percent"], abs=3.0)
+    # /proc/loadavg has two decimals, os.getloadavg() does not
+    assert actual["load_average"] == pytest.approx(expected["load_average"], abs=0.01)
+
+
+def test_memory_and_disk_match_psutil(agent, reader):
+    memory = agent.get_memory_metrics()
+    assert reader.get_memory_metrics() == pytest.approx(memory, abs=0.01)
+    assert reader.get_disk_metrics() == agent.get_disk_metrics()
+
+
+def test_system_info_matches_psutil(agent, reader):
+    expected, actual = agent.get_system_info(), reader.get_system_info()
+    assert actual["hostname"] == expected["hostname"]
+    assert actual["uptime_seconds"] == pytest.approx(expected["uptime_seconds"], abs=1)
+    assert actual["processes_count"] == pytest.approx(expected["processes_count"], abs=2)
+
+
+def identities(agent):
+    return {process.pid: (process.info["create_time"], process.info["name"])
+            for process in agent.psutil.process_iter(["create_time", "name"])}
+
+
+def test_processes_match_psutil(agent, reader):
+    before = identities(agent)
+    sampler = agent.ProcessSampler(top=100_000)
+    expected = {process["pid"]: process for process in sampler.sample()}
+    actual = {process["pid"]: process for process in reader.get_processes()}
+    after = identities(agent)
+    # Only compare processes alive and unchanged across the scans: kworker threads, for one, rename themselves
+    stable = {pid for pid, identity in before.items() if after.get(pid) == identity}
+    assert os.getpid() in stable and os.getpid() in actual
+    assert len(stable - set(expected)) <= 2 and len(stable - set(actual)) <= 2
+    for pid in stable & set(expected) & set(actual):
+        for field in ("name", "user", "cmdline_hash"):
+            assert actual[pid][field] == expected[pid][field], (pid, field)
+        assert actual[pid]["memory_percent"] == pytest.approx(expected[pid]["memory_percent"], abs=0.2)
+
+
+def test_long_names_are_not_truncated(agent):
+    comm = b"gunicorn_worker"  # 15 characters: what the kernel keeps of "gunicorn_worker_pool"
+    assert agent.ProcReader._name(comm, b"/opt/bin/gunicorn_worker_pool\0--bind") == "gunicorn_worker_pool"
+    assert agent.ProcReader._name(comm, b"gunicorn_worker_pool app:main") == "gunicorn_worker_pool"
+    assert agent.ProcReader._name(comm, b"/usr/bin/python3\0app.py") == "gunicorn_worker"
+    assert agent.ProcReader._name(b"sshd", b"/usr/sbin/sshd\0-D") == "sshd"
@@ -0,0 +1,95 @@
+import pstats
+import sys
+import threading
+import tracemalloc
+
+import pytest
+
+
+class StopAgent(BaseException):
+    """Raised by the patched sleep to leave the agent's endless loop"""
+
+
+def collect_fast():
+    return {"cpu_percent": sum(range(1000)) / 1e5}
+
+
+def collect_memory():
+    return {"ram_percent": 40.0}
+
+
+def collect_slow():
+    return [{"name": "nginx.service", "state": "running"}]
+
+
+@pytest.fixture
+def profiler_class(agent, tmp_path, monkeypatch):
+    created = []
+
+    class Profiler(agent.AgentProfiler):
+        def __init__(self):
+            super().__init__(directory=str(tmp_path))
+            created.append(self)
+
+    monkeypatch.setattr(agent, "AgentProfiler", Profiler)
+    yield created
+    tracemalloc.stop()
+
+
+def test_profiled_cycles_ship_and_cover_collectors(agent, tmp_path, monkeypatch, profiler_class):
+    shipped = []
+    slow = agent.Collector("services", collect_slow, 60, slow=True, key="services")
+    monkeypatch.setattr(agent, "build_collectors", lambda: [
+        agent.Collector("cpu", collect_fast, 1), agent.Collector("memory", collect_memory, 1), slow,
+    ])
+    spool = agent.RingSpool(str(tmp_path / "spool"), 64 * 1024)
+    monkeypatch.setattr(agent, "RingSpool", lambda: spool)
+    monkeypatch.setattr(agent, "send_metrics", lambda payload: shipped.append(payload) or {"accepted": 1})
+    monkeypatch.setattr(agent.signal, "signal", lambda *args: None)
+    monkeypatch.setattr(sys, "argv", ["vps-monitor-agent", "--profile"])
+    cycles = iter(range(3))
+
+    def sleep(delay):
+        slow.future is None or slow.future.result()  # the slow collector is picked up next cycle
+        if next(cycles) == 2:
+            raise StopAgent
+
+    monkeypatch.setattr(agent.time, "sleep", sleep)
+    with pytest.raises(StopAgent):
+        agent.main()
+
+    assert len(shipped) == 3
+    assert shipped[0]["cpu_percent"] == collect_fast()["cpu_percent"]
+    assert any("services" in frame for frame in shipped)
+
+    profiler, = profiler_class
+    profiler.request()
+    profiler.dump_if_requested()
+    dump, = tmp_path.glob("agent-*.prof")
+    functions = {name for _, _, name in pstats.Stats(str(dump)).stats}
+    # Everything after the first collector too, up to the shipping
+    assert {"collect_fast", "collect_memory", "collect_slow", "ship"} <= functions
+
+
+def test_nested_and_concurrent_runs(agent, profiler_class, monkeypatch, tmp_path):
+    profiler = agent.AgentProfiler()
+    results = []
+
+    def worker():
+        results.append(profiler.run(collect_slow))
+
+    def cycle():
+        thread = threading.Thread(target=worker)
+        thread.start()
+        value = profiler.run(collect_fast)  # nested in the cycle: no second enable()
+        thread.join()
+        return value, collect_memory()
+
+    assert profiler.run(cycle) == (collect_fast(), collect_memory())
+    assert results == [collect_slow()]
+    assert profiler.run(collect_fast) == collect_fast()  # the profile can be turned on again
+    profiler.request()
+    profiler.dump_if_requested()
+    dump, = tmp_path.glob("agent-*.prof")
+    functions = {name for _, _, name in pstats.Stats(str(dump)).stats}
+    assert {"cycle", "collect_fast", "collect_memory", "collect_slow"} <= functions
@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client(server):
+    return TestClient(server.app)
+
+
+def frame(host, **fields):
+    return {"hostname": host, "timestamp": datetime.now(timezone.utc).isoformat(), "cpu_percent": 5.0, **fields}
+
+
+@pytest.mark.parametrize("step", ["observe_samples", "evaluate_alerts", "share_samples"])
+def test_queued_samples_are_acked_when_a_later_step_fails(server, client, monkeypatch, step):
+    def fail(samples, *args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(server, step, fail)
+    depth = server.ingest_buffer.depth
+    response = client.post("/api/metrics/push", json={"samples": [frame("vps-push")]})
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 1
+    assert server.ingest_buffer.depth == depth + 1
+
+
+def assert_rejected(server, client, body):
+    depth = server.ingest_buffer.depth
+    assert client.post("/api/metrics/push", json=body).status_code == 422
+    assert server.ingest_buffer.depth == depth
+
+
+@pytest.mark.parametrize("body", [
+    {"samples": 5},
+    {"samples": None},
+    {"samples": [5]},
+    {"samples": [{"cpu_percent": 5.0}]},
+    {"hostname": ["vps-push"], "cpu_percent": 5.0},
+    {"hostname": "vps-push", "timestamp": 123},
+    {"hostname": "vps-push", "timestamp": [2026, 1, 1]},
+    {"hostname": "vps-push", "timestamp": "yesterday"},
+])
+def test_invalid_pushes_answer_422(server, client, body):
+    assert_rejected(server, client, body)
+
+
+def test_invalid_delta_frame_answers_422(server, client):
+    keyframe = {"hostname": "vps-bad-delta", "seq": 1, "keyframe": True, "network_in_bytes": 0}
+    assert client.post("/api/metrics/push", json=keyframe).status_code == 200
+    assert_rejected(server, client, {"hostname": "vps-bad-delta", "seq": 2, "delta": True, "counters": ["rx"]})
+
+
+def test_invalid_counters_answer_422(server, client):
+    assert client.post("/api/metrics/push", json=frame("vps-bad-counters", network_in_bytes=0)).status_code == 200
+    assert_rejected(server, client, frame("vps-bad-counters", network_in_bytes="many"))
+
+
+def test_timestamps(server):
+    assert server.parse_timestamp("2026-01-01T00:00:00") == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert server.parse_timestamp("2026-01-01T02:00:00+02:00") == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert server.parse_timestamp(datetime(2026, 1, 1)) == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert server.parse_timestamp(None).tzinfo is not None
+    with pytest.raises(TypeError):
+        server.parse_timestamp(1767225600)
+
+
+def test_throttled_push_can_be_sent_again(agent, server, client, monkeypatch):
+    encoder = agent.DeltaEncoder()
+    stream = [frame("vps-throttled", network_in_bytes=1000 * i) for i in range(3)]
+    assert client.post("/api/metrics/push", json=encoder.encode(stream[0])).status_code == 200
+    retried = {"samples": [encoder.encode(sample) for sample in stream[1:]]}
+    with monkeypatch.context() as patch:
+        def full(samples):
+            raise server.IngestQueueFull("ingest buffer full")
+
+        patch.setattr(server.ingest_buffer, "put_many", full)
+        response = client.post("/api/metrics/push", json=retried)
+        assert response.status_code == 503
+    ack = client.post("/api/metrics/push", json=retried).json()
+    assert ack["accepted"] == 2 and "resync" not in ack
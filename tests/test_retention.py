@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import retention
+from retention import EXPIRE_SLICE, Policy, RetentionScheduler, parse_retention
+from tsstore import TimeSeriesStore
+
+NOW = 1_800_000_000.0
+DAY = 86400
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    async def average_size(collection):
+        return 100.0  # collStats is not implemented by mongomock
+
+    monkeypatch.setattr(RetentionScheduler, "_average_size", staticmethod(average_size))
+    return AsyncMongoMockClient()["vps_monitor_test"]
+
+
+def test_parse_retention():
+    assert parse_retention("48h") == 2 * DAY
+    assert parse_retention(" 1.5d ") == 1.5 * DAY
+    assert parse_retention("1y") == 365 * DAY
+    for value in ("", "10", "3 months", "-1d"):
+        with pytest.raises(ValueError):
+            parse_retention(value)
+
+
+def test_average_size_comes_from_coll_stats():
+    class Database:
+        async def command(self, name, collection):
+            assert (name, collection) == ("collStats", "metrics_rollups")
+            return {"count": 10, "avgObjSize": 812.5}
+
+    class Collection:
+        name, database = "metrics_rollups", Database()
+
+    assert run(retention.RetentionScheduler._average_size(Collection())) == 812.5
+
+
+def test_lease_lets_a_single_worker_run(db):
+    first = RetentionScheduler([], {}, leases=db.leases, owner="a", interval=3600)
+    second = RetentionScheduler([], {}, leases=db.leases, owner="b", interval=3600)
+    run(first.run_once(NOW))
+    run(second.run_once(NOW + 10))
+    assert (first.stats["runs"], second.stats["skipped"]) == (1, 1)
+    run(first.run_once(NOW + 3600))  # the holder renews its own lease
+    run(second.run_once(NOW + 3601))
+    assert (first.stats["runs"], second.stats["skipped"]) == (2, 2)
+    run(second.run_once(NOW + 7201))  # expired: another worker takes over
+    assert second.stats["runs"] == 1
+    run(first.run_once(NOW + 7202))
+    assert first.stats["skipped"] == 1
+
+
+def test_expiry_deletes_old_buckets_by_slice(db):
+    starts = [int(NOW) - days * DAY for days in (30, 20, 15, 3, 2, 1)]
+    rollups = db.rollups
+    run(rollups.insert_many([{"_id": f"h|{res}|{start}", "host": "h", "res": res, "start": start}
+                             for res in (60, 300) for start in starts]))
+    scheduler = RetentionScheduler([Policy("1m", rollups, 7 * DAY, {"res": 60})], {})
+    deletes = []
+    delete_many = rollups.delete_many
+
+    async def counting_delete(query):
+        deletes.append(query)
+        return await delete_many(query)
+
+    rollups.delete_many = counting_delete
+    run(scheduler.run_once(NOW))
+    remaining = run(rollups.find({}, projection={"res": 1, "start": 1}).to_list(None))
+    assert sorted(doc["start"] for doc in remaining if doc["res"] == 60) == sorted(starts[3:])
+    assert len([doc for doc in remaining if doc["res"] == 300]) == len(starts)  # other policies' buckets
+    assert scheduler.deleted["1m"] == 3
+    assert scheduler.reclaimed[("1m", "expire")] == 300
+    # Ranges of at most EXPIRE_SLICE, starting at the oldest bucket: never one delete per document
+    assert len(deletes) == 3
+    assert all(query["start"]["$lt"] <= start + EXPIRE_SLICE for query, start in zip(deletes, starts))
+    run(scheduler.run_once(NOW + 60))
+    assert len(deletes) == 3
+
+
+def test_compaction_skips_open_and_expiring_buckets(db, monkeypatch):
+    monkeypatch.setattr(retention, "BUSY_BACKOFF", 0.001)
+    store = TimeSeriesStore(db)
+    now = datetime.fromtimestamp(NOW, timezone.utc).replace(minute=30)
+    hours = (60, 50, 10, 3, 1)  # hours ago
+    run(store.write([{"hostname": "h", "timestamp": now - timedelta(hours=h, seconds=20 * i), "cpu_percent": float(i)}
+                     for h in hours for i in range(60)]))
+    busy = iter([True, True, False] + [False] * 10)
+    scheduler = RetentionScheduler([Policy("raw", store.raw, 48 * 3600)], {"raw": store},
+                                   compact_rate=1000, closed_after=2 * 3600, busy=lambda: next(busy))
+    run(scheduler.run_once(now.timestamp()))
+    docs = {int(now.timestamp() - doc["start"]) // 3600: doc for doc in run(store.raw.find().to_list(None))}
+    assert sorted(docs) == [1, 3, 10]  # 60 and 50 hours ago: expired
+    assert "block" in docs[10] and "block" in docs[3]
+    assert "ts" in docs[1]  # still open
+    assert scheduler.compacted["raw"] == 2 and scheduler.reclaimed[("raw", "compact")] > 0
+    assert scheduler.stats["paused_seconds"] == pytest.approx(2 * retention.BUSY_BACKOFF)
@@ -0,0 +1,66 @@
+import random
+
+
+def counting(agent, name, interval):
+    runs = []
+    collector = agent.Collector(name, lambda: runs.append(1) or {name: len(runs)}, interval)
+    return collector, runs
+
+
+def ticks(start, interval, count):
+    """Deadlines as the agent's main loop computes them: next_tick += interval"""
+    tick = start
+    for _ in range(count):
+        yield tick
+        tick += interval
+
+
+def test_every_tick_runs_fast_collectors(agent):
+    fast, fast_runs = counting(agent, "fast", 0.2)
+    slow, slow_runs = counting(agent, "slow", 1.0)
+    scheduler = agent.CollectorScheduler([fast, slow], workers=1)
+    fast_runs.clear()  # the constructor primes keyless collectors once
+    slow_runs.clear()
+    for tick in ticks(12345.678, 0.2, 40):
+        scheduler.collect(tick)
+    assert len(fast_runs) == 40
+    assert len(slow_runs) == 8
+
+
+def test_wake_up_jitter_does_not_skip_cycles(agent, monkeypatch):
+    rng = random.Random(0)
+    fast, runs = counting(agent, "fast", 0.2)
+    scheduler = agent.CollectorScheduler([fast], workers=1)
+    runs.clear()
+    # The loop wakes up a few ms after each deadline, sometimes earlier than the time before
+    woken = iter([tick + rng.uniform(0, 0.005) for tick in ticks(100.0, 0.2, 40)])
+    monkeypatch.setattr(agent.time, "monotonic", lambda: next(woken))
+    for tick in ticks(100.0, 0.2, 40):
+        agent.time.monotonic()
+        scheduler.collect(tick)
+    assert len(runs) == 40
+
+
+def test_late_cycle_runs_once_then_resumes(agent):
+    slow, runs = counting(agent, "slow", 1.0)
+    scheduler = agent.CollectorScheduler([slow], workers=1)
+    runs.clear()
+    scheduler.collect(10.0)
+    scheduler.collect(10.2)  # not due yet
+    scheduler.collect(15.0)  # four deadlines missed: one run, not a burst
+    scheduler.collect(15.2)
+    scheduler.collect(16.0)
+    assert len(runs) == 3
+
+
+def test_missing_inventory_command_is_reported(agent):
+    missing = agent.CachedCommand(["vps-monitor-no-such-command"], agent.parse_installed_apps)
+    apps = agent.Collector("apps", missing, slow=True, key="apps", trigger=lambda: None)
+    scheduler = agent.CollectorScheduler([apps], workers=1)
+    scheduler.collect(0.0)
+    apps.future.exception()  # wait for the pool
+    assert scheduler.collect(0.2)["unsupported"] == ["apps"]
+    assert "unsupported" not in scheduler.collect(0.4)
+    # Reported again with the rest of the inventory when the server asks for it
+    scheduler.resend_snapshots()
+    assert scheduler.collect(0.6)["unsupported"] == ["apps"]
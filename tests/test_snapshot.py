@@ -0,0 +1,71 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from shared import SharedPreferences
+
+DEFAULTS = [{"id": "cpu", "name": "CPU", "enabled": True}, {"id": "disk", "name": "Disk", "enabled": True}]
+
+
+class CountingCollection:
+    def __init__(self, collection):
+        self.collection = collection
+        self.reads = 0
+
+    async def find_one(self, *args, **kwargs):
+        self.reads += 1
+        return await self.collection.find_one(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_preferences_are_read_once_until_invalidated():
+    async def scenario():
+        collection = CountingCollection(AsyncMongoMockClient()["test"]["preferences"])
+        prefs = SharedPreferences(collection, DEFAULTS)
+        for _ in range(3):
+            assert all(pref["enabled"] for pref in await prefs.get())
+        assert collection.reads == 1
+
+        await collection.update_one({"_id": "dashboard"}, {"$set": {"enabled.disk": False}}, upsert=True)
+        assert all(pref["enabled"] for pref in await prefs.get())
+        prefs.invalidate()
+        assert {pref["id"]: pref["enabled"] for pref in await prefs.get()} == {"cpu": True, "disk": False}
+        assert collection.reads == 2
+
+    asyncio.run(scenario())
+
+
+def test_preference_updates_refresh_the_copy():
+    async def scenario():
+        collection = CountingCollection(AsyncMongoMockClient()["test"]["preferences"])
+        prefs = SharedPreferences(collection, DEFAULTS)
+        await prefs.update({"cpu": False})
+        assert {pref["id"]: pref["enabled"] for pref in await prefs.get()} == {"cpu": False, "disk": True}
+        assert collection.reads == 0
+
+    asyncio.run(scenario())
+
+
+def test_preferences_expire_after_ttl():
+    async def scenario():
+        collection = CountingCollection(AsyncMongoMockClient()["test"]["preferences"])
+        prefs = SharedPreferences(collection, DEFAULTS, ttl=0)
+        await prefs.get()
+        await prefs.get()
+        assert collection.reads == 2
+
+    asyncio.run(scenario())
+
+
+def test_inventory_pages_of_unknown_hosts_skip_mongo(server, monkeypatch):
+    async def fail(*args, **kwargs):
+        raise AssertionError("inventory read from MongoDB")
+
+    monkeypatch.setattr(server.inventories, "get", fail)
+    page = asyncio.run(server.inventory_page("no-such-host", "apps", "", None, 10))
+    assert page["items"] == [] and page["total"] == 0
+    if server.DEFAULT_HOST not in server.fleet:
+        page = asyncio.run(server.inventory_page(server.DEFAULT_HOST, "apps", "", None, 10))
+        assert page["total"] > 0
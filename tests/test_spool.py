@@ -0,0 +1,82 @@
+import json
+import random
+
+import pytest
+
+
+def record(i, length):
+    """A distinct payload of ``length`` bytes (at least 1)"""
+    return (str(i) + "-" * length)[:length].encode() if length > len(str(i)) else bytes([65 + i % 26]) * length
+
+
+def check_suffix(spool, appended):
+    """The spool holds the newest records, oldest first, with none missing in between"""
+    held = spool.peek(len(spool) + 1)
+    assert len(held) == len(spool)
+    assert held == appended[len(appended) - len(held):]
+
+
+@pytest.fixture
+def make_spool(agent, tmp_path):
+    return lambda size=128: agent.RingSpool(str(tmp_path / "spool.bin"), size)
+
+
+def test_wrap_reported_trace(make_spool):
+    spool = make_spool(128)
+    appended = []
+    for i, length in enumerate([31, 29, 3, 4, 33, 11, 1, 5, 39]):
+        appended.append(record(i, length))
+        assert spool.append(appended[-1])
+        check_suffix(spool, appended)
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_fifo_under_wrap_and_overwrite(make_spool, seed):
+    rng = random.Random(seed)
+    spool = make_spool(rng.choice((128, 200, 256)))
+    appended, consumed = [], 0
+    for i in range(60):
+        if rng.random() < 0.2 and len(spool):
+            n = rng.randint(1, len(spool))
+            held = spool.peek(n)
+            spool.consume(n)
+            consumed = appended.index(held[-1]) + 1
+        else:
+            data = record(i, rng.randint(1, 40))
+            assert spool.append(data)
+            appended.append(data)
+        check_suffix(spool, appended)
+        assert len(spool) <= len(appended) - consumed
+
+
+def test_oversized_record_is_refused(make_spool):
+    spool = make_spool(64)
+    assert not spool.append(b"x" * 64)
+    assert len(spool) == 0
+
+
+def test_survives_reopen(make_spool):
+    spool = make_spool(256)
+    appended = [json.dumps({"i": i, "pad": "x" * (i % 17)}).encode() for i in range(40)]
+    for data in appended:
+        spool.append(data)
+    spool.consume(2)
+    spool.map.flush()
+    reopened = make_spool(256)
+    assert (reopened.head, reopened.tail, reopened.count, reopened.wrap) == (spool.head, spool.tail, spool.count, spool.wrap)
+    check_suffix(reopened, appended)
+    reopened.append(b"after")
+    assert reopened.peek(len(reopened))[-1] == b"after"
+
+
+def test_replay_drops_unreadable_records(agent, make_spool, monkeypatch):
+    spool = make_spool(256)
+    spool.append(json.dumps({"i": 1}).encode())
+    spool.append(b"\xff\xfe not json")
+    spool.append(json.dumps({"i": 2}).encode())
+    sent = []
+    monkeypatch.setattr(agent, "send_metrics", lambda payload: sent.append(payload) or {})
+    shipper = agent.Shipper(spool=spool)
+    assert shipper._replay()
+    assert sent == [{"samples": [{"i": 1}, {"i": 2}]}]
+    assert len(spool) == 0
@@ -0,0 +1,15 @@
+from fastapi.testclient import TestClient
+
+
+def test_unknown_hosts_are_not_streamed(server):
+    response = TestClient(server.app).get("/api/metrics/stream?host=no-such-host")
+    assert response.status_code == 404
+    assert server.metrics_hub.latest("no-such-host") is None
+
+
+def test_only_the_default_host_is_simulated(server):
+    server.simulate_if_idle("no-such-host")
+    assert server.metrics_hub.latest("no-such-host") is None
+    if server.DEFAULT_HOST not in server.fleet:
+        server.simulate_if_idle(server.DEFAULT_HOST)
+        assert server.metrics_hub.latest(server.DEFAULT_HOST)["cpu_percent"] is not None
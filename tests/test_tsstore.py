@@ -0,0 +1,210 @@
+import asyncio
+import math
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from tsstore import (FIELDS, RAW_WINDOW, ROLLUP_RESOLUTIONS, TimeSeriesStore, pick_resolution, to_columnar, to_packed,
+                     to_samples)
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_samples(count, step=10, host="vps-1", start=T0):
+    rng = np.random.default_rng(7)
+    return [{
+        "hostname": host,
+        "timestamp": start + timedelta(seconds=i * step),
+        "cpu_percent": float(rng.uniform(0, 100)),
+        "ram_percent": 40.0 + i % 7,
+        "network_in_bytes": 1000 * i,
+        "load_average": [1.5, 1.0, 0.5],
+        "agent_stats": {"cpu_percent": 0.4, "rss_mb": 30.0},
+        **({"disk_percent": 70.0} if i % 3 == 0 else {}),  # collected less often than the rest
+    } for i in range(count)]
+
+
+@pytest.fixture
+def store():
+    return TimeSeriesStore(AsyncMongoMockClient()["vps_monitor_test"])
+
+
+def column(samples, field):
+    return np.array([sample.get(field, math.nan) for sample in samples], dtype=float)
+
+
+def test_write_appends_to_hourly_buckets(store):
+    samples = make_samples(500)  # 5000 s: two hours
+    run(store.write(samples[:300]))
+    run(store.write(samples[300:]))
+    docs = run(store.raw.find().sort("start", 1).to_list(None))
+    assert [doc["start"] for doc in docs] == [int(T0.timestamp()), int(T0.timestamp()) + RAW_WINDOW]
+    assert [doc["n"] for doc in docs] == [360, 140]
+    ts = [t for doc in docs for t in doc["ts"]]
+    assert ts == [int(sample["timestamp"].timestamp() * 1000) for sample in samples]
+    first = docs[0]["v"]
+    assert set(first) == set(FIELDS)
+    assert first["cpu_percent"] == [sample["cpu_percent"] for sample in samples[:360]]
+    assert first["load_5"][0] == 1.0 and first["agent_rss_mb"][0] == 30.0
+    assert math.isnan(first["disk_percent"][1])
+
+
+@pytest.mark.parametrize("res", ROLLUP_RESOLUTIONS)
+def test_rollups_match_the_raw_samples(store, res):
+    samples = make_samples(500)
+    for i in range(0, 500, 64):  # several flushes fold into the same rollups
+        run(store.write(samples[i:i + 64]))
+    docs = run(store.rollups.find({"res": res}).sort("start", 1).to_list(None))
+    starts = np.array([int(sample["timestamp"].timestamp()) // res * res for sample in samples])
+    assert [doc["start"] for doc in docs] == sorted(set(starts.tolist()))
+    for field in ("cpu_percent", "ram_percent", "disk_percent", "load_1"):
+        values = column(samples, field) if field != "load_1" else np.full(len(samples), 1.5)
+        for doc in docs:
+            rows = values[(starts == doc["start"]) & ~np.isnan(values)]
+            assert doc["n"][field] == len(rows)
+            assert doc["sum"][field] == pytest.approx(rows.sum())
+            assert doc["min"][field] == rows.min() and doc["max"][field] == rows.max()
+    assert all("network_out_bytes" not in doc["n"] for doc in docs)  # never sent
+
+
+def test_pick_resolution():
+    assert pick_resolution(3600, 60) == 60
+    assert pick_resolution(3600, 10) == 300
+    assert pick_resolution(86400, 24) == 3600
+    assert pick_resolution(3600, 61) == 0
+    assert pick_resolution(600, 1000) == 0
+
+
+def test_history_from_raw_samples(store):
+    samples = make_samples(500)
+    run(store.write(list(reversed(samples))))  # pushes may arrive in any order
+    since, until = T0 + timedelta(seconds=1000), T0 + timedelta(seconds=1990)
+    ts, values = run(store.history("vps-1", since, until, points=1000))
+    expected = samples[100:200]
+    assert ts.tolist() == [int(sample["timestamp"].timestamp() * 1000) for sample in expected]
+    np.testing.assert_array_equal(values[:, FIELDS.index("cpu_percent")], column(expected, "cpu_percent"))
+    rows = to_samples(ts, values)
+    assert rows[0]["load_average"] == [1.5, 1.0, 0.5]
+    assert rows[1]["disk_percent"] is None
+    assert run(store.history("vps-2", since, until, points=1000))[0].size == 0
+
+
+def test_history_from_rollups(store):
+    samples = make_samples(720)  # two hours
+    run(store.write(samples))
+    since, until = T0, T0 + timedelta(hours=2)
+    ts, values = run(store.history("vps-1", since, until, points=24))
+    assert len(ts) == 24 and np.all(np.diff(ts) == 300_000)
+    cpu = column(samples, "cpu_percent").reshape(24, 30).mean(axis=1)
+    np.testing.assert_allclose(values[:, FIELDS.index("cpu_percent")], cpu, atol=0.005)  # rounded to 2 decimals
+    ts, _ = run(store.history("vps-1", since, until, points=100))
+    assert len(ts) == 120  # 1-minute rollups
+
+
+def test_max_points_keeps_the_spikes(store):
+    samples = make_samples(720, step=5)
+    samples[333]["cpu_percent"] = 500.0
+    run(store.write(samples))
+    ts, values = run(store.history("vps-1", T0, T0 + timedelta(hours=1), points=10, max_points=100))
+    assert len(ts) <= 100 and np.all(np.diff(ts) > 0)
+    assert 500.0 in values[:, FIELDS.index("cpu_percent")]
+    ts, values = run(store.history("vps-1", T0, T0 + timedelta(hours=1), points=10, max_points=100,
+                                   method="minmax", field="ram_percent"))
+    ram = values[:, FIELDS.index("ram_percent")]
+    assert ram.min() == 40.0 and ram.max() == 46.0
+
+
+def compact_all(store):
+    async def compact():
+        saved = []
+        async for doc in store.uncompacted(0, 2 ** 40):
+            saved.append(await store.compact(doc))
+        return saved
+
+    return run(compact())
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_history_is_unchanged_by_compaction(store, method):
+    samples = make_samples(900, step=5)
+    run(store.write(samples))
+    since, until = T0 + timedelta(minutes=7), T0 + timedelta(minutes=70)
+    queries = [dict(points=1000), dict(points=1000, max_points=50, method=method, field="cpu_percent")]
+    before = [run(store.history("vps-1", since, until, **query)) for query in queries]
+    saved = compact_all(store)
+    assert len(saved) == 2 and all(size > 0 for size in saved)
+    assert all("block" in doc and "ts" not in doc for doc in run(store.raw.find().to_list(None)))
+    for query, (ts, values) in zip(queries, before):
+        after_ts, after_values = run(store.history("vps-1", since, until, **query))
+        np.testing.assert_array_equal(after_ts, ts)
+        np.testing.assert_array_equal(after_values, values)  # NaN == NaN here
+
+
+def test_samples_pushed_after_compaction_are_merged(store):
+    samples = make_samples(100)
+    run(store.write(samples[:60]))
+    compact_all(store)
+    run(store.write(samples[60:]))
+    ts, values = run(store.history("vps-1", T0, T0 + timedelta(seconds=990), points=1000))
+    assert ts.tolist() == [int(sample["timestamp"].timestamp() * 1000) for sample in samples]
+    np.testing.assert_array_equal(values[:, FIELDS.index("cpu_percent")], column(samples, "cpu_percent"))
+
+
+def test_compaction_loses_to_a_concurrent_push(store):
+    samples = make_samples(10)
+    run(store.write(samples[:5]))
+    doc = run(store.raw.find_one())
+    run(store.write(samples[5:]))
+    assert run(store.compact(doc)) is None
+    assert run(store.raw.find_one())["n"] == 10
+
+
+def test_columnar_and_packed_history_survive_compaction(store):
+    samples = make_samples(400)
+    run(store.write(samples))
+    since, until = T0, T0 + timedelta(seconds=3990)
+
+    def formats():
+        ts, values = run(store.history("vps-1", since, until, points=1000))
+        return to_columnar(ts, values), to_packed(ts, values)
+
+    columnar, packed = formats()
+    compact_all(store)
+    assert formats() == (columnar, packed)
+    assert columnar["constants"]["load_1"] == 1.5 and columnar["constants"]["network_out_bytes"] is None
+    assert columnar["disk_percent"][:4] == [70.0, None, None, 70.0]
+    assert columnar["cpu_percent"] == column(samples, "cpu_percent").tolist()
+
+
+def test_scan_is_unchanged_by_compaction(store):
+    run(store.write(make_samples(400) + make_samples(50, host="vps-2")))
+
+    async def scan():
+        return [(host, ts, columns["cpu_percent"]) async for host, ts, columns
+                in store.scan(None, T0 + timedelta(minutes=5), T0 + timedelta(minutes=65))]
+
+    before = run(scan())
+    assert [host for host, _, _ in before] == ["vps-1", "vps-1", "vps-2"]
+    compact_all(store)
+    assert run(scan()) == before
+
+
+@pytest.mark.parametrize("field", ["cpu_percent", "disk_percent"])
+def test_rollup_stats_match_the_raw_samples(store, field):
+    samples = make_samples(720) + make_samples(300, host="vps-2")
+    run(store.write(samples))
+    stats = run(store.rollup_stats(["vps-1", "vps-2", "vps-3"], field, 300, T0, T0 + timedelta(hours=2)))
+    by_host = {doc["_id"]: doc for doc in stats}
+    assert set(by_host) == {"vps-1", "vps-2"}
+    for host, doc in by_host.items():
+        values = column([sample for sample in samples if sample["hostname"] == host], field)
+        values = values[~np.isnan(values)]
+        assert sum(doc["n"]) == len(values)
+        assert sum(doc["sum"]) == pytest.approx(values.sum())
+        assert (doc["min"], doc["max"]) == (values.min(), values.max())